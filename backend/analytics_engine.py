@@ -0,0 +1,547 @@
+"""Колоночный аналитический движок в памяти.
+
+Хранит копию журнала транзакций в виде столбцов numpy (порядковый номер даты,
+сумма в копейках, индекс категории, код типа) и накопленные суммы по дням для
+каждой категории. Итоги за любой диапазон [start_date, end_date] считаются как
+разность двух строк префиксных сумм - O(число категорий) вместо сканирования БД.
+
+Состояние сохраняется в .npy файлы и при перезапуске открывается через memory map,
+если поколение журнала в БД не изменилось. Изменения транзакций применяются
+инкрементально после коммита; изменения других процессов (воркеров) - пересчетом
+только измененных дней из журнала ledger_changes. Полная перестройка нужна, лишь
+когда диапазон изменений неизвестен (архивация, восстановление, обрезанный журнал).
+"""
+import json
+import os
+import shutil
+import threading
+from datetime import date
+
+try:
+    import numpy as np
+except ImportError:  # движок опционален
+    np = None
+
+import config
+from database import get_read_db, get_ledger_generation, ledger_changes_since, file_lock, on_configure
+
+TYPE_CODES = {'income': 0, 'expense': 1, 'savings_income': 2, 'savings_expense': 3}
+
+# Запас дней в будущее, чтобы новые транзакции не требовали перестройки
+_FUTURE_DAYS = 366
+_ROW_COLUMNS = ('ids', 'dates', 'cents', 'cats')
+
+
+class AnalyticsEngine:
+    def __init__(self):
+        self.generation = None
+        self.saved_generation = None
+        self.base_ordinal = 0
+        self.size = 0
+        self.category_ids = []
+        self.category_index = {}
+        self.category_types = None
+        self.ids = self.dates = self.cents = self.cats = None
+        # cum_*[k, c] - сумма/количество транзакций категории c по дням < base + k
+        self.cum_cents = None
+        self.cum_counts = None
+        self.lock = threading.RLock()
+
+    # --- Построение и сохранение ---
+
+    def rebuild(self):
+        """Построить движок заново по данным БД"""
+        with get_read_db() as conn:
+            generation = get_ledger_generation(conn)
+            categories = conn.execute("SELECT id, type FROM categories ORDER BY id").fetchall()
+            rows = conn.execute('''
+                SELECT id,
+                       CAST(julianday(date) - julianday('0001-01-01') AS INTEGER) + 1,
+                       CAST(ROUND(amount * 100) AS INTEGER),
+                       category_id
+                FROM transactions
+                ORDER BY id
+            ''').fetchall()
+
+        with self.lock:
+            self.category_ids = [row['id'] for row in categories]
+            self.category_index = {category_id: i for i, category_id in enumerate(self.category_ids)}
+            self.category_types = np.array([TYPE_CODES[row['type']] for row in categories], dtype=np.int8)
+
+            data = np.array(rows, dtype=np.int64).reshape(-1, 4)
+            self.size = len(data)
+            capacity = max(1024, self.size * 2)
+            self.ids = np.zeros(capacity, dtype=np.int64)
+            self.dates = np.zeros(capacity, dtype=np.int32)
+            self.cents = np.zeros(capacity, dtype=np.int64)
+            self.cats = np.full(capacity, -1, dtype=np.int32)
+            self.ids[:self.size] = data[:, 0]
+            self.dates[:self.size] = data[:, 1]
+            self.cents[:self.size] = data[:, 2]
+            self.cats[:self.size] = [self.category_index[c] for c in data[:, 3].tolist()]
+
+            today = date.today().toordinal()
+            first = int(self.dates[:self.size].min()) if self.size else today
+            last = int(self.dates[:self.size].max()) if self.size else today
+            self.base_ordinal = min(first, today)
+            days = max(last, today) + _FUTURE_DAYS - self.base_ordinal + 1
+
+            n_categories = len(self.category_ids)
+            flat = (self.dates[:self.size] - self.base_ordinal).astype(np.int64) * n_categories + self.cats[:self.size]
+            daily_cents = np.bincount(flat, weights=self.cents[:self.size], minlength=days * n_categories)
+            daily_counts = np.bincount(flat, minlength=days * n_categories)
+
+            self.cum_cents = np.zeros((days + 1, n_categories), dtype=np.int64)
+            self.cum_counts = np.zeros((days + 1, n_categories), dtype=np.int64)
+            np.cumsum(np.rint(daily_cents).astype(np.int64).reshape(days, n_categories), axis=0,
+                      out=self.cum_cents[1:])
+            np.cumsum(daily_counts.reshape(days, n_categories), axis=0, out=self.cum_counts[1:])
+
+            self.generation = generation
+
+    def save(self, directory: str = None):
+        """Сохранить состояние в новый каталог и переключить на него указатель current"""
+        directory = directory or config.ANALYTICS_ENGINE_DIR
+        with self.lock:
+            if self.generation is None or self.generation == self.saved_generation:
+                return
+            generation = self.generation
+            # Другой воркер уже сохранил снимок не старее нашего
+            try:
+                with open(os.path.join(directory, "current")) as f:
+                    if int(f.read().strip().lstrip("g")) >= generation:
+                        return
+            except (OSError, ValueError):
+                pass
+            target = os.path.join(directory, f"g{self.generation}")
+            tmp = target + ".tmp"
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+
+            for name in _ROW_COLUMNS + ('cum_cents', 'cum_counts', 'category_types'):
+                np.save(os.path.join(tmp, f"{name}.npy"), getattr(self, name))
+            with open(os.path.join(tmp, "meta.json"), "w") as f:
+                json.dump({
+                    'generation': self.generation,
+                    'base_ordinal': self.base_ordinal,
+                    'size': self.size,
+                    'category_ids': self.category_ids
+                }, f)
+
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp, target)
+        pointer = os.path.join(directory, "current")
+        with open(pointer + ".tmp", "w") as f:
+            f.write(os.path.basename(target))
+        os.replace(pointer + ".tmp", pointer)
+
+        self.saved_generation = generation
+
+        # Старые снимки удаляем по возможности (на Windows открытые mmap не удаляются)
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if os.path.isdir(path) and name != os.path.basename(target):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def load(self, directory: str = None):
+        """Открыть сохраненное состояние через memory map; False если снимка нет"""
+        directory = directory or config.ANALYTICS_ENGINE_DIR
+        try:
+            with open(os.path.join(directory, "current")) as f:
+                path = os.path.join(directory, f.read().strip())
+            with open(os.path.join(path, "meta.json")) as f:
+                meta = json.load(f)
+
+            # mmap_mode='c': страницы читаются с диска лениво, изменения остаются в памяти
+            arrays = {
+                name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='c')
+                for name in _ROW_COLUMNS + ('cum_cents', 'cum_counts', 'category_types')
+            }
+        except (OSError, ValueError, KeyError):
+            return False
+
+        n_categories = len(meta['category_ids'])
+        if arrays['cum_cents'].shape[1] != n_categories or len(arrays['ids']) < meta['size']:
+            return False
+
+        with self.lock:
+            for name, array in arrays.items():
+                setattr(self, name, array)
+            self.base_ordinal = meta['base_ordinal']
+            self.size = meta['size']
+            self.category_ids = meta['category_ids']
+            self.category_index = {category_id: i for i, category_id in enumerate(self.category_ids)}
+            self.generation = meta['generation']
+            self.saved_generation = self.generation
+        return True
+
+    # --- Инкрементальные изменения ---
+
+    def _ensure_category(self, category_id: int, category_type: str):
+        index = self.category_index.get(category_id)
+        if index is not None:
+            return index
+
+        # Новая категория - добавляем пустой столбец
+        index = len(self.category_ids)
+        self.category_ids = self.category_ids + [category_id]
+        self.category_index[category_id] = index
+        self.category_types = np.append(self.category_types, np.int8(TYPE_CODES[category_type]))
+        empty = np.zeros((self.cum_cents.shape[0], 1), dtype=np.int64)
+        self.cum_cents = np.hstack([self.cum_cents, empty])
+        self.cum_counts = np.hstack([self.cum_counts, empty])
+        return index
+
+    def _day(self, value):
+        if isinstance(value, str):
+            value = date.fromisoformat(value)
+        day = value.toordinal() - self.base_ordinal
+        if not 0 <= day < self.cum_cents.shape[0] - 1:
+            raise IndexError("Дата вне диапазона движка")
+        return day
+
+    def _add(self, day: int, index: int, cents: int, count: int):
+        self.cum_cents[day + 1:, index] += cents
+        self.cum_counts[day + 1:, index] += count
+
+    def apply_change(self, generation: int, removed=None, added=None):
+        """Применить изменение одной транзакции.
+
+        removed/added - кортежи (id, date, amount, category_id, category_type)
+        для старой и новой версии строки. Если изменение не удается применить
+        инкрементально, движок помечается устаревшим (generation = None).
+        """
+        with self.lock:
+            if self.generation is not None and generation <= self.generation:
+                return  # уже учтено догоняющим пересчетом (catch_up)
+            if self.generation is None or self.generation != generation - 1:
+                self.generation = None
+                return
+            try:
+                if removed:
+                    transaction_id, value, amount, category_id, category_type = removed
+                    row = int(np.searchsorted(self.ids[:self.size], transaction_id))
+                    if row >= self.size or self.ids[row] != transaction_id or self.cats[row] < 0:
+                        raise KeyError(transaction_id)
+                    self._add(int(self.dates[row]) - self.base_ordinal, int(self.cats[row]),
+                              -int(self.cents[row]), -1)
+                    self.cats[row] = -1  # строка удалена (или заменена новой версией)
+
+                if added:
+                    transaction_id, value, amount, category_id, category_type = added
+                    index = self._ensure_category(category_id, category_type)
+                    day = self._day(value)
+                    cents = int(round(float(amount) * 100))
+                    self._add(day, index, cents, 1)
+
+                    if removed and removed[0] == transaction_id:
+                        row = int(np.searchsorted(self.ids[:self.size], transaction_id))
+                    else:
+                        if self.size and transaction_id <= self.ids[self.size - 1]:
+                            raise KeyError(transaction_id)
+                        if self.size == len(self.ids):
+                            self._grow()
+                        row = self.size
+                        self.size += 1
+                    self.ids[row] = transaction_id
+                    self.dates[row] = day + self.base_ordinal
+                    self.cents[row] = cents
+                    self.cats[row] = index
+            except (IndexError, KeyError, ValueError):
+                self.generation = None
+                return
+            self.generation = generation
+
+    def catch_up(self):
+        """Догнать журнал, пересчитав только дни, измененные после поколения движка.
+
+        Строки движка за эти дни заменяются строками БД, а префиксные суммы
+        сдвигаются на разницу. False - диапазон изменений неизвестен или выходит
+        за пределы движка: нужна полная перестройка (rebuild).
+        """
+        with self.lock:
+            base = self.generation
+        if base is None:
+            return False
+        with get_read_db() as conn:
+            generation = get_ledger_generation(conn)
+            if generation <= base:
+                return True
+            changed = ledger_changes_since(conn, base)
+            if changed is None:
+                return False
+            start, end = changed
+            rows = conn.execute('''
+                SELECT id,
+                       CAST(julianday(date) - julianday('0001-01-01') AS INTEGER) + 1,
+                       CAST(ROUND(amount * 100) AS INTEGER),
+                       category_id
+                FROM transactions
+                WHERE date >= ? AND date <= ?
+                ORDER BY id
+            ''', (start, end)).fetchall()
+            types = dict(conn.execute("SELECT id, type FROM categories").fetchall())
+
+        with self.lock:
+            # Изменения между self.generation и generation лежат в тех же днях
+            if self.generation is None or self.generation >= generation:
+                return self.generation is not None
+            try:
+                first_day, last_day = self._day(start), self._day(end)
+            except IndexError:
+                return False
+
+            size = self.size
+            data = np.array(rows, dtype=np.int64).reshape(-1, 4)
+            dates = self.dates[:size] - self.base_ordinal
+            live = self.cats[:size] >= 0
+            in_range = live & (dates >= first_day) & (dates <= last_day)
+            positions = np.searchsorted(self.ids[:size], data[:, 0])
+            existing = positions < size
+            existing[existing] = self.ids[positions[existing]] == data[existing, 0]
+            # Строка вне измененных дней, но с новой версией - журнал изменений неполон
+            if np.any(live[positions[existing]] & ~in_range[positions[existing]]):
+                return False
+            appended = ~existing
+            if size and np.any(appended) and data[appended, 0].min() <= self.ids[size - 1]:
+                return False
+
+            for category_id in set(data[:, 3].tolist()):
+                self._ensure_category(category_id, types[category_id])
+            indexes = np.array([self.category_index[c] for c in data[:, 3].tolist()], dtype=np.int32)
+
+            # Разница по дням и категориям: минус прежние строки, плюс строки из БД
+            old_rows = np.nonzero(in_range)[0]
+            shape = (last_day - first_day + 1, len(self.category_ids))
+            delta_cents = np.zeros(shape, dtype=np.int64)
+            delta_counts = np.zeros(shape, dtype=np.int64)
+            old_days = dates[old_rows] - first_day
+            np.add.at(delta_cents, (old_days, self.cats[old_rows]), -self.cents[old_rows])
+            np.add.at(delta_counts, (old_days, self.cats[old_rows]), -1)
+            new_days = data[:, 1] - self.base_ordinal - first_day
+            np.add.at(delta_cents, (new_days, indexes), data[:, 2])
+            np.add.at(delta_counts, (new_days, indexes), 1)
+            for cumulative, delta in ((self.cum_cents, delta_cents), (self.cum_counts, delta_counts)):
+                running = np.cumsum(delta, axis=0)
+                cumulative[first_day + 1:last_day + 2] += running
+                cumulative[last_day + 2:] += running[-1]
+
+            self.cats[old_rows] = -1
+            rows_at = positions[existing]
+            self.dates[rows_at] = data[existing, 1]
+            self.cents[rows_at] = data[existing, 2]
+            self.cats[rows_at] = indexes[existing]
+            count = int(appended.sum())
+            while self.size + count > len(self.ids):
+                self._grow()
+            new_rows = slice(self.size, self.size + count)
+            self.ids[new_rows] = data[appended, 0]
+            self.dates[new_rows] = data[appended, 1]
+            self.cents[new_rows] = data[appended, 2]
+            self.cats[new_rows] = indexes[appended]
+            self.size += count
+            self.generation = generation
+        return True
+
+    def _grow(self):
+        capacity = len(self.ids) * 2
+        for name in _ROW_COLUMNS:
+            old = getattr(self, name)
+            new = np.full(capacity, -1 if name == 'cats' else 0, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    # --- Запросы ---
+
+    def _range(self, start_date: date = None, end_date: date = None):
+        """Индексы строк префиксных сумм для [start_date, end_date]"""
+        last = self.cum_cents.shape[0] - 1
+        lo = 0 if start_date is None else start_date.toordinal() - self.base_ordinal
+        hi = last if end_date is None else end_date.toordinal() - self.base_ordinal + 1
+        return min(max(lo, 0), last), min(max(hi, 0), last)
+
+    def totals(self, start_date: date = None, end_date: date = None):
+        """Суммы (в копейках) и количества транзакций по категориям за период"""
+        with self.lock:
+            lo, hi = self._range(start_date, end_date)
+            if hi <= lo:
+                zeros = np.zeros(len(self.category_ids), dtype=np.int64)
+                return zeros, zeros.copy()
+            return self.cum_cents[hi] - self.cum_cents[lo], self.cum_counts[hi] - self.cum_counts[lo]
+
+    def daily(self, start_date: date = None, end_date: date = None):
+        """Суммы и количества по дням и категориям: (ordinal первого дня, cents[дни, кат.], counts[дни, кат.])"""
+        with self.lock:
+            lo, hi = self._range(start_date, end_date)
+            if hi <= lo:
+                n_categories = len(self.category_ids)
+                empty = np.zeros((0, n_categories), dtype=np.int64)
+                return self.base_ordinal + lo, empty, empty
+            return (self.base_ordinal + lo,
+                    np.diff(self.cum_cents[lo:hi + 1], axis=0),
+                    np.diff(self.cum_counts[lo:hi + 1], axis=0))
+
+    def type_mask(self, *types):
+        """Маска категорий указанных типов"""
+        codes = [TYPE_CODES[t] for t in types]
+        return np.isin(self.category_types, codes)
+
+
+_engine = None
+
+
+@on_configure
+def _drop_engine():
+    """Движок построен по прежней БД: после смены БД его нужно создать заново (init_engine)"""
+    global _engine
+    _engine = None
+
+
+def init_engine():
+    """Загрузить движок из снимка или построить заново (если включен в настройках)"""
+    global _engine
+    if not config.ANALYTICS_ENGINE_ENABLED:
+        return None
+    if np is None:
+        print("⚠️  [ENGINE] numpy не установлен, аналитический движок отключен")
+        return None
+
+    engine = AnalyticsEngine()
+    # Несколько воркеров: снимок строит и сохраняет один, остальные его загружают
+    with file_lock(os.path.join(config.ANALYTICS_ENGINE_DIR, ".lock")):
+        with get_read_db() as conn:
+            generation = get_ledger_generation(conn)
+        if not engine.load() or (engine.generation != generation and not engine.catch_up()):
+            engine.rebuild()
+        engine.save()
+    _engine = engine
+    return engine
+
+
+def get_engine(generation: int):
+    """Движок, если он актуален для указанного поколения журнала.
+
+    Если журнал изменил другой процесс (воркер, архивация, восстановление),
+    движок отстает: измененные дни пересчитываются сразу (catch_up), а если это
+    невозможно - запускается фоновая перестройка, и пока отвечает SQL.
+    """
+    engine = _engine
+    if engine is None:
+        return None
+    if engine.generation != generation and _refresh_lock.acquire(blocking=False):
+        try:
+            caught_up = engine.catch_up()
+        finally:
+            _refresh_lock.release()
+        if not caught_up:
+            _refresh_in_background()
+    if engine.generation != generation:
+        return None
+    return engine
+
+
+def refresh_engine():
+    """Перестроить устаревший движок, пока он не догонит поколение журнала"""
+    engine = _engine
+    if engine is None:
+        return
+    while True:
+        with get_read_db() as conn:
+            generation = get_ledger_generation(conn)
+        if engine.generation == generation:
+            return
+        if not engine.catch_up():
+            engine.rebuild()
+
+
+_refresh_lock = threading.Lock()
+
+
+def _refresh_in_background():
+    if not _refresh_lock.acquire(blocking=False):
+        return  # перестройка уже идет
+
+    def run():
+        try:
+            refresh_engine()
+        finally:
+            _refresh_lock.release()
+
+    threading.Thread(target=run, name="analytics-engine-refresh", daemon=True).start()
+
+
+def apply_change(generation: int, removed=None, added=None):
+    """Применить изменение транзакции к движку (вызывается после коммита)"""
+    engine = _engine
+    if engine is None:
+        return
+    engine.apply_change(generation, removed, added)
+    if engine.generation is None:
+        _refresh_in_background()
+
+
+def save_engine():
+    """Сохранить движок на диск (при остановке приложения)"""
+    if _engine is not None and _engine.generation is not None:
+        with file_lock(os.path.join(config.ANALYTICS_ENGINE_DIR, ".lock")):
+            _engine.save()
+
+
+def analytics_from_engine(engine, conn, start_date, end_date, include_savings):
+    """Собрать части ответа get_analytics по данным движка"""
+    cents, counts = engine.totals(start_date, end_date)
+
+    income = engine.type_mask('income')
+    expense = engine.type_mask('expense')
+    savings_income = engine.type_mask('savings_income')
+    savings_expense = engine.type_mask('savings_expense')
+    main_types = (income | expense | savings_income | savings_expense) if include_savings else (income | expense)
+
+    def money(value):
+        # Целые суммы отдаем целыми - как SUM() в SQLite
+        value = int(value)
+        return value // 100 if value % 100 == 0 else value / 100
+
+    stats = {
+        'total_income': money(cents[income].sum()),
+        'total_expense': money(cents[expense].sum()),
+    }
+    savings_stats = {
+        'savings_income': money(cents[savings_income].sum()),
+        'savings_expense': money(cents[savings_expense].sum()),
+    }
+
+    categories = {
+        row['id']: row for row in conn.execute("SELECT id, name, type, color FROM categories")
+    }
+    by_category = []
+    for index in np.nonzero(main_types & (counts > 0))[0]:
+        category = categories[engine.category_ids[index]]
+        by_category.append({
+            'category_name': category['name'],
+            'category_type': category['type'],
+            'category_color': category['color'],
+            'total': money(cents[index])
+        })
+    by_category.sort(key=lambda row: (-row['total'], row['category_type']))
+
+    first_ordinal, daily_cents, daily_counts = engine.daily(start_date, end_date)
+    savings = savings_income | savings_expense
+
+    daily_totals = []
+    for day in np.nonzero(daily_counts[:, main_types].sum(axis=1) > 0)[0]:
+        daily_totals.append({
+            'date': date.fromordinal(first_ordinal + int(day)).isoformat(),
+            'income': money(daily_cents[day, income].sum()),
+            'expense': money(daily_cents[day, expense].sum())
+        })
+
+    savings_daily_totals = []
+    for day in np.nonzero(daily_counts[:, savings].sum(axis=1) > 0)[0]:
+        savings_daily_totals.append({
+            'date': date.fromordinal(first_ordinal + int(day)).isoformat(),
+            'savings_income': money(daily_cents[day, savings_income].sum()),
+            'savings_expense': money(daily_cents[day, savings_expense].sum())
+        })
+
+    return stats, savings_stats, by_category, daily_totals, savings_daily_totals
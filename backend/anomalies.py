@@ -0,0 +1,258 @@
+"""Поиск необычных трат.
+
+Фоновая задача строит ряд "категория расходов x день" и для каждого дня считает
+скользящую базу по предыдущим ANOMALY_WINDOW_DAYS дням: медиану и MAD по дням
+с тратами. Все окна обрабатываются разом через numpy (sliding_window_view).
+Отмечаются:
+- category_day - день, когда траты категории выше базы на ANOMALY_Z_THRESHOLD
+  робастных z-оценок;
+- new_merchant - первая транзакция с новым описанием ("продавцом"), сумма
+  которой в ANOMALY_LARGE_FACTOR раз выше обычного дня категории.
+
+Пересчитываются только дни начиная с самой ранней измененной даты (журнал
+ledger_changes); результаты хранятся в таблице anomalies, и GET /api/anomalies
+отдает их без вычислений.
+
+Запуск из папки backend:
+    python anomalies.py detect [--full]
+"""
+import argparse
+import os
+import re
+import sqlite3
+import threading
+import warnings
+from datetime import date, timedelta
+
+try:
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+except ImportError:  # поиск аномалий опционален
+    np = None
+
+import config
+from database import (get_db, get_read_db, get_ledger_generation, ledger_changes_since,
+                      current_generation, file_lock, try_file_lock)
+
+_LOCK_PATH = os.path.join(config.DATA_DIR, ".anomalies.lock")
+_NON_WORD = re.compile(r"[\d\W_]+")
+
+# Масштаб не меньше этой доли базы: при почти одинаковых тратах MAD равна нулю
+_MIN_SCALE_RATIO = 0.1
+
+
+def merchant_key(description):
+    """Описание без регистра, цифр и знаков препинания"""
+    return _NON_WORD.sub(" ", description.casefold()).strip() if description else ""
+
+
+def rolling_baseline(series, window: int):
+    """База для каждого дня по предыдущим window дням.
+
+    series - траты (дни x категории). Возвращает массивы для дней window..конец:
+    медиану и масштаб по дням с тратами и число таких дней в окне.
+    """
+    # Окно k - дни k..k+window-1, база для дня k+window
+    windows = sliding_window_view(series, window, axis=0)[:-1]
+    active = np.count_nonzero(windows > 0, axis=-1)
+    spending = np.where(windows > 0, windows, np.nan)
+    with warnings.catch_warnings():
+        # Окна без трат дают nan - это ожидаемо
+        warnings.simplefilter("ignore", RuntimeWarning)
+        median = np.nanmedian(spending, axis=-1)
+        deviation = np.abs(spending - median[..., None])
+        mad = np.nanmedian(deviation, axis=-1)
+        mean_deviation = np.nanmean(deviation, axis=-1)
+    # MAD -> сигма нормального распределения; при MAD = 0 - среднее отклонение
+    scale = np.where(mad > 0, 1.4826 * mad, 1.2533 * mean_deviation)
+    scale = np.fmax(scale, _MIN_SCALE_RATIO * median)
+    return median, scale, active
+
+
+def _detect_range(conn, since: date):
+    """Аномалии и новые продавцы начиная с даты since (по снимку conn)"""
+    window = config.ANOMALY_WINDOW_DAYS
+    start = since - timedelta(days=window)
+    last = conn.execute("SELECT MAX(date) FROM transactions").fetchone()[0]
+    end = max(date.fromisoformat(last), since) if last else since
+
+    daily = conn.execute('''
+        SELECT t.category_id, t.date, SUM(t.amount) as total
+        FROM transactions t
+        JOIN categories c ON t.category_id = c.id
+        WHERE c.type = 'expense' AND t.date >= ?
+        GROUP BY t.category_id, t.date
+    ''', (start.isoformat(),)).fetchall()
+
+    category_ids = sorted({row['category_id'] for row in daily})
+    category_index = {category_id: i for i, category_id in enumerate(category_ids)}
+    start_ordinal = start.toordinal()
+    days = end.toordinal() - start_ordinal + 1
+
+    series = np.zeros((days, len(category_ids)))
+    if daily:
+        day_index = np.fromiter((date.fromisoformat(row['date']).toordinal() - start_ordinal for row in daily),
+                                dtype=np.int64, count=len(daily))
+        cat_index = np.fromiter((category_index[row['category_id']] for row in daily),
+                                dtype=np.int64, count=len(daily))
+        series[day_index, cat_index] = [row['total'] for row in daily]
+
+    # Строка k результатов - день since + k
+    median, scale, active = rolling_baseline(series, window)
+    observed = series[window:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = (observed - median) / scale
+    flagged = ((observed > 0) & (active >= config.ANOMALY_MIN_ACTIVE_DAYS) & (scale > 0)
+               & (score >= config.ANOMALY_Z_THRESHOLD))
+
+    anomalies = []
+    for day, index in zip(*np.nonzero(flagged)):
+        anomalies.append((
+            'category_day', category_ids[index], date.fromordinal(since.toordinal() + int(day)).isoformat(),
+            round(float(observed[day, index]), 2), round(float(median[day, index]), 2),
+            round(float(score[day, index]), 2), None, None
+        ))
+
+    # Новые продавцы: первое появление описания начиная с since
+    known = {row[0] for row in conn.execute(
+        "SELECT key FROM anomaly_merchants WHERE first_date < ?", (since.isoformat(),)
+    )}
+    merchants = []
+    for row in conn.execute('''
+        SELECT t.id, t.date, t.amount, t.category_id, t.description
+        FROM transactions t
+        JOIN categories c ON t.category_id = c.id
+        WHERE c.type = 'expense' AND t.date >= ? AND t.description IS NOT NULL
+        ORDER BY t.date, t.id
+    ''', (since.isoformat(),)):
+        key = merchant_key(row['description'])
+        if not key or key in known:
+            continue
+        known.add(key)
+        merchants.append((key, row['date'], row['id']))
+
+        day = date.fromisoformat(row['date']).toordinal() - since.toordinal()
+        baseline = median[day, category_index[row['category_id']]]
+        if baseline > 0 and row['amount'] >= config.ANOMALY_LARGE_FACTOR * baseline:
+            anomalies.append(('new_merchant', row['category_id'], row['date'], row['amount'],
+                              round(float(baseline), 2), round(row['amount'] / float(baseline), 2),
+                              row['id'], row['description']))
+
+    return anomalies, merchants
+
+
+def detect(full: bool = False):
+    """Пересчитать аномалии для дней, измененных после прошлого запуска.
+
+    Возвращает (число найденных аномалий в пересчитанных днях, None) или (None, ошибка).
+    """
+    if np is None:
+        return None, "numpy не установлен, поиск аномалий недоступен"
+
+    try:
+        with file_lock(_LOCK_PATH):
+            return _detect(full)
+    except sqlite3.Error as e:
+        return None, f"Ошибка базы данных: {str(e)}"
+
+
+def _detect(full: bool):
+    with get_read_db() as conn:
+        generation = get_ledger_generation(conn)
+        state = conn.execute("SELECT generation FROM anomaly_state WHERE id = 1").fetchone()
+
+        since = None
+        if state is not None and not full:
+            changes = ledger_changes_since(conn, state['generation'])
+            if changes == (None, None):
+                return 0, None
+            if changes is not None:
+                since = date.fromisoformat(changes[0])
+        if since is None:
+            # Полный пересчет (первый запуск, архивация, восстановление из копии)
+            full = True
+            first = conn.execute("SELECT MIN(date) FROM transactions").fetchone()[0]
+            since = date.fromisoformat(first) if first else date.today()
+
+        anomalies, merchants = _detect_range(conn, since)
+
+    with get_db() as conn:
+        # При полном пересчете старые результаты могли остаться от другой истории
+        cleared_from = "0000-01-01" if full else since.isoformat()
+        conn.execute("DELETE FROM anomalies WHERE date >= ?", (cleared_from,))
+        conn.execute("DELETE FROM anomaly_merchants WHERE first_date >= ?", (cleared_from,))
+        conn.executemany(
+            "INSERT INTO anomaly_merchants (key, first_date, transaction_id) VALUES (?, ?, ?)",
+            merchants
+        )
+        conn.executemany(
+            '''INSERT INTO anomalies
+               (kind, category_id, date, amount, baseline, score, transaction_id, description)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+            anomalies
+        )
+        conn.execute(
+            '''INSERT INTO anomaly_state (id, generation) VALUES (1, ?)
+               ON CONFLICT (id) DO UPDATE SET generation = excluded.generation''',
+            (generation,)
+        )
+        conn.commit()
+    return len(anomalies), None
+
+
+_scheduler = None
+
+
+def start_scheduler():
+    """Фоновый пересчет аномалий после изменений журнала"""
+    global _scheduler
+    if np is None or config.ANOMALY_INTERVAL_SECONDS <= 0 or _scheduler is not None:
+        return None
+
+    # При нескольких воркерах пересчет ведет только тот, кто захватил блокировку
+    leader = try_file_lock(os.path.join(config.DATA_DIR, ".anomalies_scheduler.lock"))
+    if leader is None:
+        return None
+
+    stop = threading.Event()
+
+    def run():
+        seen = None
+        while True:
+            generation = current_generation()
+            if generation != seen:
+                _, error = detect()
+                if error:
+                    print(f"❌ [ANOMALIES] {error}")
+                seen = generation
+            if stop.wait(config.ANOMALY_INTERVAL_SECONDS):
+                break
+        leader.release()
+
+    thread = threading.Thread(target=run, name="anomaly-detector", daemon=True)
+    thread.start()
+    _scheduler = stop
+    return stop
+
+
+def stop_scheduler():
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.set()
+        _scheduler = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Поиск необычных трат")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    detect_parser = subparsers.add_parser("detect", help="пересчитать аномалии")
+    detect_parser.add_argument("--full", action="store_true", help="пересчитать всю историю")
+    args = parser.parse_args()
+
+    if args.command == "detect":
+        found, error = detect(full=args.full)
+        print(f"❌ {error}" if error else f"🔎 Аномалий в пересчитанных днях: {found}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Архивация закрытых лет и обслуживание БД.
+
+Транзакции закрытого года переносятся в отдельный файл data/archive/finance_<год>.db
+вместе с замороженными итогами по дням, месяцам и году. Чтения (get_transactions,
+get_analytics, сравнение периодов) подключают архив только когда период
+захватывает архивный год; аналитика и сравнение без фильтров читают итоги
+по дням, а не строки архива.
+
+Запуск из папки backend (например, по расписанию из cron / Планировщика заданий):
+    python archive.py archive --before 2025 [--vacuum]
+    python archive.py maintain [--vacuum]
+    python archive.py list
+"""
+import argparse
+import os
+import sqlite3
+from datetime import date
+
+import config
+from database import get_db, get_read_db, bump_ledger_generation, TRANSACTION_COLUMNS
+
+
+def archive_path(year: int):
+    return os.path.join(config.ARCHIVE_DIR, f"finance_{year}.db")
+
+
+def archive_year(year: int):
+    """Перенести транзакции года в архивный файл"""
+    if year >= date.today().year:
+        return None, f"{year} год еще не закрыт"
+
+    path = archive_path(year)
+    start, end = f"{year}-01-01", f"{year}-12-31"
+    os.makedirs(config.ARCHIVE_DIR, exist_ok=True)
+
+    try:
+        with get_db() as conn:
+            if conn.execute("SELECT 1 FROM archived_years WHERE year = ?", (year,)).fetchone():
+                return None, f"{year} год уже в архиве"
+
+            # Файл мог остаться от прерванной архивации - создаем заново
+            if os.path.exists(path):
+                os.remove(path)
+
+            # Шаг 1: копия строк и итогов в архивный файл
+            conn.execute("ATTACH DATABASE ? AS archive", (path,))
+            try:
+                conn.execute('''
+                    CREATE TABLE archive.transactions (
+                        id INTEGER PRIMARY KEY,
+                        amount DECIMAL(10,2) NOT NULL,
+                        category_id INTEGER NOT NULL,
+                        date DATE NOT NULL,
+                        description TEXT,
+                        created_at TIMESTAMP
+                    )
+                ''')
+                conn.execute(
+                    f"INSERT INTO archive.transactions ({TRANSACTION_COLUMNS}) "
+                    f"SELECT {TRANSACTION_COLUMNS} FROM main.transactions WHERE date >= ? AND date <= ?",
+                    (start, end)
+                )
+                conn.execute('CREATE INDEX archive.idx_transactions_date ON transactions (date)')
+
+                # Замороженные итоги: архив больше не меняется
+                conn.execute('''
+                    CREATE TABLE archive.monthly_summary AS
+                    SELECT strftime('%Y-%m', date) as month, category_id,
+                           SUM(amount) as total, COUNT(*) as count
+                    FROM archive.transactions
+                    GROUP BY month, category_id
+                ''')
+                # По дням и категориям: из неё аналитика и сравнение периодов читают архив
+                # (см. database.ledger_source(summary=True)) вместо сканирования всех строк года
+                conn.execute('''
+                    CREATE TABLE archive.daily_summary AS
+                    SELECT date, category_id, SUM(amount) as total, COUNT(*) as count
+                    FROM archive.transactions
+                    GROUP BY date, category_id
+                ''')
+                conn.execute('CREATE INDEX archive.idx_daily_summary_date ON daily_summary (date)')
+                conn.execute('''
+                    CREATE TABLE archive.yearly_summary AS
+                    SELECT category_id, SUM(amount) as total, COUNT(*) as count
+                    FROM archive.transactions
+                    GROUP BY category_id
+                ''')
+                conn.commit()
+
+                archived = conn.execute("SELECT COUNT(*) FROM archive.transactions").fetchone()[0]
+            except sqlite3.Error:
+                # Незавершенная транзакция держит архив - без отката DETACH упадет и скроет ошибку
+                conn.rollback()
+                raise
+            finally:
+                conn.execute("DETACH DATABASE archive")
+
+            # Шаг 2: удаление из горячей таблицы и запись в реестр одной транзакцией
+            cursor = conn.execute("DELETE FROM transactions WHERE date >= ? AND date <= ?", (start, end))
+            if cursor.rowcount != archived:
+                conn.rollback()
+                return None, f"Число строк не совпало ({cursor.rowcount} != {archived}), архивация отменена"
+
+            conn.execute(
+                "INSERT INTO archived_years (year, path, rows) VALUES (?, ?, ?)",
+                (year, path, archived)
+            )
+            bump_ledger_generation(conn)
+            conn.commit()
+            return archived, None
+    except sqlite3.Error as e:
+        return None, f"Ошибка базы данных: {str(e)}"
+
+
+def maintain(vacuum: bool = False):
+    """ANALYZE (и при необходимости VACUUM) горячего файла БД"""
+    try:
+        with get_db() as conn:
+            conn.execute("ANALYZE")
+            if vacuum:
+                conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return True, None
+    except sqlite3.Error as e:
+        return None, f"Ошибка базы данных: {str(e)}"
+
+
+def list_archives():
+    """Архивированные годы с итогами из замороженных сводок"""
+    with get_read_db() as conn:
+        archives = [dict(row) for row in conn.execute("SELECT * FROM archived_years ORDER BY year")]
+
+    for archive in archives:
+        with sqlite3.connect(archive['path']) as archive_conn:
+            archive['total'], archive['count'] = archive_conn.execute(
+                "SELECT COALESCE(SUM(total), 0), COALESCE(SUM(count), 0) FROM yearly_summary"
+            ).fetchone()
+    return archives
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Архивация закрытых лет и обслуживание БД")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    archive_parser = subparsers.add_parser("archive", help="перенести закрытые годы в архив")
+    archive_parser.add_argument("--before", type=int, default=date.today().year,
+                                help="архивировать годы меньше указанного (по умолчанию - текущий)")
+    archive_parser.add_argument("--vacuum", action="store_true", help="выполнить VACUUM после архивации")
+
+    maintain_parser = subparsers.add_parser("maintain", help="ANALYZE/VACUUM горячего файла")
+    maintain_parser.add_argument("--vacuum", action="store_true")
+
+    subparsers.add_parser("list", help="список архивов")
+
+    args = parser.parse_args()
+
+    if args.command == "archive":
+        with get_read_db() as conn:
+            years = [row[0] for row in conn.execute(
+                "SELECT DISTINCT CAST(strftime('%Y', date) AS INTEGER) FROM transactions "
+                "WHERE date < ? ORDER BY 1", (f"{args.before}-01-01",)
+            )]
+        if not years:
+            print("Нет закрытых лет для архивации")
+        for year in years:
+            archived, error = archive_year(year)
+            if error:
+                print(f"❌ {year}: {error}")
+            else:
+                print(f"📦 {year}: перенесено {archived} транзакций в {archive_path(year)}")
+        _, error = maintain(vacuum=args.vacuum)
+        if error:
+            print(f"❌ {error}")
+
+    elif args.command == "maintain":
+        _, error = maintain(vacuum=args.vacuum)
+        print(f"❌ {error}" if error else "✅ Обслуживание БД выполнено")
+
+    elif args.command == "list":
+        for archive in list_archives():
+            print(f"{archive['year']}: {archive['rows']} транзакций, сумма {archive['total']}, "
+                  f"{archive['path']} (архивирован {archive['archived_at']})")
+
+
+if __name__ == "__main__":
+    main()
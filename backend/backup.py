@@ -0,0 +1,274 @@
+"""Онлайн-резервное копирование БД.
+
+Копия снимается через sqlite3.Connection.backup из read-only соединения внутри
+одной read-транзакции: в режиме WAL это согласованный снимок на момент начала,
+а писатели не блокируются. Страницы копируются небольшими порциями с паузами
+между шагами. Для каждой копии рядом сохраняется файл .sha256.
+
+Архивы закрытых лет (archive.py) входят в копию: файлы из реестра archived_years
+снимка копируются рядом как <копия>.archive-<год>, а их контрольные суммы
+записываются в тот же файл .sha256. Восстанавливается весь набор сразу.
+
+Запуск из папки backend:
+    python backup.py create
+    python backup.py list
+    python backup.py verify <файл>
+    python backup.py restore <файл>
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import config
+from archive import archive_path
+from database import get_read_db, get_ledger_generation, restore_from, sqlite_uri, try_file_lock
+
+
+def _sha256(path: str):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def archive_copy_path(path: str, year: int):
+    """Файл копии архива года рядом с копией БД path"""
+    return f"{path}.archive-{year}"
+
+
+def snapshot_to(path: str, pages: int = None, step_sleep: float = None):
+    """Снять согласованную копию БД (с архивами) в файл path. Возвращает сведения о копии"""
+    pages = pages or config.BACKUP_PAGES_PER_STEP
+    step_sleep = config.BACKUP_STEP_SLEEP if step_sleep is None else step_sleep
+
+    def pause(status, remaining, total):
+        # Пауза между шагами, чтобы копирование не занимало диск и GIL целиком
+        if remaining and step_sleep:
+            time.sleep(step_sleep)
+
+    tmp = path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+
+    started = time.perf_counter()
+    with get_read_db() as source:
+        # Первое чтение фиксирует снимок: все шаги копируют одну и ту же версию БД
+        generation = get_ledger_generation(source)
+        archived = source.execute("SELECT year, path FROM archived_years ORDER BY year").fetchall()
+        target = sqlite3.connect(tmp)
+        try:
+            source.backup(target, pages=pages, progress=pause)
+        finally:
+            target.close()
+        # Архивный файл после регистрации не меняется: копия согласована со снимком реестра
+        archives = []
+        for year, archive_file in archived:
+            copy = archive_copy_path(path, year)
+            shutil.copyfile(archive_file, copy)
+            archives.append({'year': year, 'path': copy, 'sha256': _sha256(copy)})
+
+    os.replace(tmp, path)
+    checksum = _sha256(path)
+    with open(path + ".sha256", "w") as f:
+        f.write(f"{checksum}  {os.path.basename(path)}\n")
+        for item in archives:
+            f.write(f"{item['sha256']}  {os.path.basename(item['path'])}\n")
+
+    return {
+        'path': path,
+        'size': os.path.getsize(path) + sum(os.path.getsize(item['path']) for item in archives),
+        'sha256': checksum,
+        'archives': archives,
+        'generation': generation,
+        'duration': round(time.perf_counter() - started, 3)
+    }
+
+
+def backup_files(path: str):
+    """Все файлы набора копии: сама копия, .sha256, копии архивов и служебные файлы WAL"""
+    directory, name = os.path.split(path)
+    archives = sorted(
+        os.path.join(directory, other) for other in os.listdir(directory or ".")
+        if other.startswith(name + ".archive-")
+    )
+    return [path, path + ".sha256", path + "-wal", path + "-shm"] + archives
+
+
+def list_backups():
+    """Резервные копии в BACKUP_DIR, от новых к старым"""
+    if not os.path.isdir(config.BACKUP_DIR):
+        return []
+    names = sorted(
+        (name for name in os.listdir(config.BACKUP_DIR)
+         if name.startswith("finance_") and name.endswith(".db")),
+        reverse=True
+    )
+    return [os.path.join(config.BACKUP_DIR, name) for name in names]
+
+
+def create_backup():
+    """Создать резервную копию в BACKUP_DIR и удалить лишние старые копии"""
+    os.makedirs(config.BACKUP_DIR, exist_ok=True)
+    name = f"finance_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
+    try:
+        info = snapshot_to(os.path.join(config.BACKUP_DIR, name))
+    except (sqlite3.Error, OSError) as e:
+        return None, f"Ошибка резервного копирования: {str(e)}"
+
+    for old in list_backups()[config.BACKUP_KEEP:]:
+        for path in backup_files(old):
+            if os.path.exists(path):
+                os.remove(path)
+    return info, None
+
+
+def _integrity_check(path: str):
+    conn = sqlite3.connect(sqlite_uri(path, mode="ro"), uri=True)
+    try:
+        return conn.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _archived_years(path: str):
+    """Годы из реестра архивов внутри копии"""
+    conn = sqlite3.connect(sqlite_uri(path, mode="ro"), uri=True)
+    try:
+        return [row[0] for row in conn.execute("SELECT year FROM archived_years ORDER BY year")]
+    finally:
+        conn.close()
+
+
+def verify_backup(path: str):
+    """Проверить контрольные суммы и целостность копии и её архивов"""
+    if not os.path.exists(path):
+        return False, "Файл копии не найден"
+
+    expected = {}  # имя файла набора -> контрольная сумма
+    try:
+        with open(path + ".sha256") as f:
+            for line in f.read().splitlines():
+                if line.strip():
+                    checksum, name = line.split(None, 1)
+                    expected[name] = checksum
+    except (OSError, ValueError):
+        return False, "Нет файла контрольной суммы"
+    directory = os.path.dirname(path)
+    if expected.get(os.path.basename(path)) is None:
+        return False, "Нет контрольной суммы копии"
+    for name, checksum in expected.items():
+        file_path = os.path.join(directory, name)
+        if not os.path.exists(file_path):
+            return False, f"Файл набора копии не найден: {name}"
+        if _sha256(file_path) != checksum:
+            return False, f"Контрольная сумма не совпадает: {name}"
+
+    try:
+        for name in expected:
+            result = _integrity_check(os.path.join(directory, name))
+            if result != "ok":
+                return False, f"Проверка целостности не пройдена ({name}): {result}"
+        years = _archived_years(path)
+    except sqlite3.Error as e:
+        return False, f"Ошибка чтения копии: {str(e)}"
+
+    # Копия без архивов, на которые ссылается её реестр, восстановит ссылки на чужие файлы
+    for year in years:
+        if os.path.basename(archive_copy_path(path, year)) not in expected:
+            return False, f"В копии нет архива {year} года"
+    return True, None
+
+
+def restore_backup(path: str):
+    """Восстановить БД и архивы из проверенной копии одним набором"""
+    valid, error = verify_backup(path)
+    if not valid:
+        return None, error
+
+    try:
+        archives = {}
+        os.makedirs(config.ARCHIVE_DIR, exist_ok=True)
+        for year in _archived_years(path):
+            # Замена файла атомарна; читатели отключают архивы после каждого чтения
+            target = archive_path(year)
+            shutil.copyfile(archive_copy_path(path, year), target + ".tmp")
+            os.replace(target + ".tmp", target)
+            archives[year] = target
+        generation = restore_from(path, archives)
+    except (sqlite3.Error, OSError) as e:
+        return None, f"Ошибка восстановления: {str(e)}"
+    return generation, None
+
+
+_scheduler = None
+
+
+def start_scheduler():
+    """Фоновое резервное копирование по расписанию (если задан интервал)"""
+    global _scheduler
+    if config.BACKUP_INTERVAL_HOURS <= 0 or _scheduler is not None:
+        return None
+
+    # При нескольких воркерах расписание ведет только тот, кто захватил блокировку
+    leader = try_file_lock(os.path.join(config.BACKUP_DIR, ".scheduler.lock"))
+    if leader is None:
+        return None
+
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(config.BACKUP_INTERVAL_HOURS * 3600):
+            info, error = create_backup()
+            if error:
+                print(f"❌ [BACKUP] {error}")
+            else:
+                print(f"💾 [BACKUP] {info['path']} ({info['size']} байт, {info['duration']}с)")
+        leader.release()
+
+    thread = threading.Thread(target=run, name="backup-scheduler", daemon=True)
+    thread.start()
+    _scheduler = stop
+    return stop
+
+
+def stop_scheduler():
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.set()
+        _scheduler = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Резервное копирование БД")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("create", help="создать резервную копию")
+    subparsers.add_parser("list", help="список копий")
+    verify_parser = subparsers.add_parser("verify", help="проверить копию")
+    verify_parser.add_argument("path")
+    restore_parser = subparsers.add_parser("restore", help="восстановить БД из копии")
+    restore_parser.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "create":
+        info, error = create_backup()
+        print(f"❌ {error}" if error else f"💾 {info['path']}: {info['size']} байт за {info['duration']}с, "
+                                          f"sha256 {info['sha256']}")
+    elif args.command == "list":
+        for path in list_backups():
+            print(f"{path} ({os.path.getsize(path)} байт)")
+    elif args.command == "verify":
+        valid, error = verify_backup(args.path)
+        print("✅ Копия в порядке" if valid else f"❌ {error}")
+    elif args.command == "restore":
+        _, error = restore_backup(args.path)
+        print(f"❌ {error}" if error else "✅ БД восстановлена")
+
+
+if __name__ == "__main__":
+    main()
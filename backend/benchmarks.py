@@ -0,0 +1,559 @@
+"""Нагрузочные сценарии и бенчмарки финансового трекера.
+
+Запуск из папки backend:
+    python benchmarks.py <сценарий> [--rows N] ...
+
+Бенчмарки работают с временной БД и не трогают data/finance.db.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Переходим во временную папку ДО импорта database: папка данных по умолчанию
+# относительная (data/), а init_db() выполняется при импорте. Рядом - пустая папка
+# frontend для main.py. БД можно задать и явно: FINANCE_DATABASE=:memory: и т.п.
+START_DIR = os.getcwd()
+BENCH_ROOT = tempfile.mkdtemp(prefix="finance_bench_")
+os.makedirs(os.path.join(BENCH_ROOT, "frontend"))
+os.makedirs(os.path.join(BENCH_ROOT, "backend"))
+os.chdir(os.path.join(BENCH_ROOT, "backend"))
+
+import config  # noqa: E402
+import database  # noqa: E402
+import crud  # noqa: E402
+import analytics_engine  # noqa: E402
+import backup  # noqa: E402
+import categorizer  # noqa: E402
+from models import TransactionCreate, TransactionFilter  # noqa: E402
+
+
+# Папка с заполненными БД (--seed-cache): данные генерируются один раз, затем копируются
+SEED_CACHE_DIR = None
+
+
+def seed_transactions(rows: int, days: int = 3 * 365, description_size: int = 0):
+    """Заполнить БД случайными транзакциями"""
+    if SEED_CACHE_DIR is None:
+        return _generate_transactions(rows, days, description_size)
+
+    template = os.path.join(SEED_CACHE_DIR, f"seed_{rows}_{days}_{description_size}.db")
+    if os.path.exists(template):
+        database.restore_from(template)
+        with database.get_read_db() as conn:
+            return [row['id'] for row in conn.execute("SELECT id FROM categories")]
+
+    category_ids = _generate_transactions(rows, days, description_size)
+    os.makedirs(SEED_CACHE_DIR, exist_ok=True)
+    backup.snapshot_to(template, pages=-1, step_sleep=0)
+    return category_ids
+
+
+def _generate_transactions(rows: int, days: int, description_size: int):
+    with database.get_db() as conn:
+        category_ids = [row['id'] for row in conn.execute("SELECT id FROM categories")]
+        start = date.today() - timedelta(days=days)
+        rnd = random.Random(42)
+        batch = []
+        for i in range(rows):
+            batch.append((
+                round(rnd.uniform(10, 5000), 2),
+                rnd.choice(category_ids),
+                (start + timedelta(days=rnd.randrange(days))).isoformat(),
+                f"Операция {rnd.randrange(1000)}".ljust(description_size, ".")
+            ))
+            if len(batch) == 10000:
+                conn.executemany(
+                    "INSERT INTO transactions (amount, category_id, date, description) VALUES (?, ?, ?, ?)",
+                    batch
+                )
+                batch.clear()
+        if batch:
+            conn.executemany(
+                "INSERT INTO transactions (amount, category_id, date, description) VALUES (?, ?, ?, ?)",
+                batch
+            )
+        conn.commit()
+        return category_ids
+
+
+def percentile(values, p):
+    """Перцентиль p (0..100) по списку значений"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(title, latencies_ms):
+    print(f"{title}: n={len(latencies_ms)} "
+          f"p50={percentile(latencies_ms, 50):.2f}ms "
+          f"p99={percentile(latencies_ms, 99):.2f}ms "
+          f"max={max(latencies_ms, default=0):.2f}ms "
+          f"mean={statistics.fmean(latencies_ms) if latencies_ms else 0:.2f}ms")
+
+
+def measure_writes(category_id: int, duration: float):
+    """Создавать транзакции в течение duration секунд, вернуть задержки в мс"""
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        transaction = TransactionCreate(
+            amount=Decimal("123.45"), category_id=category_id,
+            date=date.today(), description="stress"
+        )
+        started = time.perf_counter()
+        _, error = crud.create_transaction(transaction)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if error:
+            raise RuntimeError(error)
+    return latencies
+
+
+def _burn_cpu(stop):
+    while not stop.is_set():
+        sum(range(10_000))
+
+
+def bench_analytics_stress(args):
+    """Задержка записи без аналитики и на фоне непрерывной аналитики за всё время.
+
+    Читатели WAL писателя не блокируют, но занимают процессор: если ядер меньше,
+    чем читателей плюс писатель, p99 записи растет до кванта планировщика ОС
+    (единицы мс). Это известное ограничение, а не ожидание блокировки - его
+    показывает контрольный прогон с процессами без БД.
+    """
+    category_ids = seed_transactions(args.rows)
+    category_id = category_ids[0]
+
+    report("Запись без аналитики", measure_writes(category_id, args.duration))
+
+    stop = threading.Event()
+    analytics_runs = []
+
+    def analytics_loop():
+        while not stop.is_set():
+            started = time.perf_counter()
+            _, error = crud.get_analytics(period='all', include_savings=True)
+            analytics_runs.append((time.perf_counter() - started) * 1000)
+            if error:
+                raise RuntimeError(error)
+
+    readers = [threading.Thread(target=analytics_loop) for _ in range(args.readers)]
+    for reader in readers:
+        reader.start()
+    try:
+        latencies = measure_writes(category_id, args.duration)
+    finally:
+        stop.set()
+        for reader in readers:
+            reader.join()
+
+    report("Запись на фоне аналитики", latencies)
+    report("get_analytics(period='all')", analytics_runs)
+
+    # Контроль: столько же процессов с чистой нагрузкой на CPU, без обращений к БД (процессы,
+    # а не потоки: иначе к очереди за процессором добавится GIL). Если задержка записи та же,
+    # её дает очередь к процессору (ядер меньше, чем занятых потоков), а не взаимодействие
+    # читателей и писателя в SQLite
+    context = multiprocessing.get_context("spawn")
+    stop = context.Event()
+    burners = [context.Process(target=_burn_cpu, args=(stop,)) for _ in range(args.readers)]
+    for burner in burners:
+        burner.start()
+    try:
+        time.sleep(1)  # запуск процессов spawn
+        latencies = measure_writes(category_id, args.duration)
+    finally:
+        stop.set()
+        for burner in burners:
+            burner.join()
+    report(f"Запись на фоне {args.readers} процессов без БД (ядер: {os.cpu_count()})", latencies)
+
+
+def random_ranges(count: int, days: int = 3 * 365):
+    """Случайные произвольные периоды в пределах истории"""
+    rnd = random.Random(7)
+    first = date.today() - timedelta(days=days)
+    ranges = []
+    for _ in range(count):
+        start = first + timedelta(days=rnd.randrange(days))
+        ranges.append((start, start + timedelta(days=rnd.randrange(1, 400))))
+    return ranges
+
+
+def bench_engine(args):
+    """get_analytics(period='custom'): SQL против колоночного движка"""
+    seed_transactions(args.rows)
+    ranges = random_ranges(args.queries)
+
+    def run(title):
+        latencies = []
+        for start_date, end_date in ranges:
+            started = time.perf_counter()
+            _, error = crud.get_analytics(period='custom', start_date=start_date, end_date=end_date)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if error:
+                raise RuntimeError(error)
+        report(title, latencies)
+
+    run("SQL")
+
+    config.ANALYTICS_ENGINE_ENABLED = True
+    started = time.perf_counter()
+    engine = analytics_engine.init_engine()
+    print(f"Построение движка: {(time.perf_counter() - started) * 1000:.0f}ms")
+    run("Движок")
+
+    started = time.perf_counter()
+    warm = analytics_engine.AnalyticsEngine()
+    warm.load()
+    print(f"Теплый старт (mmap): {(time.perf_counter() - started) * 1000:.1f}ms, поколение {warm.generation}")
+    assert warm.generation == engine.generation
+
+
+def bench_backup(args):
+    """p99 задержки записи во время онлайн-бэкапа большой БД"""
+    category_ids = seed_transactions(args.rows, description_size=args.description_size)
+    # Сгенерированные строки еще в -wal: переносим их в основной файл, иначе размер будет нулевым
+    with database.get_db() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    print(f"Размер БД: {os.path.getsize(database.DATABASE_URL) / 2 ** 20:.0f} МБ")
+
+    report("Запись без бэкапа", measure_writes(category_ids[0], args.duration))
+
+    done = threading.Event()
+    latencies = []
+
+    def writer():
+        while not done.is_set():
+            latencies.extend(measure_writes(category_ids[0], 0.5))
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        info = backup.snapshot_to(os.path.join(tempfile.mkdtemp(), "bench_backup.db"),
+                                  pages=args.pages, step_sleep=args.step_sleep)
+    finally:
+        done.set()
+        thread.join()
+
+    print(f"Бэкап: {info['size'] / 2 ** 20:.0f} МБ за {info['duration']}с")
+    report("Запись во время бэкапа", latencies)
+
+
+def _http(port: int, method: str, path: str, body=None, token=None):
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}{path}", method=method, headers=headers,
+        data=json.dumps(body).encode() if body is not None else None
+    )
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read())
+
+
+def _read_client(port: int, token: str, duration: float):
+    """Клиент с преобладанием чтения: список транзакций и аналитика за месяц"""
+    done = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        _http(port, "GET", "/api/transactions?period=month", token=token)
+        _http(port, "POST", "/api/analytics", {"period": "month"}, token=token)
+        done += 2
+    return done
+
+
+def bench_workers(args):
+    """Пропускная способность чтения при 1..N воркерах uvicorn"""
+    seed_transactions(args.rows)
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    token = None
+
+    for workers in [int(n) for n in args.workers.split(",")]:
+        port = args.port
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+             "--workers", str(workers), "--log-level", "warning"],
+            env=env, stdout=subprocess.DEVNULL
+        )
+        try:
+            for _ in range(100):
+                try:
+                    status = _http(port, "GET", "/api/auth/status")
+                    break
+                except OSError:
+                    time.sleep(0.2)
+            else:
+                raise RuntimeError("Сервер не запустился")
+
+            if token is None:
+                if not status["password_set"]:
+                    _http(port, "POST", "/api/auth/setup", {"password": "bench", "password_confirm": "bench"})
+                token = json.dumps(_http(port, "POST", "/api/auth/login", {"password": "bench"})["token"])
+
+            with ProcessPoolExecutor(args.clients) as pool:
+                started = time.perf_counter()
+                futures = [pool.submit(_read_client, port, token, args.duration) for _ in range(args.clients)]
+                total = sum(future.result() for future in futures)
+                elapsed = time.perf_counter() - started
+            print(f"Воркеров: {workers}, клиентов: {args.clients}: {total / elapsed:.0f} запросов/с")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def bench_columnar(args):
+    """Размер ответа, время кодирования и разбора: строки против столбцов"""
+    from fastapi.responses import JSONResponse
+
+    seed_transactions(args.rows, days=30)
+    start_date = date.today() - timedelta(days=30)
+
+    def measure(title, columnar, encode):
+        started = time.perf_counter()
+        data, error = crud.get_transactions(start_date, date.today(), columnar=columnar)
+        if error:
+            raise RuntimeError(error)
+        query_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        body = encode(data)
+        encode_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        json.loads(body)
+        parse_ms = (time.perf_counter() - started) * 1000
+        print(f"{title}: {len(body) / 1024:.0f} КБ, запрос+сборка {query_ms:.0f}ms, "
+              f"кодирование {encode_ms:.0f}ms, разбор (json.loads) {parse_ms:.0f}ms")
+
+    # Оба формата кодируются так же, как в GET /api/transactions: JSONResponse без jsonable_encoder
+    measure("Строки", False, lambda data: JSONResponse(content=data).body)
+    measure("Столбцы", True, lambda data: JSONResponse(content=data).body)
+    print("Время разбора в браузере выводится в консоль (console.debug) при загрузке транзакций")
+
+
+def _random_word(rnd, letters="абвгдежзиклмнопрстуфхцчшэюя"):
+    return "".join(rnd.choice(letters) for _ in range(rnd.randint(4, 9)))
+
+
+def _random_rules(count: int, category_ids, rnd):
+    """Правила как строки таблицы: в основном подстроки, 1% - регулярные выражения"""
+    rules = []
+    for rule_id in range(1, count + 1):
+        is_regex = rule_id % 100 == 0
+        rules.append({
+            'id': rule_id,
+            'category_id': rnd.choice(category_ids),
+            'pattern': rf"{_random_word(rnd)}\s+\d{{3}}" if is_regex else _random_word(rnd),
+            'match_type': 'regex' if is_regex else 'contains',
+            'amount_min': 100.0 if rule_id % 10 == 0 else None,
+            'amount_max': None,
+            'weekdays': "5,6" if rule_id % 50 == 0 else None,
+            'priority': rnd.randint(1, 200)
+        })
+    return rules
+
+
+def bench_categorize(args):
+    """Категоризация по правилам: стоимость на описание при росте числа правил"""
+    rnd = random.Random(3)
+    category_ids = list(range(1, 30))
+    rules = _random_rules(args.rules, category_ids, rnd)
+    vocabulary = [rule['pattern'] for rule in rules if rule['match_type'] == 'contains']
+    noise = [_random_word(rnd) for _ in range(5000)]
+    descriptions = []
+    for _ in range(args.descriptions):
+        words = [rnd.choice(noise) for _ in range(rnd.randint(2, 5))]
+        if rnd.random() < 0.5:
+            words.insert(rnd.randrange(len(words) + 1), rnd.choice(vocabulary).upper())
+        descriptions.append((" ".join(words), round(rnd.uniform(10, 5000), 2),
+                             date(2025, 1, 1) + timedelta(days=rnd.randrange(365))))
+
+    print(f"Автомат Ахо-Корасик: {'pyahocorasick' if categorizer.ahocorasick else 'чистый Python'}")
+    sample = descriptions[:args.sample]
+    for count in sorted({100, 1000, args.rules}):
+        if count > args.rules:
+            continue
+        started = time.perf_counter()
+        matcher = categorizer.RuleMatcher(rules[:count])
+        compile_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        for description, amount, transaction_date in sample:
+            matcher.match(description, amount, transaction_date)
+        per_item_us = (time.perf_counter() - started) / len(sample) * 1e6
+        print(f"{count} правил: компиляция {compile_ms:.0f}ms, {per_item_us:.1f} мкс на описание")
+
+    # Наивный перебор правил для сравнения (только на выборке)
+    naive_rules = sorted(rules, key=lambda rule: (rule['priority'], rule['id']))
+    started = time.perf_counter()
+    for description, amount, transaction_date in sample[:2000]:
+        text = description.casefold()
+        for rule in naive_rules:
+            if rule['match_type'] == 'contains' and rule['pattern'] in text:
+                break
+    print(f"Перебор {args.rules} правил: "
+          f"{(time.perf_counter() - started) / min(len(sample), 2000) * 1e6:.1f} мкс на описание")
+
+    matcher = categorizer.RuleMatcher(rules)
+    started = time.perf_counter()
+    matched = sum(1 for item in descriptions if matcher.match(*item) is not None)
+    elapsed = time.perf_counter() - started
+    print(f"{args.rules} правил x {len(descriptions)} описаний: {elapsed:.1f}с "
+          f"({len(descriptions) / elapsed:.0f} описаний/с), с категорией {matched}")
+
+    # Переприменение правил к истории в БД одним пакетным UPDATE
+    if args.apply_rows:
+        db_category_ids = seed_transactions(args.apply_rows)
+        with database.get_db() as conn:
+            conn.executemany(
+                '''INSERT INTO category_rules (category_id, pattern, match_type, amount_min, weekdays, priority)
+                   VALUES (?, ?, ?, ?, ?, ?)''',
+                [(rnd.choice(db_category_ids), f"Операция {i}", 'contains', None, None, 100)
+                 for i in range(0, 1000, 7)]
+            )
+            database.bump_rules_version(conn)
+            conn.commit()
+        started = time.perf_counter()
+        updated, error = crud.apply_rules()
+        if error:
+            raise RuntimeError(error)
+        print(f"apply_rules на {args.apply_rows} транзакциях: {time.perf_counter() - started:.1f}с, "
+              f"изменено {updated}")
+
+
+def bench_group_commit(args):
+    """Записей в секунду при разном числе одновременных клиентов: коммит на операцию и групповой"""
+    category_id = seed_transactions(args.rows)[0]
+    with database.get_db() as conn:
+        conn.execute(f"PRAGMA synchronous={args.synchronous}")
+
+    modes = [("коммит на операцию", 1, 0), ("групповой коммит", args.batch_max, args.window_ms)]
+    for clients in [int(n) for n in args.clients.split(",")]:
+        for title, batch_max, window_ms in modes:
+            config.WRITE_BATCH_MAX = batch_max
+            config.WRITE_BATCH_WINDOW_MS = window_ms
+            with ThreadPoolExecutor(clients) as pool:
+                started = time.perf_counter()
+                runs = list(pool.map(lambda _: measure_writes(category_id, args.duration), range(clients)))
+                elapsed = time.perf_counter() - started
+            latencies = [latency for run in runs for latency in run]
+            print(f"Клиентов: {clients:>3}, {title}: {len(latencies) / elapsed:.0f} записей/с, "
+                  f"p50={percentile(latencies, 50):.2f}ms p99={percentile(latencies, 99):.2f}ms")
+
+
+def bench_recategorize(args):
+    """Объединение категорий и массовая смена категории на больших данных"""
+    seed_transactions(args.rows)
+    with database.get_db() as conn:
+        expense_ids = [row['id'] for row in conn.execute(
+            "SELECT id FROM categories WHERE type = 'expense' ORDER BY id"
+        )]
+        for category_id in expense_ids:
+            conn.execute(
+                "INSERT INTO budgets (category_id, period, amount, alert_threshold) VALUES (?, 'month', 1000, 80)",
+                (category_id,)
+            )
+        conn.commit()
+    source, target, other = expense_ids[:3]
+
+    started = time.perf_counter()
+    moved, error = crud.merge_category(source, target)
+    if error:
+        raise RuntimeError(error)
+    print(f"Объединение категорий: {moved} транзакций за {time.perf_counter() - started:.2f}с")
+
+    transaction_filter = TransactionFilter(category_ids=[target], amount_min=Decimal("2500"))
+    started = time.perf_counter()
+    updated, error = crud.recategorize_transactions(other, filter=transaction_filter)
+    if error:
+        raise RuntimeError(error)
+    print(f"Смена категории по фильтру: {updated} транзакций за {time.perf_counter() - started:.2f}с")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки финансового трекера")
+    parser.add_argument("--seed-cache", help="папка для заполненных БД: повторные запуски копируют их "
+                                             "(Connection.backup) вместо генерации данных")
+    subparsers = parser.add_subparsers(dest="scenario", required=True)
+
+    stress = subparsers.add_parser("analytics-stress", help="задержка записи на фоне аналитики")
+    stress.add_argument("--rows", type=int, default=200_000)
+    stress.add_argument("--duration", type=float, default=5.0)
+    stress.add_argument("--readers", type=int, default=2)
+    stress.set_defaults(func=bench_analytics_stress)
+
+    engine = subparsers.add_parser("engine", help="SQL против колоночного движка на произвольных периодах")
+    engine.add_argument("--rows", type=int, default=1_000_000)
+    engine.add_argument("--queries", type=int, default=200)
+    engine.set_defaults(func=bench_engine)
+
+    backup_parser = subparsers.add_parser("backup", help="задержка записи во время онлайн-бэкапа")
+    backup_parser.add_argument("--rows", type=int, default=5_000_000)
+    backup_parser.add_argument("--description-size", type=int, default=400,
+                               help="длина описания - для БД размером в несколько ГБ")
+    backup_parser.add_argument("--duration", type=float, default=3.0)
+    backup_parser.add_argument("--pages", type=int, default=64)
+    backup_parser.add_argument("--step-sleep", type=float, default=0.002)
+    backup_parser.set_defaults(func=bench_backup)
+
+    workers = subparsers.add_parser("workers", help="масштабирование чтения по числу воркеров uvicorn")
+    workers.add_argument("--rows", type=int, default=100_000)
+    workers.add_argument("--workers", default="1,2,4,8")
+    workers.add_argument("--clients", type=int, default=16)
+    workers.add_argument("--duration", type=float, default=5.0)
+    workers.add_argument("--port", type=int, default=8111)
+    workers.set_defaults(func=bench_workers)
+
+    columnar = subparsers.add_parser("columnar", help="строки против столбцов в списке транзакций")
+    columnar.add_argument("--rows", type=int, default=50_000)
+    columnar.set_defaults(func=bench_columnar)
+
+    categorize = subparsers.add_parser("categorize", help="автоматическая категоризация по правилам")
+    categorize.add_argument("--rules", type=int, default=10_000)
+    categorize.add_argument("--descriptions", type=int, default=1_000_000)
+    categorize.add_argument("--sample", type=int, default=50_000,
+                            help="описаний для замера при разном числе правил")
+    categorize.add_argument("--apply-rows", type=int, default=200_000,
+                            help="транзакций в БД для apply_rules (0 - пропустить)")
+    categorize.set_defaults(func=bench_categorize)
+
+    group_commit = subparsers.add_parser("group-commit", help="пропускная способность записи по числу клиентов")
+    group_commit.add_argument("--rows", type=int, default=100_000)
+    group_commit.add_argument("--clients", default="1,10,100")
+    group_commit.add_argument("--duration", type=float, default=3.0)
+    group_commit.add_argument("--batch-max", type=int, default=config.WRITE_BATCH_MAX)
+    group_commit.add_argument("--window-ms", type=float, default=config.WRITE_BATCH_WINDOW_MS)
+    group_commit.add_argument("--synchronous", choices=["NORMAL", "FULL"], default="NORMAL",
+                              help="FULL - fsync на каждый коммит")
+    group_commit.set_defaults(func=bench_group_commit)
+
+    recategorize = subparsers.add_parser("recategorize", help="объединение категорий и массовая смена категории")
+    recategorize.add_argument("--rows", type=int, default=1_000_000)
+    recategorize.set_defaults(func=bench_recategorize)
+
+    args = parser.parse_args()
+    if args.seed_cache:
+        global SEED_CACHE_DIR
+        SEED_CACHE_DIR = os.path.join(START_DIR, args.seed_cache)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""Автоматическая категоризация транзакций по правилам.
+
+Правило (таблица category_rules) сопоставляет транзакции категорию по условиям:
+подстрока или регулярное выражение в описании, диапазон суммы, дни недели.
+Приоритетнее правило с меньшим priority (при равенстве - более раннее).
+
+Все правила компилируются в один RuleMatcher:
+- подстроки - в автомат Ахо-Корасик (один проход по описанию находит все
+  ключевые слова сразу, независимо от их количества);
+- у регулярного выражения, начинающегося с литерала, этот литерал тоже
+  добавляется в автомат: выражение проверяется, только если литерал найден;
+- остальные регулярные выражения без групп объединяются в одно, которое служит
+  быстрым отсевом: отдельные выражения проверяются, только если оно сработало.
+
+Скомпилированный матчер кэшируется до изменения набора правил.
+"""
+import re
+import threading
+from collections import deque
+from datetime import date
+
+from database import on_configure, get_rules_version
+
+try:
+    import ahocorasick  # pyahocorasick - реализация на C, необязательна
+except ImportError:
+    ahocorasick = None
+
+
+class _Automaton:
+    """Автомат Ахо-Корасик на чистом Python (если pyahocorasick не установлен)"""
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+
+    def add_word(self, word: str, value):
+        state = 0
+        for char in word:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = next_state
+        self._out[state] = (value,)
+
+    def make_automaton(self):
+        # Обход в ширину: ссылка неудачи и выходы суффиксов для каждого состояния
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, next_state in self._goto[state].items():
+                pending.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[next_state] = fail
+                self._out[next_state] += self._out[fail]
+
+    def values(self, text: str):
+        """Значения всех слов, встречающихся в тексте"""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                yield from out[state]
+
+
+class _Rule:
+    __slots__ = ('order', 'category_id', 'amount_min', 'amount_max', 'weekdays', 'regex')
+
+    def __init__(self, row):
+        self.order = (row['priority'], row['id'])
+        self.category_id = row['category_id']
+        self.amount_min = row['amount_min']
+        self.amount_max = row['amount_max']
+        self.weekdays = frozenset(int(day) for day in row['weekdays'].split(",")) if row['weekdays'] else None
+        self.regex = None
+
+    def accepts(self, amount: float, weekday: int):
+        """Условия правила, кроме текстового"""
+        if self.amount_min is not None and amount < self.amount_min:
+            return False
+        if self.amount_max is not None and amount > self.amount_max:
+            return False
+        return self.weekdays is None or weekday in self.weekdays
+
+
+def compile_regex(pattern: str):
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def _combinable(regex):
+    """Можно ли включить выражение в общий отсев (без групп и глобальных флагов)"""
+    if regex.groups:
+        return False
+    try:
+        compile_regex(f"(?:{regex.pattern})")
+    except re.error:
+        return False
+    return True
+
+
+_REGEX_SPECIAL = set(".^$*+?{}[]\\|()")
+_MIN_LITERAL = 3
+
+
+def literal_prefix(pattern: str):
+    """Литерал, без которого выражение не может совпасть, или None"""
+    if "|" in pattern:
+        return None
+    start = 1 if pattern.startswith("^") else 0
+    end = start
+    while end < len(pattern) and pattern[end] not in _REGEX_SPECIAL:
+        end += 1
+    # Квантификатор после литерала относится к его последнему символу
+    if end < len(pattern) and pattern[end] in "*?{":
+        end -= 1
+    literal = pattern[start:end]
+    return literal.casefold() if len(literal) >= _MIN_LITERAL else None
+
+
+class RuleMatcher:
+    """Все правила, скомпилированные в один матчер"""
+
+    def __init__(self, rows):
+        keywords = {}
+        self._plain = []   # правила без текстового условия
+        self._regex = []
+        for row in rows:
+            rule = _Rule(row)
+            if not row['pattern']:
+                self._plain.append(rule)
+            elif row['match_type'] == 'regex':
+                rule.regex = compile_regex(row['pattern'])
+                literal = literal_prefix(row['pattern'])
+                if literal:
+                    keywords.setdefault(literal, []).append(rule)
+                else:
+                    self._regex.append(rule)
+            else:
+                keywords.setdefault(row['pattern'].casefold(), []).append(rule)
+
+        self.size = len(rows)
+        self._automaton = None
+        if keywords:
+            self._automaton = ahocorasick.Automaton() if ahocorasick else _Automaton()
+            for keyword, rules in keywords.items():
+                self._automaton.add_word(keyword, tuple(rules))
+            self._automaton.make_automaton()
+
+        self._regex.sort(key=lambda rule: rule.order)
+        # Выражения с группами объединять нельзя: номера групп сдвигаются (обратная ссылка \1
+        # укажет на чужую группу), именованные группы повторяются. Такие выражения
+        # проверяются всегда, остальные - только после срабатывания общего отсева
+        combinable, self._standalone = [], []
+        for rule in self._regex:
+            (combinable if _combinable(rule.regex) else self._standalone).append(rule)
+        self._combined = None
+        if combinable:
+            self._combined = compile_regex("|".join(f"(?:{rule.regex.pattern})" for rule in combinable))
+
+    def _keyword_rules(self, text: str):
+        if self._automaton is None:
+            return ()
+        if ahocorasick:
+            return (rules for _, rules in self._automaton.iter(text))
+        return self._automaton.values(text)
+
+    def match(self, description, amount, transaction_date):
+        """Категория по первому подходящему правилу или None"""
+        amount = float(amount)
+        if isinstance(transaction_date, str):
+            transaction_date = date.fromisoformat(transaction_date)
+        weekday = transaction_date.weekday()
+
+        best = None
+        for rule in self._plain:
+            if (best is None or rule.order < best.order) and rule.accepts(amount, weekday):
+                best = rule
+
+        if description:
+            for rules in self._keyword_rules(description.casefold()):
+                for rule in rules:
+                    if ((best is None or rule.order < best.order) and rule.accepts(amount, weekday)
+                            and (rule.regex is None or rule.regex.search(description))):
+                        best = rule
+
+            if self._regex:
+                rules = self._standalone
+                if self._combined is None or self._combined.search(description):
+                    rules = self._regex
+                for rule in rules:
+                    if best is not None and rule.order > best.order:
+                        break
+                    if rule.accepts(amount, weekday) and rule.regex.search(description):
+                        best = rule
+                        break
+
+        return best.category_id if best else None
+
+
+_cache_lock = threading.Lock()
+_cache = (None, None)  # (версия набора правил, матчер)
+
+
+@on_configure
+def _reset_cache():
+    global _cache
+    with _cache_lock:
+        _cache = (None, None)
+
+
+def load_rules(conn):
+    """Правила активных категорий"""
+    return conn.execute('''
+        SELECT r.*
+        FROM category_rules r
+        JOIN categories c ON r.category_id = c.id
+        WHERE c.is_active = TRUE
+    ''').fetchall()
+
+
+def get_matcher(conn):
+    """Скомпилированный матчер текущего набора правил.
+
+    Кэш проверяется по версии набора правил (rules_state): её увеличивает каждое
+    изменение правил и активности категорий, в том числе в другом процессе.
+    """
+    global _cache
+    version = get_rules_version(conn)
+    with _cache_lock:
+        cached_version, matcher = _cache
+        if cached_version != version:
+            matcher = RuleMatcher(load_rules(conn))
+            _cache = (version, matcher)
+        return matcher
@@ -0,0 +1,79 @@
+"""Настройки приложения (переопределяются переменными окружения)"""
+import atexit
+import os
+import shutil
+import tempfile
+
+
+def _env_flag(name: str, default: bool = False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# Число процессов uvicorn при запуске через python main.py
+WORKERS = int(os.environ.get("FINANCE_WORKERS", "1"))
+
+# Папка данных: БД, снимки движка, архивы, копии и служебные блокировки
+DATA_DIR = os.environ.get("FINANCE_DATA_DIR", "data")
+
+# Файл БД. Особые значения для тестов и бенчмарков:
+#   ":temp:" - новая БД во временной папке данных на каждый запуск;
+#   ":memory:" (или file::memory:?cache=shared) - новая БД в tmpfs (/dev/shm, если есть),
+#   удаляется при выходе. Это обычный файл в режиме WAL: читатели работают со снимками,
+#   как и с БД на диске, а дочерние процессы открывают ту же БД
+DATABASE_PATH = os.environ.get("FINANCE_DATABASE") or os.path.join(DATA_DIR, "finance.db")
+if DATABASE_PATH == "file::memory:?cache=shared":
+    DATABASE_PATH = ":memory:"
+if DATABASE_PATH in (":temp:", ":memory:"):
+    _in_memory = DATABASE_PATH == ":memory:"
+    _database_dir = tempfile.mkdtemp(
+        prefix="finance_", dir="/dev/shm" if _in_memory and os.path.isdir("/dev/shm") else None
+    )
+    if not _in_memory or "FINANCE_DATA_DIR" not in os.environ:
+        # Блокировки и снимки движка не должны пересекаться с рабочей папкой data
+        DATA_DIR = _database_dir
+    if _in_memory:
+        atexit.register(shutil.rmtree, _database_dir, ignore_errors=True)
+    DATABASE_PATH = os.path.join(_database_dir, "finance.db")
+    # Дочерние процессы (воркеры uvicorn, пул отчетов) должны открыть ту же БД
+    os.environ.update(FINANCE_DATA_DIR=DATA_DIR, FINANCE_DATABASE=DATABASE_PATH)
+
+# Групповой коммит: изменения транзакций копятся до WRITE_BATCH_WINDOW_MS
+# (или до WRITE_BATCH_MAX операций) и записываются одним коммитом
+WRITE_BATCH_MAX = int(os.environ.get("FINANCE_WRITE_BATCH_MAX", "100"))
+WRITE_BATCH_WINDOW_MS = float(os.environ.get("FINANCE_WRITE_BATCH_WINDOW_MS", "0"))
+
+# Колоночный аналитический движок в памяти (требует numpy)
+ANALYTICS_ENGINE_ENABLED = _env_flag("FINANCE_ANALYTICS_ENGINE")
+ANALYTICS_ENGINE_DIR = os.environ.get("FINANCE_ANALYTICS_ENGINE_DIR", os.path.join(DATA_DIR, "engine"))
+
+# Архив закрытых лет: по одному файлу SQLite на год
+ARCHIVE_DIR = os.environ.get("FINANCE_ARCHIVE_DIR", os.path.join(DATA_DIR, "archive"))
+
+# Резервные копии: онлайн-бэкап порциями страниц с паузами, чтобы не мешать записи
+BACKUP_DIR = os.environ.get("FINANCE_BACKUP_DIR", os.path.join(DATA_DIR, "backups"))
+BACKUP_INTERVAL_HOURS = float(os.environ.get("FINANCE_BACKUP_INTERVAL_HOURS", "0"))  # 0 - без расписания
+BACKUP_KEEP = int(os.environ.get("FINANCE_BACKUP_KEEP", "7"))
+BACKUP_PAGES_PER_STEP = int(os.environ.get("FINANCE_BACKUP_PAGES_PER_STEP", "64"))
+BACKUP_STEP_SLEEP = float(os.environ.get("FINANCE_BACKUP_STEP_SLEEP", "0.002"))
+
+# Профилирование отдельных запросов: запрос с заголовком X-Profile: <токен>
+# (или параметром ?profile=<токен>) выполняется под cProfile
+PROFILING_ENABLED = _env_flag("FINANCE_PROFILING")
+PROFILING_TOKEN = os.environ.get("FINANCE_PROFILING_TOKEN", "")
+PROFILING_DIR = os.environ.get("FINANCE_PROFILING_DIR", os.path.join(DATA_DIR, "profiles"))
+PROFILING_KEEP = int(os.environ.get("FINANCE_PROFILING_KEEP", "50"))
+
+# Поиск аномалий трат (требует numpy): фоновый пересчет измененных дней
+ANOMALY_INTERVAL_SECONDS = float(os.environ.get("FINANCE_ANOMALY_INTERVAL_SECONDS", "60"))  # 0 - без фона
+ANOMALY_WINDOW_DAYS = int(os.environ.get("FINANCE_ANOMALY_WINDOW_DAYS", "60"))
+ANOMALY_MIN_ACTIVE_DAYS = int(os.environ.get("FINANCE_ANOMALY_MIN_ACTIVE_DAYS", "5"))
+ANOMALY_Z_THRESHOLD = float(os.environ.get("FINANCE_ANOMALY_Z_THRESHOLD", "3.5"))
+ANOMALY_LARGE_FACTOR = float(os.environ.get("FINANCE_ANOMALY_LARGE_FACTOR", "5"))
+
+# Фоновые отчеты: процессы для построения и ограничение очереди
+REPORTS_WORKERS = int(os.environ.get("FINANCE_REPORTS_WORKERS", "2"))
+REPORTS_MAX_PENDING = int(os.environ.get("FINANCE_REPORTS_MAX_PENDING", "8"))
+REPORTS_KEEP = int(os.environ.get("FINANCE_REPORTS_KEEP", "200"))
@@ -1,13 +1,107 @@
 from datetime import date, timedelta
 from decimal import Decimal
+from functools import partial
+import hashlib
+import re
 import sqlite3
-from database import get_db, calculate_period_dates
-from models import TransactionCreate, CategoryCreate, TransactionUpdate
+from database import (get_db, get_read_db, calculate_period_dates, calculate_rolling_periods,
+                      bump_ledger_generation, get_ledger_generation, ledger_source, current_generation,
+                      bump_rules_version, get_rules_version, ledger_changes_since)
+import analytics_engine
+import categorizer
+import writer
+from profiling import section
+from filters import compile_filter
+from models import (TransactionCreate, CategoryCreate, TransactionUpdate, BudgetCreate, CompareRequest,
+                    TransactionFilter, CategoryRuleCreate)
+
+
+def _month_end(month_start: date):
+    """Последний день месяца"""
+    return (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+
+def _budget_period(budget, on_date: date):
+    """Период бюджета, в который попадает дата, или (None, None)"""
+    if budget['period'] == 'month':
+        start = on_date.replace(day=1)
+        return start, _month_end(start)
+
+    start = date.fromisoformat(budget['start_date'])
+    end = date.fromisoformat(budget['end_date'])
+    if start <= on_date <= end:
+        return start, end
+    return None, None
+
+
+def _alert_level(spent, amount, threshold):
+    """Максимальный достигнутый порог (0, threshold или 100)"""
+    if amount <= 0:
+        return 0
+    percent = spent * 100 / amount
+    if percent >= 100:
+        return 100
+    if percent >= threshold:
+        return threshold
+    return 0
+
+
+def _apply_budget_delta(conn, *changes):
+    """Инкрементально обновить счетчики трат бюджетов и проверить пороги.
+
+    changes - кортежи (category_id, дата транзакции, изменение суммы).
+    """
+    deltas = {}
+    budgets_by_category = {}
+    for category_id, transaction_date, delta in changes:
+        if not delta:
+            continue
+        if isinstance(transaction_date, str):
+            transaction_date = date.fromisoformat(transaction_date)
+
+        budgets = budgets_by_category.get(category_id)
+        if budgets is None:
+            budgets = budgets_by_category[category_id] = conn.execute(
+                "SELECT * FROM budgets WHERE category_id = ? AND is_active = TRUE",
+                (category_id,)
+            ).fetchall()
+        for budget in budgets:
+            period_start, _ = _budget_period(budget, transaction_date)
+            if period_start:
+                key = (budget['id'], period_start)
+                deltas[key] = (budget, deltas.get(key, (budget, 0))[1] + delta)
+
+    for (budget_id, period_start), (budget, delta) in deltas.items():
+        conn.execute(
+            '''INSERT INTO budget_spend (budget_id, period_start, spent) VALUES (?, ?, ?)
+               ON CONFLICT (budget_id, period_start) DO UPDATE SET spent = ROUND(spent + excluded.spent, 2)''',
+            (budget_id, period_start, delta)
+        )
+        spend = conn.execute(
+            "SELECT spent, alert_level FROM budget_spend WHERE budget_id = ? AND period_start = ?",
+            (budget_id, period_start)
+        ).fetchone()
+
+        level = _alert_level(spend['spent'], budget['amount'], budget['alert_threshold'])
+        if level == spend['alert_level']:
+            continue
+
+        # Порог пересечен вверх - фиксируем уведомление
+        if level > spend['alert_level']:
+            conn.execute(
+                '''INSERT INTO budget_alerts (budget_id, period_start, threshold, spent, amount)
+                   VALUES (?, ?, ?, ?, ?)''',
+                (budget_id, period_start, level, spend['spent'], budget['amount'])
+            )
+        conn.execute(
+            "UPDATE budget_spend SET alert_level = ? WHERE budget_id = ? AND period_start = ?",
+            (level, budget_id, period_start)
+        )
 
 
 def get_categories(category_type: str = None):
     """Получить список категорий"""
-    with get_db() as conn:
+    with get_read_db() as conn:
         query = "SELECT * FROM categories WHERE is_active = TRUE"
         params = []
 
@@ -36,36 +130,89 @@ def create_category(category: CategoryCreate):
         return None, f"Ошибка базы данных: {str(e)}"
 
 
+# Ответ API - 409: транзакции архивных лет только читаются (см. archive.py)
+ARCHIVED_YEAR_ERROR = "Транзакция относится к архивному году: архив доступен только для чтения"
+
+
+def _in_archived_year(conn, transaction_date):
+    """Попадает ли дата в архивный год"""
+    year = transaction_date.year if isinstance(transaction_date, date) else int(str(transaction_date)[:4])
+    return conn.execute("SELECT 1 FROM archived_years WHERE year = ?", (year,)).fetchone() is not None
+
+
+def _is_archived_transaction(transaction_id: int):
+    """Есть ли транзакция в архивах (её нет в горячей таблице, но её показывает ledger_source).
+
+    Архивы подключаются на отдельном читающем соединении: писатель внутри транзакции
+    не может выполнить ATTACH.
+    """
+    with get_read_db() as conn:
+        source, attached = ledger_source(conn)
+        return attached and conn.execute(f"SELECT 1 FROM {source} t WHERE t.id = ?",
+                                         (transaction_id,)).fetchone() is not None
+
+
 def create_transaction(transaction: TransactionCreate):
-    """Создать новую транзакцию"""
-    try:
-        with get_db() as conn:
-            # Проверяем существование категории
-            category_exists = conn.execute(
-                "SELECT id, type FROM categories WHERE id = ? AND is_active = TRUE",
-                (transaction.category_id,)
-            ).fetchone()
+    """Создать новую транзакцию (без category_id категория определяется правилами)"""
+    return writer.execute(insert_transaction, transaction)
 
-            if not category_exists:
-                return None, "Категория не найдена или неактивна"
 
-            cursor = conn.execute(
-                "INSERT INTO transactions (amount, category_id, date, description) VALUES (?, ?, ?, ?)",
-                (float(transaction.amount), transaction.category_id, transaction.date, transaction.description)
-            )
-            conn.commit()
-            return cursor.lastrowid, None
-    except sqlite3.Error as e:
-        return None, f"Ошибка базы данных: {str(e)}"
+def insert_transaction(conn, transaction: TransactionCreate):
+    """Операция писателя (writer): вставить транзакцию в общей транзакции пачки"""
+    category_id = transaction.category_id
+    if category_id is None:
+        category_id = categorizer.get_matcher(conn).match(
+            transaction.description, transaction.amount, transaction.date
+        )
+        if category_id is None:
+            return None, "Категория не указана и ни одно правило категоризации не подошло", None
+
+    # Проверяем существование категории
+    category_exists = conn.execute(
+        "SELECT id, type FROM categories WHERE id = ? AND is_active = TRUE",
+        (category_id,)
+    ).fetchone()
 
+    if not category_exists:
+        return None, "Категория не найдена или неактивна", None
 
-def get_transactions(start_date: date = None, end_date: date = None, include_savings: bool = True):
-    """Получить транзакции за период"""
+    if _in_archived_year(conn, transaction.date):
+        return None, ARCHIVED_YEAR_ERROR, None
+
+    cursor = conn.execute(
+        "INSERT INTO transactions (amount, category_id, date, description) VALUES (?, ?, ?, ?)",
+        (float(transaction.amount), category_id, transaction.date, transaction.description)
+    )
+    _apply_budget_delta(conn, (category_id, transaction.date, float(transaction.amount)))
+    generation = bump_ledger_generation(conn, transaction.date)
+
+    return cursor.lastrowid, None, partial(analytics_engine.apply_change, generation, added=(
+        cursor.lastrowid, transaction.date, transaction.amount,
+        category_id, category_exists['type']
+    ))
+
+
+TRANSACTION_FIELDS = ('id', 'amount', 'category_id', 'date', 'description', 'created_at')
+
+
+def get_transactions(start_date: date = None, end_date: date = None, include_savings: bool = True,
+                     columnar: bool = False, filter: TransactionFilter = None):
+    """Получить транзакции за период.
+
+    columnar=True - компактный формат: массивы по столбцам и словарь категорий,
+    который передается один раз, а не повторяется в каждой строке.
+    filter - дополнительные условия (см. filters.py).
+    """
     try:
-        with get_db() as conn:
-            query = '''
-                SELECT t.*, c.name as category_name, c.type as category_type, c.color as category_color
-                FROM transactions t
+        with get_read_db() as conn:
+            source, _ = ledger_source(conn, start_date, end_date)
+            if columnar:
+                fields = ", ".join(f"t.{field}" for field in TRANSACTION_FIELDS)
+            else:
+                fields = "t.*, c.name as category_name, c.type as category_type, c.color as category_color"
+            query = f'''
+                SELECT {fields}
+                FROM {source} t
                 JOIN categories c ON t.category_id = c.id
                 WHERE 1=1
             '''
@@ -81,200 +228,899 @@ def get_transactions(start_date: date = None, end_date: date = None, include_sav
             if not include_savings:
                 query += " AND c.type NOT IN ('savings_income', 'savings_expense')"
 
+            filter_sql, filter_params = compile_filter(filter)
+            query += filter_sql
+            params += filter_params
+
             query += " ORDER BY t.date DESC, t.created_at DESC"
 
-            transactions = conn.execute(query, params).fetchall()
-            return [dict(tran) for tran in transactions], None
+            if columnar:
+                # Кортежи вместо sqlite3.Row: транспонирование через zip без построения словарей
+                conn.row_factory = None
+                with section("sql"):
+                    transactions = conn.execute(query, params).fetchall()
+                    categories = conn.execute("SELECT id, name, type, color FROM categories").fetchall()
+                with section("rows"):
+                    columns = list(zip(*transactions)) or [()] * len(TRANSACTION_FIELDS)
+                    used = set(columns[2])
+                    return {
+                        'format': 'columnar',
+                        'count': len(transactions),
+                        'columns': {field: list(values) for field, values in zip(TRANSACTION_FIELDS, columns)},
+                        'categories': {
+                            category_id: {'name': name, 'type': category_type, 'color': color}
+                            for category_id, name, category_type, color in categories if category_id in used
+                        }
+                    }, None
+
+            with section("sql"):
+                transactions = conn.execute(query, params).fetchall()
+            with section("rows"):
+                return [dict(tran) for tran in transactions], None
     except sqlite3.Error as e:
         return None, f"Ошибка базы данных: {str(e)}"
 
 
+def get_transactions_etag(*parts):
+    """ETag списка транзакций: поколение журнала, параметры запроса и справочник категорий.
+
+    Вычисляется до чтения самих транзакций: если журнал изменится между ними,
+    клиент получит более старый ETag и при следующей проверке просто загрузит
+    список заново. Категории входят в ETag, потому что их названия и цвета
+    меняются без нового поколения журнала.
+    """
+    generation = current_generation()
+    with get_read_db() as conn:
+        categories = conn.execute("SELECT id, name, type, color, is_active FROM categories ORDER BY id").fetchall()
+    digest = hashlib.sha1(repr((parts, [tuple(c) for c in categories])).encode()).hexdigest()[:16]
+    return f'"{generation}-{digest}"'
+
+
 # ПЕРЕИМЕНОВАЛИ ФУНКЦИЮ чтобы избежать конфликта имен
 def update_transaction_crud(transaction_id: int, transaction_update: TransactionUpdate):
     """Обновить транзакцию"""
-    try:
-        with get_db() as conn:
-            # Проверяем существование транзакции
-            transaction_exists = conn.execute(
-                "SELECT id FROM transactions WHERE id = ?",
-                (transaction_id,)
-            ).fetchone()
+    return writer.execute(update_transaction_row, transaction_id, transaction_update)
 
-            if not transaction_exists:
-                return None, "Транзакция не найдена"
 
-            # Проверяем существование категории
-            category_exists = conn.execute(
-                "SELECT id FROM categories WHERE id = ? AND is_active = TRUE",
-                (transaction_update.category_id,)
-            ).fetchone()
+def update_transaction_row(conn, transaction_id: int, transaction_update: TransactionUpdate):
+    """Операция писателя (writer): обновить транзакцию"""
+    # Проверяем существование транзакции
+    transaction_exists = conn.execute(
+        '''SELECT t.id, t.date, t.amount, t.category_id, c.type as category_type
+           FROM transactions t JOIN categories c ON t.category_id = c.id
+           WHERE t.id = ?''',
+        (transaction_id,)
+    ).fetchone()
 
-            if not category_exists:
-                return None, "Категория не найдена или неактивна"
+    if not transaction_exists:
+        if _is_archived_transaction(transaction_id):
+            return None, ARCHIVED_YEAR_ERROR, None
+        return None, "Транзакция не найдена", None
 
-            # ОБНОВЛЯЕМ ВСЕ ПОЛЯ БЕЗ ПРОВЕРОК
-            conn.execute(
-                "UPDATE transactions SET amount = ?, category_id = ?, date = ?, description = ? WHERE id = ?",
-                (
-                    float(transaction_update.amount),
-                    transaction_update.category_id,
-                    transaction_update.date,
-                    transaction_update.description,
-                    transaction_id
-                )
-            )
-            conn.commit()
+    # Проверяем существование категории
+    category_exists = conn.execute(
+        "SELECT id, type FROM categories WHERE id = ? AND is_active = TRUE",
+        (transaction_update.category_id,)
+    ).fetchone()
 
-            return transaction_id, None
+    if not category_exists:
+        return None, "Категория не найдена или неактивна", None
 
-    except sqlite3.Error as e:
-        return None, f"Ошибка базы данных: {str(e)}"
+    # Перенос в архивный год тоже запрещен: итоги архива заморожены
+    if _in_archived_year(conn, transaction_update.date):
+        return None, ARCHIVED_YEAR_ERROR, None
+
+    # ОБНОВЛЯЕМ ВСЕ ПОЛЯ БЕЗ ПРОВЕРОК
+    conn.execute(
+        "UPDATE transactions SET amount = ?, category_id = ?, date = ?, description = ? WHERE id = ?",
+        (
+            float(transaction_update.amount),
+            transaction_update.category_id,
+            transaction_update.date,
+            transaction_update.description,
+            transaction_id
+        )
+    )
+    _apply_budget_delta(
+        conn,
+        (transaction_exists['category_id'], transaction_exists['date'], -transaction_exists['amount']),
+        (transaction_update.category_id, transaction_update.date, float(transaction_update.amount))
+    )
+    generation = bump_ledger_generation(conn, transaction_exists['date'], transaction_update.date)
+
+    return transaction_id, None, partial(
+        analytics_engine.apply_change,
+        generation,
+        removed=tuple(transaction_exists),
+        added=(transaction_id, transaction_update.date, transaction_update.amount,
+               transaction_update.category_id, category_exists['type'])
+    )
 
 
 # ПЕРЕИМЕНОВАЛИ ФУНКЦИЮ чтобы избежать конфликта имен
 def delete_transaction_crud(transaction_id: int):
     """Удалить транзакцию"""
-    try:
-        with get_db() as conn:
-            # Проверяем существование транзакции
-            transaction_exists = conn.execute(
-                "SELECT id FROM transactions WHERE id = ?",
-                (transaction_id,)
-            ).fetchone()
+    return writer.execute(delete_transaction_row, transaction_id)
 
-            if not transaction_exists:
-                return None, "Транзакция не найдена"
 
-            conn.execute("DELETE FROM transactions WHERE id = ?", (transaction_id,))
-            conn.commit()
+def delete_transaction_row(conn, transaction_id: int):
+    """Операция писателя (writer): удалить транзакцию"""
+    # Проверяем существование транзакции
+    transaction_exists = conn.execute(
+        '''SELECT t.id, t.date, t.amount, t.category_id, c.type as category_type
+           FROM transactions t JOIN categories c ON t.category_id = c.id
+           WHERE t.id = ?''',
+        (transaction_id,)
+    ).fetchone()
 
-            return transaction_id, None
+    if not transaction_exists:
+        if _is_archived_transaction(transaction_id):
+            return None, ARCHIVED_YEAR_ERROR, None
+        return None, "Транзакция не найдена", None
+
+    conn.execute("DELETE FROM transactions WHERE id = ?", (transaction_id,))
+    _apply_budget_delta(
+        conn, (transaction_exists['category_id'], transaction_exists['date'], -transaction_exists['amount'])
+    )
+    generation = bump_ledger_generation(conn, transaction_exists['date'])
+
+    return transaction_id, None, partial(analytics_engine.apply_change, generation,
+                                         removed=tuple(transaction_exists))
+
+
+def _analytics_from_sql(conn, source, start_date, end_date, include_savings, filter=None):
+    """Части ответа get_analytics, посчитанные запросами к БД"""
+    # Базовые условия WHERE
+    base_where = "WHERE 1=1"
+    base_params = []
+    savings_where = "WHERE 1=1"
+    savings_params = []
+
+    if start_date:
+        base_where += " AND t.date >= ?"
+        base_params.append(start_date)
+        savings_where += " AND t.date >= ?"
+        savings_params.append(start_date)
+    if end_date:
+        base_where += " AND t.date <= ?"
+        base_params.append(end_date)
+        savings_where += " AND t.date <= ?"
+        savings_params.append(end_date)
+
+    filter_sql, filter_params = compile_filter(filter)
+    base_where += filter_sql
+    base_params += filter_params
+    savings_where += filter_sql
+    savings_params += filter_params
+
+    # Общая статистика (исключаем копилку если не запрошено)
+    type_filter = "" if include_savings else " AND c.type NOT IN ('savings_income', 'savings_expense')"
+
+    stats_query = f'''
+        SELECT 
+            COALESCE(SUM(CASE WHEN c.type = 'income' THEN t.amount ELSE 0 END), 0) as total_income,
+            COALESCE(SUM(CASE WHEN c.type = 'expense' THEN t.amount ELSE 0 END), 0) as total_expense,
+            COALESCE(SUM(CASE WHEN c.type = 'savings_income' THEN t.amount ELSE 0 END), 0) as savings_income,
+            COALESCE(SUM(CASE WHEN c.type = 'savings_expense' THEN t.amount ELSE 0 END), 0) as savings_expense
+        FROM {source} t
+        JOIN categories c ON t.category_id = c.id
+        {base_where} {type_filter}
+    '''
+
+    stats = conn.execute(stats_query, base_params).fetchone()
+
+    # Статистика по копилке
+    savings_query = f'''
+        SELECT 
+            COALESCE(SUM(CASE WHEN c.type = 'savings_income' THEN t.amount ELSE 0 END), 0) as savings_income,    -- Из копилки (уменьшение)
+            COALESCE(SUM(CASE WHEN c.type = 'savings_expense' THEN t.amount ELSE 0 END), 0) as savings_expense   -- В копилку (увеличение)
+        FROM {source} t
+        JOIN categories c ON t.category_id = c.id
+        {savings_where} AND c.type IN ('savings_income', 'savings_expense')
+    '''
+    savings_stats = conn.execute(savings_query, savings_params).fetchone()
+
+    # По категориям (с фильтром по копилке)
+    category_query = f'''
+        SELECT 
+            c.name as category_name,
+            c.type as category_type, 
+            c.color as category_color,
+            SUM(t.amount) as total
+        FROM {source} t
+        JOIN categories c ON t.category_id = c.id
+        {base_where} {type_filter}
+        GROUP BY c.id, c.name, c.type, c.color
+        ORDER BY total DESC, c.type 
+    '''
+
+    by_category = conn.execute(category_query, base_params).fetchall()
+
+    # Ежедневные итоги для основной статистики
+    daily_query = f'''
+        SELECT 
+            t.date,
+            SUM(CASE WHEN c.type = 'income' THEN t.amount ELSE 0 END) as income,
+            SUM(CASE WHEN c.type = 'expense' THEN t.amount ELSE 0 END) as expense
+        FROM {source} t
+        JOIN categories c ON t.category_id = c.id
+        {base_where} {type_filter}
+        GROUP BY t.date ORDER BY t.date
+    '''
+
+    daily_totals = conn.execute(daily_query, base_params).fetchall()
+
+    # Ежедневные итоги для копилки (НОВЫЙ ЗАПРОС)
+    savings_daily_query = f'''
+        SELECT 
+            t.date,
+            SUM(CASE WHEN c.type = 'savings_income' THEN t.amount ELSE 0 END) as savings_income,
+            SUM(CASE WHEN c.type = 'savings_expense' THEN t.amount ELSE 0 END) as savings_expense
+        FROM {source} t
+        JOIN categories c ON t.category_id = c.id
+        {savings_where} AND c.type IN ('savings_income', 'savings_expense')
+        GROUP BY t.date ORDER BY t.date
+    '''
+
+    savings_daily_totals = conn.execute(savings_daily_query, savings_params).fetchall()
+
+    return stats, savings_stats, by_category, daily_totals, savings_daily_totals
 
-    except sqlite3.Error as e:
-        return None, f"Ошибка базы данных: {str(e)}"
 
 def get_analytics(period: str = "month", start_date: date = None, end_date: date = None,
-                  group_by: str = "category", include_savings: bool = False):
+                  group_by: str = "category", include_savings: bool = False,
+                  filter: TransactionFilter = None):
     """Получить аналитику по транзакциям"""
     try:
-        with get_db() as conn:
+        # Все запросы аналитики выполняются в одной read-транзакции (единый снимок)
+        with get_read_db() as conn:
             # Определяем период
             if period != 'custom':
                 start_date, end_date = calculate_period_dates(period)
             elif not start_date or not end_date:
                 start_date, end_date = calculate_period_dates('month')
 
-            # Базовые условия WHERE
-            base_where = "WHERE 1=1"
-            base_params = []
-            savings_where = "WHERE 1=1"
-            savings_params = []
+            # Колоночный движок (если включен и актуален) отвечает без сканирования БД.
+            # Движок содержит только горячие данные и не знает фильтров - в этих случаях идем в SQL
+            # Без фильтра запросам хватает даты, категории и суммы - архив читается по итогам дней
+            filtered = bool(compile_filter(filter)[0])
+            source, uses_archive = ledger_source(conn, start_date, end_date, summary=not filtered)
+            engine = None if uses_archive or filtered else analytics_engine.get_engine(get_ledger_generation(conn))
+            if engine is not None:
+                with section("engine"):
+                    parts = analytics_engine.analytics_from_engine(engine, conn, start_date, end_date,
+                                                                   include_savings)
+            else:
+                with section("sql"):
+                    parts = _analytics_from_sql(conn, source, start_date, end_date, include_savings, filter)
+            stats, savings_stats, by_category, daily_totals, savings_daily_totals = parts
 
-            if start_date:
-                base_where += " AND t.date >= ?"
-                base_params.append(start_date)
-                savings_where += " AND t.date >= ?"
-                savings_params.append(start_date)
-            if end_date:
-                base_where += " AND t.date <= ?"
-                base_params.append(end_date)
-                savings_where += " AND t.date <= ?"
-                savings_params.append(end_date)
-
-            # Общая статистика (исключаем копилку если не запрошено)
-            type_filter = "" if include_savings else " AND c.type NOT IN ('savings_income', 'savings_expense')"
-
-            stats_query = f'''
-                SELECT 
-                    COALESCE(SUM(CASE WHEN c.type = 'income' THEN t.amount ELSE 0 END), 0) as total_income,
-                    COALESCE(SUM(CASE WHEN c.type = 'expense' THEN t.amount ELSE 0 END), 0) as total_expense,
-                    COALESCE(SUM(CASE WHEN c.type = 'savings_income' THEN t.amount ELSE 0 END), 0) as savings_income,
-                    COALESCE(SUM(CASE WHEN c.type = 'savings_expense' THEN t.amount ELSE 0 END), 0) as savings_expense
-                FROM transactions t
-                JOIN categories c ON t.category_id = c.id
-                {base_where} {type_filter}
-            '''
+            with section("decimal"):
+                # ИСПРАВЛЯЕМ РАСЧЕТ БАЛАНСА КОПИЛКИ:
+                savings_deposits = Decimal(str(savings_stats['savings_expense']))  # В копилку
+                savings_withdrawals = Decimal(str(savings_stats['savings_income']))  # Из копилки
+                savings_balance = savings_deposits - savings_withdrawals
+                total_income = Decimal(str(stats['total_income']))
+                total_expense = Decimal(str(stats['total_expense']))
+                balance = Decimal(str(stats['total_income'] - stats['total_expense']))
 
-            stats = conn.execute(stats_query, base_params).fetchone()
+            with section("rows"):
+                by_category = [dict(row) for row in by_category]
+                daily_totals = [dict(row) for row in daily_totals]
+                savings_daily_totals = [dict(row) for row in savings_daily_totals]
 
-            # Статистика по копилке
-            savings_query = f'''
-                SELECT 
-                    COALESCE(SUM(CASE WHEN c.type = 'savings_income' THEN t.amount ELSE 0 END), 0) as savings_income,    -- Из копилки (уменьшение)
-                    COALESCE(SUM(CASE WHEN c.type = 'savings_expense' THEN t.amount ELSE 0 END), 0) as savings_expense   -- В копилку (увеличение)
-                FROM transactions t
-                JOIN categories c ON t.category_id = c.id
-                {savings_where} AND c.type IN ('savings_income', 'savings_expense')
-            '''
-            savings_stats = conn.execute(savings_query, savings_params).fetchone()
+            result = {
+                'total_income': total_income,
+                'total_expense': total_expense,
+                'balance': balance,
+                'savings_income': savings_withdrawals,  # Из копилки
+                'savings_expense': savings_deposits,  # В копилку
+                'savings_balance': savings_balance,
+                'by_category': by_category,
+                'daily_totals': daily_totals,
+                'savings_daily_totals': savings_daily_totals,  # НОВОЕ ПОЛЕ
+                'period': {
+                    'start_date': start_date.isoformat() if start_date else None,
+                    'end_date': end_date.isoformat() if end_date else None,
+                    'type': period
+                }
+            }
 
-            # По категориям (с фильтром по копилке)
-            category_query = f'''
-                SELECT 
+            return result, None
+
+    except sqlite3.Error as e:
+        return None, f"Ошибка базы данных: {str(e)}"
+
+
+MAX_COMPARE_PERIODS = 60
+TRANSACTION_TYPES = ('income', 'expense', 'savings_income', 'savings_expense')
+
+
+def _change(current: Decimal, previous: Decimal):
+    """Изменение и процент изменения относительно предыдущего периода"""
+    if previous is None:
+        return None, None
+    delta = current - previous
+    percent = (delta * 100 / abs(previous)).quantize(Decimal('0.01')) if previous else None
+    return delta, percent
+
+
+def get_comparison(request: CompareRequest):
+    """Сравнить несколько периодов одним сгруппированным запросом"""
+    if request.rolling:
+        periods = calculate_rolling_periods(request.rolling, max_count=MAX_COMPARE_PERIODS)
+        if periods is None:
+            return None, (f"Неверный формат rolling (в 'last N ...' N от 1 до {MAX_COMPARE_PERIODS}). "
+                          "Пример: 'last 12 months', 'yoy quarter'")
+    elif request.periods:
+        periods = [
+            (p.label or f"{p.start_date.isoformat()} - {p.end_date.isoformat()}", p.start_date, p.end_date)
+            for p in request.periods
+        ]
+    else:
+        return None, "Укажите periods или rolling"
+
+    if len(periods) > MAX_COMPARE_PERIODS:
+        return None, f"Можно сравнить не более {MAX_COMPARE_PERIODS} периодов"
+    if any(start > end for _, start, end in periods):
+        return None, "Дата начала периода позже даты конца"
+
+    types = TRANSACTION_TYPES if request.include_savings else ('income', 'expense')
+
+    first_date = min(start for _, start, _ in periods)
+    last_date = max(end for _, _, end in periods)
+    params = [value for i, (_, start, end) in enumerate(periods) for value in (i, start, end)]
+    params += [first_date, last_date, *types]
+
+    try:
+        with get_read_db() as conn:
+            source, _ = ledger_source(conn, first_date, last_date, summary=True)
+
+            # Каждая строка попадает во все периоды, которые ее содержат (периоды могут пересекаться)
+            query = f'''
+                WITH buckets (idx, start_date, end_date) AS (VALUES {", ".join("(?, ?, ?)" for _ in periods)})
+                SELECT
+                    b.idx,
+                    c.id as category_id,
                     c.name as category_name,
-                    c.type as category_type, 
+                    c.type as category_type,
                     c.color as category_color,
                     SUM(t.amount) as total
-                FROM transactions t
+                FROM {source} t
+                JOIN buckets b ON t.date >= b.start_date AND t.date <= b.end_date
                 JOIN categories c ON t.category_id = c.id
-                {base_where} {type_filter}
-                GROUP BY c.id, c.name, c.type, c.color
-                ORDER BY total DESC, c.type 
+                WHERE t.date >= ? AND t.date <= ?
+                  AND c.type IN ({", ".join("?" for _ in types)})
+                GROUP BY b.idx, c.id
             '''
+            rows = conn.execute(query, params).fetchall()
+    except sqlite3.Error as e:
+        return None, f"Ошибка базы данных: {str(e)}"
 
-            by_category = conn.execute(category_query, base_params).fetchall()
+    by_period = [dict() for _ in periods]
+    categories = {}
+    for row in rows:
+        by_period[row['idx']][row['category_id']] = Decimal(str(row['total']))
+        categories[row['category_id']] = row
 
-            # Ежедневные итоги для основной статистики
-            daily_query = f'''
-                SELECT 
-                    t.date,
-                    SUM(CASE WHEN c.type = 'income' THEN t.amount ELSE 0 END) as income,
-                    SUM(CASE WHEN c.type = 'expense' THEN t.amount ELSE 0 END) as expense
-                FROM transactions t
-                JOIN categories c ON t.category_id = c.id
-                {base_where} {type_filter}
-                GROUP BY t.date ORDER BY t.date
-            '''
+    result = []
+    previous = None
+    for i, (label, start, end) in enumerate(periods):
+        totals = {t: Decimal('0') for t in types}
+        for category_id, total in by_period[i].items():
+            totals[categories[category_id]['category_type']] += total
+        totals['balance'] = totals['income'] - totals['expense']
 
-            daily_totals = conn.execute(daily_query, base_params).fetchall()
+        by_category = []
+        for category_id, category in categories.items():
+            total = by_period[i].get(category_id, Decimal('0'))
+            prev_total = previous['categories'].get(category_id, Decimal('0')) if previous else None
+            delta, percent = _change(total, prev_total)
+            by_category.append({
+                'category_id': category_id,
+                'category_name': category['category_name'],
+                'category_type': category['category_type'],
+                'category_color': category['category_color'],
+                'total': total,
+                'delta': delta,
+                'percent_change': percent
+            })
+        by_category.sort(key=lambda row: (-row['total'], row['category_type']))
 
-            # Ежедневные итоги для копилки (НОВЫЙ ЗАПРОС)
-            savings_daily_query = f'''
-                SELECT 
-                    t.date,
-                    SUM(CASE WHEN c.type = 'savings_income' THEN t.amount ELSE 0 END) as savings_income,
-                    SUM(CASE WHEN c.type = 'savings_expense' THEN t.amount ELSE 0 END) as savings_expense
-                FROM transactions t
-                JOIN categories c ON t.category_id = c.id
-                {savings_where} AND c.type IN ('savings_income', 'savings_expense')
-                GROUP BY t.date ORDER BY t.date
-            '''
+        changes = {}
+        for key, value in totals.items():
+            delta, percent = _change(value, previous['totals'][key] if previous else None)
+            changes[key] = {'delta': delta, 'percent_change': percent}
 
-            savings_daily_totals = conn.execute(savings_daily_query, savings_params).fetchall()
+        result.append({
+            'label': label,
+            'start_date': start.isoformat(),
+            'end_date': end.isoformat(),
+            'totals': totals,
+            'changes': changes,
+            'by_category': by_category
+        })
+        previous = {'totals': totals, 'categories': by_period[i]}
 
-            # ИСПРАВЛЯЕМ РАСЧЕТ БАЛАНСА КОПИЛКИ:
-            savings_deposits = Decimal(str(savings_stats['savings_expense']))  # В копилку
-            savings_withdrawals = Decimal(str(savings_stats['savings_income']))  # Из копилки
-            savings_balance = savings_deposits - savings_withdrawals
+    return {'periods': result, 'include_savings': request.include_savings}, None
 
-            result = {
-                'total_income': Decimal(str(stats['total_income'])),
-                'total_expense': Decimal(str(stats['total_expense'])),
-                'balance': Decimal(str(stats['total_income'] - stats['total_expense'])),
-                'savings_income': savings_withdrawals,  # Из копилки
-                'savings_expense': savings_deposits,  # В копилку
-                'savings_balance': savings_balance,
-                'by_category': [dict(row) for row in by_category],
-                'daily_totals': [dict(row) for row in daily_totals],
-                'savings_daily_totals': [dict(row) for row in savings_daily_totals],  # НОВОЕ ПОЛЕ
-                'period': {
-                    'start_date': start_date.isoformat() if start_date else None,
-                    'end_date': end_date.isoformat() if end_date else None,
-                    'type': period
-                }
-            }
 
+def create_budget(budget: BudgetCreate):
+    """Создать бюджет для категории расходов"""
+    if budget.period not in ('month', 'custom'):
+        return None, "Период бюджета должен быть 'month' или 'custom'"
+    if budget.period == 'custom' and (not budget.start_date or not budget.end_date
+                                      or budget.start_date > budget.end_date):
+        return None, "Для произвольного периода укажите корректные даты начала и конца"
+    if budget.amount <= 0:
+        return None, "Сумма бюджета должна быть больше нуля"
+    if not 0 < budget.alert_threshold < 100:
+        return None, "Порог уведомления должен быть от 1 до 99 процентов"
+
+    try:
+        with get_db() as conn:
+            category = conn.execute(
+                "SELECT id FROM categories WHERE id = ? AND type = 'expense' AND is_active = TRUE",
+                (budget.category_id,)
+            ).fetchone()
+
+            if not category:
+                return None, "Категория расходов не найдена или неактивна"
+
+            start_date = budget.start_date if budget.period == 'custom' else None
+            end_date = budget.end_date if budget.period == 'custom' else None
+            cursor = conn.execute(
+                '''INSERT INTO budgets (category_id, period, start_date, end_date, amount, alert_threshold)
+                   VALUES (?, ?, ?, ?, ?, ?)''',
+                (budget.category_id, budget.period, start_date, end_date,
+                 float(budget.amount), budget.alert_threshold)
+            )
+            budget_id = cursor.lastrowid
+
+            # Начальные значения счетчиков - единственная агрегация по истории
+            if budget.period == 'month':
+                conn.execute(
+                    '''INSERT INTO budget_spend (budget_id, period_start, spent)
+                       SELECT ?, date(date, 'start of month'), SUM(amount)
+                       FROM transactions WHERE category_id = ?
+                       GROUP BY date(date, 'start of month')''',
+                    (budget_id, budget.category_id)
+                )
+            else:
+                conn.execute(
+                    '''INSERT INTO budget_spend (budget_id, period_start, spent)
+                       SELECT ?, ?, COALESCE(SUM(amount), 0)
+                       FROM transactions WHERE category_id = ? AND date >= ? AND date <= ?''',
+                    (budget_id, start_date, budget.category_id, start_date, end_date)
+                )
+
+            # Уже достигнутые пороги не считаем новыми пересечениями
+            for spend in conn.execute(
+                    "SELECT period_start, spent FROM budget_spend WHERE budget_id = ?", (budget_id,)
+            ).fetchall():
+                conn.execute(
+                    "UPDATE budget_spend SET alert_level = ? WHERE budget_id = ? AND period_start = ?",
+                    (_alert_level(spend['spent'], float(budget.amount), budget.alert_threshold),
+                     budget_id, spend['period_start'])
+                )
+
+            conn.commit()
+            return budget_id, None
+    except sqlite3.Error as e:
+        return None, f"Ошибка базы данных: {str(e)}"
+
+
+def get_budgets():
+    """Получить список активных бюджетов"""
+    try:
+        with get_read_db() as conn:
+            budgets = conn.execute('''
+                SELECT b.*, c.name as category_name, c.color as category_color
+                FROM budgets b
+                JOIN categories c ON b.category_id = c.id
+                WHERE b.is_active = TRUE
+                ORDER BY c.name, b.id
+            ''').fetchall()
+            return [dict(budget) for budget in budgets], None
+    except sqlite3.Error as e:
+        return None, f"Ошибка базы данных: {str(e)}"
+
+
+def delete_budget(budget_id: int):
+    """Отключить бюджет"""
+    try:
+        with get_db() as conn:
+            cursor = conn.execute(
+                "UPDATE budgets SET is_active = FALSE WHERE id = ? AND is_active = TRUE",
+                (budget_id,)
+            )
+            if not cursor.rowcount:
+                return None, "Бюджет не найден"
+            conn.commit()
+            return budget_id, None
+    except sqlite3.Error as e:
+        return None, f"Ошибка базы данных: {str(e)}"
+
+
+def get_budgets_status(on_date: date = None):
+    """Бюджет против фактических трат по каждому бюджету с прогнозом перерасхода"""
+    on_date = on_date or date.today()
+    try:
+        with get_read_db() as conn:
+            budgets = conn.execute('''
+                SELECT b.*, c.name as category_name, c.color as category_color
+                FROM budgets b
+                JOIN categories c ON b.category_id = c.id
+                WHERE b.is_active = TRUE
+                ORDER BY c.name, b.id
+            ''').fetchall()
+
+            result = []
+            for budget in budgets:
+                if budget['period'] == 'month':
+                    start, end = _budget_period(budget, on_date)
+                else:
+                    start = date.fromisoformat(budget['start_date'])
+                    end = date.fromisoformat(budget['end_date'])
+
+                spend = conn.execute(
+                    "SELECT spent FROM budget_spend WHERE budget_id = ? AND period_start = ?",
+                    (budget['id'], start)
+                ).fetchone()
+
+                amount = Decimal(str(budget['amount']))
+                spent = Decimal(str(spend['spent'])) if spend else Decimal('0')
+
+                # Линейный прогноз: текущий темп трат на весь период
+                total_days = (end - start).days + 1
+                elapsed_days = (min(on_date, end) - start).days + 1
+                if elapsed_days > 0:
+                    projected = (spent / elapsed_days * total_days).quantize(Decimal('0.01'))
+                else:
+                    projected = spent
+
+                result.append({
+                    'budget_id': budget['id'],
+                    'category_id': budget['category_id'],
+                    'category_name': budget['category_name'],
+                    'category_color': budget['category_color'],
+                    'period': budget['period'],
+                    'start_date': start,
+                    'end_date': end,
+                    'amount': amount,
+                    'spent': spent,
+                    'remaining': amount - spent,
+                    'percent_used': (spent * 100 / amount).quantize(Decimal('0.01')),
+                    'projected_spend': projected,
+                    'projected_overspend': max(projected - amount, Decimal('0')),
+                    'alert_threshold': budget['alert_threshold']
+                })
+
+            return result, None
+    except sqlite3.Error as e:
+        return None, f"Ошибка базы данных: {str(e)}"
+
+
+def get_budget_alerts(limit: int = 50):
+    """Последние уведомления о превышении порогов бюджета"""
+    try:
+        with get_read_db() as conn:
+            alerts = conn.execute('''
+                SELECT a.*, c.name as category_name
+                FROM budget_alerts a
+                JOIN budgets b ON a.budget_id = b.id
+                JOIN categories c ON b.category_id = c.id
+                ORDER BY a.id DESC
+                LIMIT ?
+            ''', (limit,)).fetchall()
+            return [dict(alert) for alert in alerts], None
+    except sqlite3.Error as e:
+        return None, f"Ошибка базы данных: {str(e)}"
+
+
+def create_rule(rule: CategoryRuleCreate):
+    """Создать правило автоматической категоризации"""
+    if not rule.pattern and rule.amount_min is None and rule.amount_max is None and not rule.weekdays:
+        return None, "Правило должно содержать хотя бы одно условие"
+    if rule.amount_min is not None and rule.amount_max is not None and rule.amount_min > rule.amount_max:
+        return None, "Минимальная сумма больше максимальной"
+    if rule.pattern and rule.match_type == 'regex':
+        try:
+            categorizer.compile_regex(rule.pattern)
+        except re.error as e:
+            return None, f"Некорректное регулярное выражение: {str(e)}"
+
+    try:
+        with get_db() as conn:
+            category = conn.execute(
+                "SELECT id FROM categories WHERE id = ? AND is_active = TRUE",
+                (rule.category_id,)
+            ).fetchone()
+
+            if not category:
+                return None, "Категория не найдена или неактивна"
+
+            cursor = conn.execute(
+                '''INSERT INTO category_rules
+                   (category_id, pattern, match_type, amount_min, amount_max, weekdays, priority)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                (rule.category_id, rule.pattern or None, rule.match_type,
+                 float(rule.amount_min) if rule.amount_min is not None else None,
+                 float(rule.amount_max) if rule.amount_max is not None else None,
+                 ",".join(str(day) for day in sorted(set(rule.weekdays))) if rule.weekdays else None,
+                 rule.priority)
+            )
+            bump_rules_version(conn)
+            conn.commit()
+            return cursor.lastrowid, None
+    except sqlite3.Error as e:
+        return None, f"Ошибка базы данных: {str(e)}"
+
+
+def get_rules():
+    """Получить правила категоризации в порядке применения"""
+    try:
+        with get_read_db() as conn:
+            rules = conn.execute('''
+                SELECT r.*, c.name as category_name, c.color as category_color
+                FROM category_rules r
+                JOIN categories c ON r.category_id = c.id
+                ORDER BY r.priority, r.id
+            ''').fetchall()
+            result = []
+            for rule in rules:
+                rule = dict(rule)
+                rule['weekdays'] = [int(day) for day in rule['weekdays'].split(",")] if rule['weekdays'] else None
+                result.append(rule)
             return result, None
+    except sqlite3.Error as e:
+        return None, f"Ошибка базы данных: {str(e)}"
+
 
+def delete_rule(rule_id: int):
+    """Удалить правило категоризации"""
+    try:
+        with get_db() as conn:
+            cursor = conn.execute("DELETE FROM category_rules WHERE id = ?", (rule_id,))
+            if not cursor.rowcount:
+                return None, "Правило не найдено"
+            bump_rules_version(conn)
+            conn.commit()
+            return rule_id, None
+    except sqlite3.Error as e:
+        return None, f"Ошибка базы данных: {str(e)}"
+
+
+def _match_rules(conn, start_date=None, end_date=None):
+    """Транзакции периода, которым правила дают другую категорию того же типа.
+
+    Возвращает [(id, новая категория, старая категория, дата, сумма)]; пустой список без правил.
+    """
+    matcher = categorizer.get_matcher(conn)
+    if not matcher.size:
+        return []
+
+    types = dict(conn.execute("SELECT id, type FROM categories").fetchall())
+    query = "SELECT id, description, amount, date, category_id FROM transactions WHERE 1=1"
+    params = []
+    if start_date:
+        query += " AND date >= ?"
+        params.append(start_date)
+    if end_date:
+        query += " AND date <= ?"
+        params.append(end_date)
+
+    matches = []
+    with section("match"):
+        for transaction_id, description, amount, transaction_date, category_id in conn.execute(query, params):
+            new_category_id = matcher.match(description, amount, transaction_date)
+            if (new_category_id is not None and new_category_id != category_id
+                    and types.get(new_category_id) == types.get(category_id)):
+                matches.append((transaction_id, new_category_id, category_id, transaction_date, amount))
+    return matches
+
+
+def apply_rules(start_date: date = None, end_date: date = None):
+    """Переприменить правила к истории (горячим данным) одним пакетным UPDATE.
+
+    Категория меняется, только если правило дает другую категорию того же типа:
+    правило не превращает расход в доход. Возвращает число измененных транзакций.
+
+    Правила сопоставляются на читающем снимке, без блокировки писателя. Под блокировкой
+    заново проверяются только дни, измененные после снимка (ledger_changes); если правила
+    изменились или диапазон изменений неизвестен - весь период.
+    """
+    start = start_date.isoformat() if start_date else None
+    end = end_date.isoformat() if end_date else None
+    try:
+        with get_read_db() as conn:
+            generation = get_ledger_generation(conn)
+            rules_version = get_rules_version(conn)
+            matches = _match_rules(conn, start, end)
+
+        with get_db() as conn:
+            # Проверка снимка и запись - в одной транзакции: другой процесс не вклинится между ними
+            conn.execute("BEGIN IMMEDIATE")
+            changed = ledger_changes_since(conn, generation)
+            if get_rules_version(conn) != rules_version or changed is None:
+                matches = _match_rules(conn, start, end)
+            elif changed != (None, None):
+                changed_start, changed_end = changed
+                matches = [match for match in matches if not changed_start <= match[3] <= changed_end]
+                # Измененные дни внутри периода сопоставляем заново
+                recheck_start = max(changed_start, start) if start else changed_start
+                recheck_end = min(changed_end, end) if end else changed_end
+                if recheck_start <= recheck_end:
+                    matches += _match_rules(conn, recheck_start, recheck_end)
+            if not matches:
+                return 0, None
+
+            with section("sql"):
+                conn.execute(
+                    "CREATE TEMP TABLE IF NOT EXISTS rule_matches (id INTEGER PRIMARY KEY, category_id INTEGER NOT NULL)"
+                )
+                conn.execute("DELETE FROM temp.rule_matches")
+                conn.executemany("INSERT INTO temp.rule_matches (id, category_id) VALUES (?, ?)",
+                                 [match[:2] for match in matches])
+                conn.execute('''
+                    UPDATE transactions SET category_id = m.category_id
+                    FROM temp.rule_matches m
+                    WHERE m.id = transactions.id
+                ''')
+                conn.execute("DELETE FROM temp.rule_matches")
+
+                budget_changes = []
+                for _, new_category_id, category_id, transaction_date, amount in matches:
+                    budget_changes.append((category_id, transaction_date, -amount))
+                    budget_changes.append((new_category_id, transaction_date, amount))
+                _apply_budget_delta(conn, *budget_changes)
+                # Движок получит новое поколение и перестроится в фоне
+                changed_dates = [match[3] for match in matches]
+                bump_ledger_generation(conn, min(changed_dates), max(changed_dates))
+                conn.commit()
+            return len(matches), None
+    except sqlite3.Error as e:
+        return None, f"Ошибка базы данных: {str(e)}"
+
+
+def _move_transactions(conn, target_id: int, source_ids, where: str = "", params: list = ()):
+    """Перенести транзакции категорий source_ids, подходящие под условие (псевдонимы t и c),
+    в категорию target_id.
+
+    Строки каждой исходной категории меняются одним UPDATE (по индексу категории),
+    RETURNING отдает даты и суммы перенесенных строк, а счетчики бюджетов и журнал
+    изменений обновляются по суммам за день, а не по каждой строке. Возвращает
+    число перенесенных транзакций.
+    """
+    totals = {}
+    moved = 0
+    for source_id in source_ids:
+        if source_id == target_id:
+            continue
+        rows = conn.execute(f'''
+            UPDATE transactions AS t SET category_id = ?
+            FROM categories c
+            WHERE c.id = t.category_id AND t.category_id = ?{where}
+            RETURNING date, amount
+        ''', [target_id, source_id, *params]).fetchall()
+        moved += len(rows)
+        for transaction_date, amount in rows:
+            key = (source_id, transaction_date)
+            totals[key] = totals.get(key, 0) + amount
+    if not moved:
+        return 0
+
+    budget_changes = []
+    for (source_id, transaction_date), total in totals.items():
+        budget_changes.append((source_id, transaction_date, -total))
+        budget_changes.append((target_id, transaction_date, total))
+    _apply_budget_delta(conn, *budget_changes)
+    # Движок получит новое поколение и перестроится в фоне
+    changed_dates = [transaction_date for _, transaction_date in totals]
+    bump_ledger_generation(conn, min(changed_dates), max(changed_dates))
+    return moved
+
+
+def merge_category(category_id: int, target_id: int):
+    """Объединить категорию с другой категорией того же типа.
+
+    История (горячие данные) переносится в target_id, правила категоризации
+    перенаправляются туда же, бюджеты и сама категория отключаются - всё в одной
+    транзакции. Архивные годы не меняются. Возвращает число перенесенных транзакций.
+    """
+    if category_id == target_id:
+        return None, "Нельзя объединить категорию саму с собой"
+
+    try:
+        with get_db() as conn:
+            categories = {row['id']: row for row in conn.execute(
+                "SELECT id, type FROM categories WHERE id IN (?, ?) AND is_active = TRUE",
+                (category_id, target_id)
+            )}
+            if len(categories) != 2:
+                return None, "Категория не найдена или неактивна"
+            if categories[category_id]['type'] != categories[target_id]['type']:
+                return None, "Объединять можно только категории одного типа"
+
+            # Бюджеты отключаем до переноса: их счетчики больше не нужны
+            conn.execute("UPDATE budgets SET is_active = FALSE WHERE category_id = ?", (category_id,))
+            moved = _move_transactions(conn, target_id, [category_id])
+            conn.execute("UPDATE category_rules SET category_id = ? WHERE category_id = ?",
+                         (target_id, category_id))
+            conn.execute("UPDATE categories SET is_active = FALSE WHERE id = ?", (category_id,))
+            bump_rules_version(conn)
+            conn.commit()
+            return moved, None
+    except sqlite3.Error as e:
+        return None, f"Ошибка базы данных: {str(e)}"
+
+
+def recategorize_transactions(category_id: int, start_date: date = None, end_date: date = None,
+                              filter: TransactionFilter = None):
+    """Перенести транзакции за период и по фильтру в другую категорию пакетными UPDATE.
+
+    Меняются только транзакции категорий того же типа, что и новая категория:
+    расход не превращается в доход. Возвращает число измененных транзакций.
+    """
+    filter_sql, filter_params = compile_filter(filter)
+    if not (filter_sql or start_date or end_date):
+        return None, "Укажите период или фильтр транзакций"
+
+    try:
+        with get_db() as conn:
+            category = conn.execute(
+                "SELECT id, type FROM categories WHERE id = ? AND is_active = TRUE",
+                (category_id,)
+            ).fetchone()
+            if not category:
+                return None, "Категория не найдена или неактивна"
+
+            # Исходные категории - того же типа: каждую переносим UPDATE по её индексу
+            source_ids = [row[0] for row in conn.execute(
+                "SELECT id FROM categories WHERE type = ? AND id != ?", (category['type'], category_id)
+            )]
+            where = ""
+            params = []
+            if start_date:
+                where += " AND t.date >= ?"
+                params.append(start_date)
+            if end_date:
+                where += " AND t.date <= ?"
+                params.append(end_date)
+
+            with section("sql"):
+                updated = _move_transactions(conn, category_id, source_ids, where + filter_sql,
+                                             params + filter_params)
+                conn.commit()
+            return updated, None
     except sqlite3.Error as e:
-        return None, f"Ошибка базы данных: {str(e)}"
\ No newline at end of file
+        return None, f"Ошибка базы данных: {str(e)}"
+
+
+def get_anomalies(start_date: date = None, end_date: date = None, kind: str = None, limit: int = 100):
+    """Найденные аномалии трат (результаты фонового поиска, без вычислений)"""
+    try:
+        with get_read_db() as conn:
+            query = '''
+                SELECT a.*, c.name as category_name, c.color as category_color
+                FROM anomalies a
+                JOIN categories c ON a.category_id = c.id
+                WHERE 1=1
+            '''
+            params = []
+            if start_date:
+                query += " AND a.date >= ?"
+                params.append(start_date)
+            if end_date:
+                query += " AND a.date <= ?"
+                params.append(end_date)
+            if kind:
+                query += " AND a.kind = ?"
+                params.append(kind)
+            query += " ORDER BY a.date DESC, a.score DESC LIMIT ?"
+            params.append(limit)
+
+            anomalies = conn.execute(query, params).fetchall()
+            return [dict(anomaly) for anomaly in anomalies], None
+    except sqlite3.Error as e:
+        return None, f"Ошибка базы данных: {str(e)}"
@@ -1,9 +1,19 @@
 import sqlite3
+import threading
+import queue
+import sys
 from datetime import datetime, date, timedelta
 from contextlib import contextmanager
+from pathlib import Path
 import os
 
-DATABASE_URL = "data/finance.db"
+import config
+
+DATABASE_URL = config.DATABASE_PATH
+
+# Единственное соединение-писатель на процесс (WAL: писатель не блокирует читателей)
+_writer_conn = None
+_writer_lock = threading.RLock()
 
 
 def calculate_period_dates(period: str):
@@ -38,21 +48,441 @@ def calculate_period_dates(period: str):
         return start, end
 
 
+def _shift_months(value: date, months: int):
+    """Первое число месяца, отстоящего от value на months месяцев"""
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def calculate_rolling_periods(spec: str, today: date = None, max_count: int = None):
+    """Периоды для сравнения по строке вида 'last 12 months' или 'yoy quarter'.
+
+    'last N <unit>' - N последовательных периодов, заканчивая текущим,
+    1 <= N <= max_count (без max_count - любое N от 1);
+    'yoy <unit>' - текущий период и такой же период год назад.
+    Единицы: week, month, quarter, year. Возвращает список (label, start, end)
+    от старого периода к новому или None при неверной строке.
+    """
+    today = today or date.today()
+    parts = spec.strip().lower().split()
+
+    if len(parts) == 3 and parts[0] == 'last' and parts[1].isdigit():
+        count, unit = int(parts[1]), parts[2].rstrip('s')
+        # N проверяется до построения периодов: огромное N вышло бы за пределы date
+        if count < 1 or (max_count is not None and count > max_count):
+            return None
+        offsets = range(-(count - 1), 1)
+    elif len(parts) == 2 and parts[0] == 'yoy':
+        unit = parts[1].rstrip('s')
+        offsets = None
+    else:
+        return None
+
+    if unit == 'week':
+        current = today - timedelta(days=today.weekday())
+        step = lambda n: (current + timedelta(weeks=n), current + timedelta(weeks=n, days=6))
+        label = lambda start: f"{start.isocalendar()[0]}-W{start.isocalendar()[1]:02d}"
+        year_offset = 52
+    elif unit in ('month', 'quarter', 'year'):
+        months = {'month': 1, 'quarter': 3, 'year': 12}[unit]
+        first_month = (today.month - 1) // months * months + 1
+        current = date(today.year, first_month, 1)
+        step = lambda n: (_shift_months(current, n * months),
+                          _shift_months(current, (n + 1) * months) - timedelta(days=1))
+        if unit == 'month':
+            label = lambda start: f"{start.year}-{start.month:02d}"
+        elif unit == 'quarter':
+            label = lambda start: f"{start.year}-Q{(start.month - 1) // 3 + 1}"
+        else:
+            label = lambda start: str(start.year)
+        year_offset = 12 // months
+    else:
+        return None
+
+    if offsets is None:
+        offsets = (-year_offset, 0)
+
+    periods = []
+    for n in offsets:
+        start, end = step(n)
+        periods.append((label(start), start, end))
+    return periods
+
+
+class _FileLock:
+    """Межпроцессная блокировка на файле (flock / msvcrt.locking)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+
+    def acquire(self, blocking: bool = True):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.file = open(self.path, "a+")
+        try:
+            if sys.platform == "win32":
+                import msvcrt
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except OSError:
+            self.file.close()
+            self.file = None
+            return False
+        return True
+
+    def release(self):
+        if self.file is None:
+            return
+        try:
+            if sys.platform == "win32":
+                import msvcrt
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self.file.close()
+            self.file = None
+
+
+@contextmanager
+def file_lock(path: str):
+    """Выполнить блок под межпроцессной блокировкой (например, в одном из воркеров uvicorn)"""
+    lock = _FileLock(path)
+    lock.acquire()
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+def try_file_lock(path: str):
+    """Захватить межпроцессную блокировку без ожидания; None, если она занята"""
+    lock = _FileLock(path)
+    return lock if lock.acquire(blocking=False) else None
+
+
+def _get_writer_conn():
+    """Ленивое создание выделенного соединения для записи"""
+    global _writer_conn
+    if _writer_conn is None:
+        conn = connect(check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.create_function("py_casefold", 1, _casefold, deterministic=True)
+        # WAL: читатели работают со снимком и не мешают писателю
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        # Пакетные UPDATE (объединение категорий, правила) затрагивают почти все страницы
+        # таблицы: с маленьким кэшем (2 МБ по умолчанию) страницы вытесняются и пишутся дважды
+        conn.execute("PRAGMA cache_size=-65536")
+        _writer_conn = conn
+    return _writer_conn
+
+
 @contextmanager
 def get_db():
-    """Менеджер контекста для работы с БД"""
-    # Создаем папку data если её нет
-    os.makedirs("data", exist_ok=True)
+    """Менеджер контекста для записи в БД (единственное соединение-писатель)"""
+    with _writer_lock:
+        conn = _get_writer_conn()
+        try:
+            yield conn
+        finally:
+            # Незакоммиченные изменения (ошибка внутри блока) откатываем,
+            # чтобы они не попали в чужую транзакцию
+            if conn.in_transaction:
+                conn.rollback()
+
+
+def sqlite_uri(path: str, **params):
+    """URI для sqlite3.connect(..., uri=True) / ATTACH с параметрами (mode=ro и т.п.)"""
+    uri = Path(path).absolute().as_uri()
+    if params:
+        uri += "?" + "&".join(f"{key}={value}" for key, value in params.items())
+    return uri
+
+
+def connect(readonly: bool = False, **kwargs):
+    """Новое соединение с БД приложения (readonly - без права записи)"""
+    if readonly:
+        return sqlite3.connect(sqlite_uri(DATABASE_URL, mode="ro"), uri=True, **kwargs)
+    # Создаем папку для файла БД, если её нет
+    os.makedirs(os.path.dirname(DATABASE_URL) or ".", exist_ok=True)
+    return sqlite3.connect(DATABASE_URL, **kwargs)
+
+
+# Пул read-only соединений: подготовленные запросы (кэш sqlite3 на соединение)
+# переживают отдельные вызовы, поэтому повторяющиеся запросы не компилируются заново
+READ_POOL_SIZE = 8
+_read_pool = queue.LifoQueue()  # (эпоха БД, соединение)
+# Меняется при configure(): соединения прежней БД в пул не возвращаются
+_epoch = 0
+
+
+def _casefold(value):
+    return value.casefold() if isinstance(value, str) else value
+
+
+def _connect_reader():
+    conn = connect(readonly=True, check_same_thread=False, cached_statements=256)
+    # Регистронезависимый поиск с кириллицей (встроенные LIKE/lower работают только с ASCII)
+    conn.create_function("py_casefold", 1, _casefold, deterministic=True)
+    return conn
+
+
+@contextmanager
+def get_read_db():
+    """Менеджер контекста для чтения: read-only соединение внутри одной транзакции.
 
-    conn = sqlite3.connect(DATABASE_URL)
+    Все запросы внутри блока видят один согласованный снимок БД.
+    """
+    epoch = _epoch
+    try:
+        pooled_epoch, conn = _read_pool.get_nowait()
+        if pooled_epoch != epoch:
+            conn.close()
+            conn = _connect_reader()
+    except queue.Empty:
+        conn = _connect_reader()
     conn.row_factory = sqlite3.Row
     try:
+        conn.execute("BEGIN")
         yield conn
     finally:
-        conn.close()
+        conn.rollback()
+        # Архивы отключаем: файл архива может быть пересоздан, а immutable-подключение об этом не узнает
+        for (alias,) in conn.execute(
+                "SELECT name FROM pragma_database_list WHERE name LIKE 'archive\\_%' ESCAPE '\\'").fetchall():
+            conn.execute(f"DETACH DATABASE {alias}")
+        if epoch == _epoch and _read_pool.qsize() < READ_POOL_SIZE:
+            _read_pool.put((epoch, conn))
+        else:
+            conn.close()
+
+
+def get_ledger_generation(conn):
+    """Текущее поколение данных журнала транзакций"""
+    return conn.execute("SELECT generation FROM ledger_state WHERE id = 1").fetchone()[0]
+
+
+# Сколько последних изменений хранится в журнале ledger_changes
+LEDGER_CHANGES_KEEP = 10000
+
+
+def bump_ledger_generation(conn, *dates):
+    """Увеличить поколение журнала (вызывается в той же транзакции, что и изменение).
+
+    dates - даты затронутых транзакций: по ним производные структуры пересчитывают
+    только измененные дни. Без дат изменение считается затрагивающим всё.
+    """
+    conn.execute("UPDATE ledger_state SET generation = generation + 1 WHERE id = 1")
+    generation = get_ledger_generation(conn)
+    if dates:
+        dates = [d if isinstance(d, str) else d.isoformat() for d in dates]
+        conn.execute(
+            "INSERT INTO ledger_changes (generation, min_date, max_date) VALUES (?, ?, ?)",
+            (generation, min(dates), max(dates))
+        )
+        conn.execute("DELETE FROM ledger_changes WHERE generation <= ?", (generation - LEDGER_CHANGES_KEEP,))
+    return generation
+
+
+def _init_rules_state(conn):
+    # Версия набора правил категоризации: по ней кэшируется скомпилированный матчер
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS rules_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO rules_state (id, version) VALUES (1, 0)')
+
+
+def get_rules_version(conn):
+    """Текущая версия набора правил категоризации"""
+    return conn.execute("SELECT version FROM rules_state WHERE id = 1").fetchone()[0]
+
+
+def bump_rules_version(conn):
+    """Увеличить версию набора правил (в той же транзакции, что и изменение правил
+    или активности категорий)"""
+    conn.execute("UPDATE rules_state SET version = version + 1 WHERE id = 1")
+
+
+def ledger_changes_since(conn, generation: int):
+    """Диапазон дат (min, max), измененных после поколения generation.
+
+    (None, None) - изменений нет; None - диапазон неизвестен (изменение без дат,
+    например архивация или восстановление, или журнал изменений уже обрезан).
+    """
+    current = get_ledger_generation(conn)
+    if generation == current:
+        return None, None
+    if generation > current:
+        return None
+    count, min_date, max_date = conn.execute(
+        "SELECT COUNT(*), MIN(min_date), MAX(max_date) FROM ledger_changes WHERE generation > ? AND generation <= ?",
+        (generation, current)
+    ).fetchone()
+    if count != current - generation:
+        return None
+    return min_date, max_date
+
+
+def restore_from(path: str, archives: dict = None):
+    """Заменить содержимое БД копией из файла path (Connection.backup).
+
+    Используется при восстановлении из резервной копии, а в бенчмарках - чтобы
+    данные генерировались один раз, а каждый прогон начинался с их копии.
+    archives - {год: путь} восстановленных архивов: реестр archived_years
+    указывает на них в той же транзакции. Возвращает новое поколение журнала.
+    """
+    source = sqlite3.connect(sqlite_uri(path, mode="ro"), uri=True)
+    try:
+        with get_db() as conn:
+            generation = get_ledger_generation(conn)
+            rules_version = get_rules_version(conn)
+            source.backup(conn)
+            for year, archive_file in (archives or {}).items():
+                conn.execute("UPDATE archived_years SET path = ? WHERE year = ?", (archive_file, year))
+            # Поколение только растет: иначе кэши старых поколений сочтут себя актуальными
+            conn.execute("UPDATE ledger_state SET generation = MAX(generation, ?) WHERE id = 1",
+                         (generation,))
+            generation = bump_ledger_generation(conn)
+            # То же для версии правил (в копиях старых версий её таблицы может не быть)
+            _init_rules_state(conn)
+            conn.execute("UPDATE rules_state SET version = MAX(version, ?) + 1 WHERE id = 1",
+                         (rules_version,))
+            conn.commit()
+    finally:
+        source.close()
+    return generation
+
+
+TRANSACTION_COLUMNS = "id, amount, category_id, date, description, created_at"
+# Столбцы, которых достаточно агрегатам (ledger_source(summary=True))
+SUMMARY_COLUMNS = "date, category_id, amount"
+
+
+def _as_year(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return int(value[:4])
+    return value.year
+
+
+def ledger_source(conn, start_date=None, end_date=None, summary: bool = False):
+    """Источник транзакций для FROM: горячая таблица плюс архивы затронутых лет.
+
+    Архивы подключаются только для чтения (ATTACH) и только если период
+    действительно захватывает архивные годы. summary=True - для запросов, которым
+    нужны только date, category_id и amount: архивный год отдает замороженные итоги
+    по дням и категориям (daily_summary) вместо всех своих строк. Возвращает
+    (sql, подключены_ли_архивы).
+    """
+    start_year, end_year = _as_year(start_date), _as_year(end_date)
+    archives = conn.execute(
+        "SELECT year, path FROM archived_years WHERE (? IS NULL OR year >= ?) AND (? IS NULL OR year <= ?) "
+        "ORDER BY year",
+        (start_year, start_year, end_year, end_year)
+    ).fetchall()
+    if not archives:
+        return "transactions", False
+
+    columns = SUMMARY_COLUMNS if summary else TRANSACTION_COLUMNS
+    parts = [f"SELECT {columns} FROM main.transactions"]
+    for archive in archives:
+        alias = f"archive_{archive['year']}"
+        attached = conn.execute(
+            "SELECT 1 FROM pragma_database_list WHERE name = ?", (alias,)
+        ).fetchone()
+        if not attached:
+            conn.execute(f"ATTACH DATABASE ? AS {alias}",
+                         (sqlite_uri(archive['path'], mode="ro", immutable=1),))
+        # В архивах, созданных до появления daily_summary, читаем строки
+        if summary and conn.execute(
+                f"SELECT 1 FROM {alias}.sqlite_master WHERE type = 'table' AND name = 'daily_summary'").fetchone():
+            parts.append(f"SELECT date, category_id, total AS amount FROM {alias}.daily_summary")
+        else:
+            parts.append(f"SELECT {columns} FROM {alias}.transactions")
+    return "(" + " UNION ALL ".join(parts) + ")", True
+
+
+_watch_conn = None
+_watch_lock = threading.Lock()
+_watch_state = (None, None)  # (data_version, generation)
+
+
+def current_generation():
+    """Поколение журнала с дешевой проверкой изменений из других процессов.
+
+    PRAGMA data_version на долгоживущем соединении меняется только после коммита
+    другого соединения (другого воркера, нашего писателя, CLI-утилит), поэтому
+    таблица ledger_state перечитывается лишь при реальных изменениях.
+    """
+    global _watch_conn, _watch_state
+    with _watch_lock:
+        if _watch_conn is None:
+            _watch_conn = connect(readonly=True, check_same_thread=False)
+        data_version = _watch_conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != _watch_state[0]:
+            _watch_state = (data_version, get_ledger_generation(_watch_conn))
+        return _watch_state[1]
+
+
+_configure_hooks = []
+
+
+def on_configure(hook):
+    """Зарегистрировать сброс состояния модуля, привязанного к прежней БД (см. configure)"""
+    _configure_hooks.append(hook)
+    return hook
+
+
+def configure(path: str):
+    """Переключить процесс на другой файл БД и создать в нем схему.
+
+    Путь к БД задается при импорте (config.DATABASE_PATH); configure нужен
+    тестам, где каждый тест работает со своей копией БД. Закрываются писатель,
+    пул читателей и наблюдатель поколения, а модули сбрасывают кэши, привязанные
+    к поколениям прежней БД: у разных файлов поколения могут совпасть.
+    """
+    global DATABASE_URL, _writer_conn, _watch_conn, _watch_state, _epoch
+    with _writer_lock, _watch_lock:
+        if _writer_conn is not None:
+            _writer_conn.close()
+            _writer_conn = None
+        if _watch_conn is not None:
+            _watch_conn.close()
+            _watch_conn = None
+        _watch_state = (None, None)
+        _epoch += 1
+        while True:
+            try:
+                _read_pool.get_nowait()[1].close()
+            except queue.Empty:
+                break
+        DATABASE_URL = config.DATABASE_PATH = path
+        # Дочерние процессы (пул отчетов) берут путь к БД из окружения
+        os.environ["FINANCE_DATABASE"] = path
+    for hook in _configure_hooks:
+        hook()
+    init_db()
 
 
 def init_db():
+    # Схему создает один процесс: остальные воркеры ждут блокировку
+    # и видят уже готовые таблицы (все операции идемпотентны)
+    with file_lock(os.path.join(config.DATA_DIR, ".init.lock")):
+        _init_schema()
+
+
+def _init_schema():
     with get_db() as conn:
         # Таблица категорий (гибкая система)
         conn.execute('''
@@ -106,6 +536,160 @@ def init_db():
             default_categories
         )
 
+        # Индекс по дате для выборок за период
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions (date)'
+        )
+
+        # Индекс для фильтров по категориям за период
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_transactions_category_date ON transactions (category_id, date)'
+        )
+
+        # Бюджеты по категориям расходов: ежемесячные или на произвольный период
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS budgets (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                category_id INTEGER NOT NULL,
+                period TEXT NOT NULL CHECK(period IN ('month', 'custom')),
+                start_date DATE,
+                end_date DATE,
+                amount DECIMAL(10,2) NOT NULL,
+                alert_threshold INTEGER DEFAULT 80,
+                is_active BOOLEAN DEFAULT TRUE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (category_id) REFERENCES categories (id)
+            )
+        ''')
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_budgets_category ON budgets (category_id)'
+        )
+
+        # Накопленные траты по бюджету (счетчик обновляется при каждой записи транзакции)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS budget_spend (
+                budget_id INTEGER NOT NULL,
+                period_start DATE NOT NULL,
+                spent DECIMAL(10,2) NOT NULL DEFAULT 0,
+                alert_level INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (budget_id, period_start),
+                FOREIGN KEY (budget_id) REFERENCES budgets (id)
+            )
+        ''')
+
+        # Уведомления о превышении порогов бюджета
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS budget_alerts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                budget_id INTEGER NOT NULL,
+                period_start DATE NOT NULL,
+                threshold INTEGER NOT NULL,
+                spent DECIMAL(10,2) NOT NULL,
+                amount DECIMAL(10,2) NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (budget_id) REFERENCES budgets (id)
+            )
+        ''')
+
+        # Правила автоматической категоризации (см. categorizer.py)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS category_rules (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                category_id INTEGER NOT NULL,
+                pattern TEXT,
+                match_type TEXT NOT NULL DEFAULT 'contains' CHECK(match_type IN ('contains', 'regex')),
+                amount_min DECIMAL(10,2),
+                amount_max DECIMAL(10,2),
+                weekdays TEXT,
+                priority INTEGER NOT NULL DEFAULT 100,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (category_id) REFERENCES categories (id)
+            )
+        ''')
+
+        # Поколение данных журнала: увеличивается при каждом изменении транзакций.
+        # По нему производные структуры (кэши, аналитический движок) проверяют актуальность
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS ledger_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                generation INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        conn.execute('INSERT OR IGNORE INTO ledger_state (id, generation) VALUES (1, 0)')
+        _init_rules_state(conn)
+
+        # Даты, затронутые каждым поколением (для инкрементального пересчета)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS ledger_changes (
+                generation INTEGER PRIMARY KEY,
+                min_date DATE NOT NULL,
+                max_date DATE NOT NULL
+            )
+        ''')
+
+        # Найденные аномалии трат и состояние фонового поиска (см. anomalies.py)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS anomalies (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL CHECK(kind IN ('category_day', 'new_merchant')),
+                category_id INTEGER NOT NULL,
+                date DATE NOT NULL,
+                amount DECIMAL(10,2) NOT NULL,
+                baseline DECIMAL(10,2),
+                score REAL,
+                transaction_id INTEGER,
+                description TEXT,
+                detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (category_id) REFERENCES categories (id)
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_anomalies_date ON anomalies (date)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS anomaly_merchants (
+                key TEXT PRIMARY KEY,
+                first_date DATE NOT NULL,
+                transaction_id INTEGER NOT NULL
+            )
+        ''')
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_anomaly_merchants_first_date ON anomaly_merchants (first_date)'
+        )
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS anomaly_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                generation INTEGER NOT NULL
+            )
+        ''')
+
+        # Фоновые задачи построения отчетов (см. reports.py)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS report_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued'
+                    CHECK(status IN ('queued', 'running', 'done', 'failed', 'cancelled')),
+                generation INTEGER,
+                owner INTEGER,
+                result TEXT,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_report_jobs_lookup ON report_jobs (kind, params, status)')
+
+        # Реестр архивированных лет (файлы с транзакциями и итогами закрытых лет)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS archived_years (
+                year INTEGER PRIMARY KEY,
+                path TEXT NOT NULL,
+                rows INTEGER NOT NULL,
+                archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
         # Таблица для настроек (только одна запись)
         conn.execute('''
             CREATE TABLE IF NOT EXISTS app_settings (
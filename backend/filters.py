@@ -0,0 +1,80 @@
+"""Компиляция TransactionFilter в параметризованный SQL.
+
+Текст условия зависит только от "формы" фильтра (какие поля заданы и сколько
+значений в списках), а не от самих значений. Скомпилированные фрагменты
+кэшируются по форме, а одинаковый текст запроса позволяет sqlite3 повторно
+использовать подготовленные выражения из кэша соединения.
+
+Ожидаемые псевдонимы в запросе: t - транзакции, c - категории.
+"""
+from functools import lru_cache
+
+from models import TransactionFilter
+
+
+def _placeholders(count: int):
+    return ", ".join("?" for _ in range(count))
+
+
+@lru_cache(maxsize=256)
+def _compile_shape(shape: tuple):
+    """SQL-условие для формы фильтра"""
+    conditions = []
+    for field, size in shape:
+        if field == 'category_ids':
+            conditions.append(f"t.category_id IN ({_placeholders(size)})")
+        elif field == 'types':
+            conditions.append(f"c.type IN ({_placeholders(size)})")
+        elif field == 'amount_min':
+            conditions.append("t.amount >= ?")
+        elif field == 'amount_max':
+            conditions.append("t.amount <= ?")
+        elif field == 'description':
+            conditions.append("py_casefold(t.description) LIKE ? ESCAPE '\\'")
+        elif field == 'weekdays':
+            conditions.append(f"CAST(strftime('%w', t.date) AS INTEGER) IN ({_placeholders(size)})")
+        elif field == 'months':
+            conditions.append(f"CAST(strftime('%m', t.date) AS INTEGER) IN ({_placeholders(size)})")
+    return "".join(f" AND {condition}" for condition in conditions)
+
+
+def _escape_like(value: str):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def compile_filter(transaction_filter: TransactionFilter = None):
+    """Вернуть (sql, params): условие вида ' AND ...' и его параметры"""
+    if transaction_filter is None:
+        return "", []
+
+    shape = []
+    params = []
+    # Порядок полей фиксирован - одинаковые фильтры дают одинаковый текст запроса
+    if transaction_filter.category_ids:
+        ids = sorted(set(transaction_filter.category_ids))
+        shape.append(('category_ids', len(ids)))
+        params += ids
+    if transaction_filter.types:
+        types = sorted(set(transaction_filter.types))
+        shape.append(('types', len(types)))
+        params += types
+    if transaction_filter.amount_min is not None:
+        shape.append(('amount_min', 1))
+        params.append(float(transaction_filter.amount_min))
+    if transaction_filter.amount_max is not None:
+        shape.append(('amount_max', 1))
+        params.append(float(transaction_filter.amount_max))
+    if transaction_filter.description:
+        shape.append(('description', 1))
+        params.append(f"%{_escape_like(transaction_filter.description.casefold())}%")
+    if transaction_filter.weekdays:
+        # В SQLite strftime('%w'): 0 - воскресенье; в фильтре 0 - понедельник
+        weekdays = sorted({(day + 1) % 7 for day in transaction_filter.weekdays})
+        shape.append(('weekdays', len(weekdays)))
+        params += weekdays
+    if transaction_filter.months:
+        months = sorted(set(transaction_filter.months))
+        shape.append(('months', len(months)))
+        params += months
+
+    return _compile_shape(tuple(shape)), params
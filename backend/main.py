@@ -3,11 +3,15 @@ import webbrowser
 from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 from datetime import date, datetime, timedelta
 from typing import Optional
 import sqlite3
 import os
+import shutil
+import tempfile
 from passlib.context import CryptContext
 import secrets
 import json
@@ -15,7 +19,14 @@ from pydantic import ValidationError
 
 from models import *
 from crud import *
-from database import calculate_period_dates, get_db
+from database import calculate_period_dates, get_db, get_read_db
+import analytics_engine
+import anomalies
+import backup
+import config
+import reports
+import writer
+from profiling import ProfilingMiddleware
 
 PORT = 8101
 
@@ -31,10 +42,34 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
-# сразу запускаем страничку
-webbrowser.open(f'http://localhost:{PORT}')
+@app.on_event("startup")
+async def startup():
+    # Колоночный аналитический движок (если включен в config.py)
+    analytics_engine.init_engine()
+    # Резервное копирование по расписанию (если задан интервал)
+    backup.start_scheduler()
+    # Фоновый поиск аномалий трат после изменений журнала
+    anomalies.start_scheduler()
+    # Очередь фоновых отчетов
+    reports.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    reports.stop()
+    anomalies.stop_scheduler()
+    backup.stop_scheduler()
+    # Дописываем накопленные изменения до сохранения движка
+    writer.stop()
+    analytics_engine.save_engine()
+
+
+# Профилирование запросов по требованию (без накладных расходов, если выключено)
+if config.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
 
 # Хеширование паролей - используем argon2 вместо bcrypt (нет ограничения по длине)
 pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
@@ -60,7 +95,7 @@ def verify_password(plain_password: str, hashed_password: str):
 
 def get_app_settings():
     """Получить настройки приложения"""
-    with get_db() as conn:
+    with get_read_db() as conn:
         settings = conn.execute(
             "SELECT * FROM app_settings WHERE id = 1"
         ).fetchone()
@@ -328,24 +363,51 @@ async def create_new_category(category: CategoryCreate, current_user: dict = Dep
 
 @app.get("/api/transactions")
 async def read_transactions(
+        request: Request,
         period: str = "month",
         start_date: Optional[date] = None,
         end_date: Optional[date] = None,
         include_savings: bool = True,
+        format: str = "rows",
+        filter: Optional[str] = None,
         current_user: dict = Depends(get_current_user)
 ):
-    """Получить транзакции за период"""
+    """Получить транзакции за период (format=columnar - компактный формат по столбцам,
+    filter - JSON с условиями TransactionFilter).
+
+    Ответ помечается ETag: клиент с сохраненной копией присылает If-None-Match
+    и, если журнал не менялся, получает 304 без повторной выборки.
+    """
     try:
+        transaction_filter = None
+        if filter:
+            try:
+                transaction_filter = TransactionFilter.model_validate_json(filter)
+            except ValidationError as e:
+                return JSONResponse(
+                    status_code=422,
+                    content={"detail": "Некорректный фильтр: " + "; ".join(
+                        f"{'.'.join(map(str, err['loc'])) or 'filter'}: {err['msg']}" for err in e.errors())}
+                )
+
         if period != "custom":
             start_date, end_date = calculate_period_dates(period)
 
-        transactions, error = get_transactions(start_date, end_date, include_savings)
+        columnar = format == "columnar"
+        etag = get_transactions_etag(str(start_date), str(end_date), include_savings, columnar, filter)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+
+        transactions, error = get_transactions(start_date, end_date, include_savings, columnar=columnar,
+                                               filter=transaction_filter)
         if error:
             return JSONResponse(
                 status_code=500,
                 content={"detail": error}
             )
-        return transactions
+        # Только примитивные типы - сериализуем напрямую, без jsonable_encoder
+        return JSONResponse(content=transactions, headers=headers)
     except Exception as e:
         return JSONResponse(
             status_code=500,
@@ -357,10 +419,10 @@ async def read_transactions(
 async def create_new_transaction(transaction: TransactionCreate, current_user: dict = Depends(get_current_user)):
     """Создать новую транзакцию"""
     try:
-        transaction_id, error = create_transaction(transaction)
+        transaction_id, error = await writer.execute_async(insert_transaction, transaction)
         if error:
             return JSONResponse(
-                status_code=400,
+                status_code=409 if error == ARCHIVED_YEAR_ERROR else 400,
                 content={"detail": error}
             )
         return {"id": transaction_id, "status": "created"}
@@ -380,7 +442,8 @@ async def get_analytics_data(request: AnalyticsRequest, current_user: dict = Dep
             start_date=request.start_date,
             end_date=request.end_date,
             group_by=request.group_by,
-            include_savings=request.include_savings
+            include_savings=request.include_savings,
+            filter=request.filter
         )
         if error:
             return JSONResponse(
@@ -395,6 +458,24 @@ async def get_analytics_data(request: AnalyticsRequest, current_user: dict = Dep
         )
 
 
+@app.post("/api/analytics/compare")
+async def compare_periods(request: CompareRequest, current_user: dict = Depends(get_current_user)):
+    """Сравнить периоды (месяц к месяцу, год к году, последние N периодов)"""
+    try:
+        comparison, error = get_comparison(request)
+        if error:
+            return JSONResponse(
+                status_code=400,
+                content={"detail": error}
+            )
+        return comparison
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"detail": f"Внутренняя ошибка сервера: {str(e)}"}
+        )
+
+
 @app.post("/api/analytics/savings", response_model=AnalyticsResponse)
 async def get_savings_analytics(request: AnalyticsRequest, current_user: dict = Depends(get_current_user)):
     """Получить аналитику по копилке"""
@@ -404,7 +485,8 @@ async def get_savings_analytics(request: AnalyticsRequest, current_user: dict =
             start_date=request.start_date,
             end_date=request.end_date,
             group_by=request.group_by,
-            include_savings=True
+            include_savings=True,
+            filter=request.filter
         )
         if error:
             return JSONResponse(
@@ -469,6 +551,45 @@ async def update_category(category_id: int, category_update: dict, current_user:
         )
 
 
+@app.post("/api/categories/{category_id}/merge")
+async def merge_category_endpoint(category_id: int, request: CategoryMergeRequest,
+                                  current_user: dict = Depends(get_current_user)):
+    """Объединить категорию с другой: история переносится, категория отключается"""
+    try:
+        # Перенос истории держит блокировку писателя - выполняем вне цикла событий
+        moved, error = await run_in_threadpool(merge_category, category_id, request.target_id)
+        if error:
+            return JSONResponse(
+                status_code=400,
+                content={"detail": error}
+            )
+        return {"moved": moved, "status": "merged"}
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"detail": f"Внутренняя ошибка сервера: {str(e)}"}
+        )
+
+
+@app.post("/api/transactions/recategorize")
+async def recategorize_endpoint(request: RecategorizeRequest, current_user: dict = Depends(get_current_user)):
+    """Перенести транзакции за период и по фильтру в другую категорию"""
+    try:
+        updated, error = await run_in_threadpool(recategorize_transactions, request.category_id,
+                                                 request.start_date, request.end_date, request.filter)
+        if error:
+            return JSONResponse(
+                status_code=400,
+                content={"detail": error}
+            )
+        return {"updated": updated, "status": "recategorized"}
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"detail": f"Внутренняя ошибка сервера: {str(e)}"}
+        )
+
+
 @app.put("/api/transactions/{transaction_id}")
 async def update_transaction(transaction_id: int, transaction_update: dict,
                              current_user: dict = Depends(get_current_user)):
@@ -506,10 +627,10 @@ async def update_transaction(transaction_id: int, transaction_update: dict,
                 content={"detail": f"Ошибка валидации: {e}"}
             )
 
-        updated_id, error = update_transaction_crud(transaction_id, validated_data)
+        updated_id, error = await writer.execute_async(update_transaction_row, transaction_id, validated_data)
         if error:
             return JSONResponse(
-                status_code=400,
+                status_code=409 if error == ARCHIVED_YEAR_ERROR else 400,
                 content={"detail": error}
             )
         return {"id": updated_id, "status": "updated"}
@@ -524,7 +645,151 @@ async def update_transaction(transaction_id: int, transaction_update: dict,
 async def delete_transaction_endpoint(transaction_id: int, current_user: dict = Depends(get_current_user)):
     """Удалить транзакцию"""
     try:
-        deleted_id, error = delete_transaction_crud(transaction_id)
+        deleted_id, error = await writer.execute_async(delete_transaction_row, transaction_id)
+        if error:
+            return JSONResponse(
+                status_code=409 if error == ARCHIVED_YEAR_ERROR else 400,
+                content={"detail": error}
+            )
+        return {"id": deleted_id, "status": "deleted"}
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"detail": f"Внутренняя ошибка сервера: {str(e)}"}
+        )
+
+
+@app.get("/api/budgets", response_model=list[Budget])
+async def read_budgets(current_user: dict = Depends(get_current_user)):
+    """Получить список бюджетов"""
+    try:
+        budgets, error = get_budgets()
+        if error:
+            return JSONResponse(
+                status_code=500,
+                content={"detail": error}
+            )
+        return budgets
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"detail": f"Внутренняя ошибка сервера: {str(e)}"}
+        )
+
+
+@app.post("/api/budgets")
+async def create_new_budget(budget: BudgetCreate, current_user: dict = Depends(get_current_user)):
+    """Создать бюджет для категории"""
+    try:
+        budget_id, error = create_budget(budget)
+        if error:
+            return JSONResponse(
+                status_code=400,
+                content={"detail": error}
+            )
+        return {"id": budget_id, "status": "created"}
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"detail": f"Внутренняя ошибка сервера: {str(e)}"}
+        )
+
+
+@app.delete("/api/budgets/{budget_id}")
+async def delete_budget_endpoint(budget_id: int, current_user: dict = Depends(get_current_user)):
+    """Удалить (отключить) бюджет"""
+    try:
+        deleted_id, error = delete_budget(budget_id)
+        if error:
+            return JSONResponse(
+                status_code=400,
+                content={"detail": error}
+            )
+        return {"id": deleted_id, "status": "deleted"}
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"detail": f"Внутренняя ошибка сервера: {str(e)}"}
+        )
+
+
+@app.get("/api/budgets/status", response_model=list[BudgetStatus])
+async def read_budgets_status(on_date: Optional[date] = None, current_user: dict = Depends(get_current_user)):
+    """Бюджет против фактических трат с процентом использования и прогнозом"""
+    try:
+        status, error = get_budgets_status(on_date)
+        if error:
+            return JSONResponse(
+                status_code=500,
+                content={"detail": error}
+            )
+        return status
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"detail": f"Внутренняя ошибка сервера: {str(e)}"}
+        )
+
+
+@app.get("/api/budgets/alerts", response_model=list[BudgetAlert])
+async def read_budget_alerts(limit: int = 50, current_user: dict = Depends(get_current_user)):
+    """Последние уведомления о превышении порогов бюджета"""
+    try:
+        alerts, error = get_budget_alerts(limit)
+        if error:
+            return JSONResponse(
+                status_code=500,
+                content={"detail": error}
+            )
+        return alerts
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"detail": f"Внутренняя ошибка сервера: {str(e)}"}
+        )
+
+
+@app.get("/api/rules", response_model=list[CategoryRule])
+async def read_rules(current_user: dict = Depends(get_current_user)):
+    """Получить правила автоматической категоризации"""
+    try:
+        rules, error = get_rules()
+        if error:
+            return JSONResponse(
+                status_code=500,
+                content={"detail": error}
+            )
+        return rules
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"detail": f"Внутренняя ошибка сервера: {str(e)}"}
+        )
+
+
+@app.post("/api/rules")
+async def create_new_rule(rule: CategoryRuleCreate, current_user: dict = Depends(get_current_user)):
+    """Создать правило категоризации"""
+    try:
+        rule_id, error = create_rule(rule)
+        if error:
+            return JSONResponse(
+                status_code=400,
+                content={"detail": error}
+            )
+        return {"id": rule_id, "status": "created"}
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"detail": f"Внутренняя ошибка сервера: {str(e)}"}
+        )
+
+
+@app.delete("/api/rules/{rule_id}")
+async def delete_rule_endpoint(rule_id: int, current_user: dict = Depends(get_current_user)):
+    """Удалить правило категоризации"""
+    try:
+        deleted_id, error = delete_rule(rule_id)
         if error:
             return JSONResponse(
                 status_code=400,
@@ -538,6 +803,141 @@ async def delete_transaction_endpoint(transaction_id: int, current_user: dict =
         )
 
 
+@app.post("/api/rules/apply")
+async def apply_rules_endpoint(request: RulesApplyRequest, current_user: dict = Depends(get_current_user)):
+    """Переприменить правила к существующим транзакциям"""
+    try:
+        # Сопоставление и пакетный UPDATE выполняются вне цикла событий
+        updated, error = await run_in_threadpool(apply_rules, request.start_date, request.end_date)
+        if error:
+            return JSONResponse(
+                status_code=400,
+                content={"detail": error}
+            )
+        return {"updated": updated, "status": "applied"}
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"detail": f"Внутренняя ошибка сервера: {str(e)}"}
+        )
+
+
+@app.get("/api/anomalies", response_model=list[Anomaly])
+async def read_anomalies(
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        kind: Optional[str] = None,
+        limit: int = 100,
+        current_user: dict = Depends(get_current_user)
+):
+    """Необычные траты, найденные фоновым поиском"""
+    try:
+        anomalies_list, error = get_anomalies(start_date, end_date, kind, limit)
+        if error:
+            return JSONResponse(
+                status_code=500,
+                content={"detail": error}
+            )
+        return anomalies_list
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"detail": f"Внутренняя ошибка сервера: {str(e)}"}
+        )
+
+
+@app.post("/api/reports")
+async def create_report(request: ReportRequest, current_user: dict = Depends(get_current_user)):
+    """Поставить тяжелый отчет в очередь фоновых задач"""
+    try:
+        job, error = reports.submit_report(request)
+        if error:
+            return JSONResponse(
+                status_code=429 if error == reports.QUEUE_FULL else 500,
+                content={"detail": error}
+            )
+        return job
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"detail": f"Внутренняя ошибка сервера: {str(e)}"}
+        )
+
+
+@app.get("/api/reports/{job_id}")
+async def read_report(job_id: int, current_user: dict = Depends(get_current_user)):
+    """Статус отчета и результат, когда он готов"""
+    try:
+        job, error = reports.get_report(job_id)
+        if error:
+            return JSONResponse(
+                status_code=404,
+                content={"detail": error}
+            )
+        return JSONResponse(content=job)
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"detail": f"Внутренняя ошибка сервера: {str(e)}"}
+        )
+
+
+@app.delete("/api/reports/{job_id}")
+async def cancel_report_endpoint(job_id: int, current_user: dict = Depends(get_current_user)):
+    """Отменить отчет"""
+    try:
+        cancelled_id, error = reports.cancel_report(job_id)
+        if error:
+            return JSONResponse(
+                status_code=400,
+                content={"detail": error}
+            )
+        return {"id": cancelled_id, "status": "cancelled"}
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"detail": f"Внутренняя ошибка сервера: {str(e)}"}
+        )
+
+
+@app.get("/api/backup/snapshot")
+async def download_snapshot(current_user: dict = Depends(get_current_user)):
+    """Скачать согласованный снимок БД (запись при этом не блокируется).
+
+    Если есть архивы закрытых лет, отдается zip со всем набором копии.
+    """
+    tmp_dir = tempfile.mkdtemp(prefix="finance_snapshot_")
+    try:
+        name = f"finance_snapshot_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
+        # Копирование идет шагами с паузами - выполняем его вне цикла событий
+        set_dir = os.path.join(tmp_dir, "set")
+        os.makedirs(set_dir)
+        info = await run_in_threadpool(backup.snapshot_to, os.path.join(set_dir, name))
+        headers = {"X-Checksum-SHA256": info['sha256'], "X-Ledger-Generation": str(info['generation'])}
+        if info['archives']:
+            bundle = await run_in_threadpool(shutil.make_archive, os.path.join(tmp_dir, name), "zip", set_dir)
+            return FileResponse(
+                bundle,
+                media_type="application/zip",
+                filename=name + ".zip",
+                headers=headers,
+                background=BackgroundTask(shutil.rmtree, tmp_dir, ignore_errors=True)
+            )
+        return FileResponse(
+            info['path'],
+            media_type="application/x-sqlite3",
+            filename=name,
+            headers=headers,
+            background=BackgroundTask(shutil.rmtree, tmp_dir, ignore_errors=True)
+        )
+    except Exception as e:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return JSONResponse(
+            status_code=500,
+            content={"detail": f"Внутренняя ошибка сервера: {str(e)}"}
+        )
+
+
 @app.get("/")
 async def serve_frontend():
     return FileResponse("../frontend/index.html")
@@ -553,7 +953,13 @@ if __name__ == "__main__":
         print(f"📊 Бекенд API: http://localhost:{PORT}")
         print(f"🎨 Фронтенд: http://localhost:{PORT}")
         print(f"📚 Документация API: http://localhost:{PORT}/docs")
-        uvicorn.run(app, host="0.0.0.0", port=PORT)
+        # сразу запускаем страничку (только при запуске напрямую, а не в воркерах uvicorn)
+        webbrowser.open(f'http://localhost:{PORT}')
+        if config.WORKERS > 1:
+            # Несколько процессов: приложение импортируется в каждом воркере заново
+            uvicorn.run("main:app", host="0.0.0.0", port=PORT, workers=config.WORKERS)
+        else:
+            uvicorn.run(app, host="0.0.0.0", port=PORT)
     except Exception as e:
         print(f"❌ Ошибка: {e}")
         print("⚠️  Нажмите Enter для выхода...")
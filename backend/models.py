@@ -1,6 +1,6 @@
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 from datetime import date, datetime
-from typing import Optional, List
+from typing import Optional, List, Literal, Annotated
 from decimal import Decimal
 
 
@@ -30,7 +30,7 @@ class TransactionBase(BaseModel):
 
 
 class TransactionCreate(TransactionBase):
-    pass
+    category_id: Optional[int] = None  # если не указана - определяется правилами категоризации
 
 
 class Transaction(TransactionBase):
@@ -46,12 +46,26 @@ class TransactionWithCategory(Transaction):
     category_color: str
 
 
+class TransactionFilter(BaseModel):
+    """Фильтр транзакций (общий для списка транзакций и аналитики)"""
+    model_config = ConfigDict(extra='forbid')
+
+    category_ids: Optional[List[int]] = None
+    types: Optional[List[Literal['income', 'expense', 'savings_income', 'savings_expense']]] = None
+    amount_min: Optional[Decimal] = None
+    amount_max: Optional[Decimal] = None
+    description: Optional[str] = None  # подстрока, без учета регистра
+    weekdays: Optional[List[Annotated[int, Field(ge=0, le=6)]]] = None  # 0 - понедельник
+    months: Optional[List[Annotated[int, Field(ge=1, le=12)]]] = None
+
+
 class AnalyticsRequest(BaseModel):
     period: str = "month"
     start_date: Optional[date] = None
     end_date: Optional[date] = None
     group_by: Optional[str] = 'category'
     include_savings: bool = False
+    filter: Optional[TransactionFilter] = None
 
 
 class AnalyticsResponse(BaseModel):
@@ -67,6 +81,18 @@ class AnalyticsResponse(BaseModel):
     savings_balance: Optional[Decimal] = Decimal('0')
 
 
+class ComparePeriod(BaseModel):
+    start_date: date
+    end_date: date
+    label: Optional[str] = None
+
+
+class CompareRequest(BaseModel):
+    periods: Optional[List[ComparePeriod]] = None
+    rolling: Optional[str] = None  # 'last 12 months', 'last 4 quarters', 'yoy quarter', ...
+    include_savings: bool = False
+
+
 # ИСПРАВЛЕННАЯ МОДЕЛЬ - используем новую конфигурацию
 class TransactionUpdate(BaseModel):
     model_config = ConfigDict(extra='forbid')
@@ -77,6 +103,106 @@ class TransactionUpdate(BaseModel):
     description: str | None = None
 
 
+class BudgetCreate(BaseModel):
+    category_id: int
+    amount: Decimal
+    period: str = 'month'  # 'month', 'custom'
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    alert_threshold: int = 80  # процент от бюджета
+
+
+class Budget(BudgetCreate):
+    id: int
+    is_active: bool
+    created_at: datetime
+    category_name: str
+    category_color: str
+
+
+class BudgetStatus(BaseModel):
+    budget_id: int
+    category_id: int
+    category_name: str
+    category_color: str
+    period: str
+    start_date: date
+    end_date: date
+    amount: Decimal
+    spent: Decimal
+    remaining: Decimal
+    percent_used: Decimal
+    projected_spend: Decimal
+    projected_overspend: Decimal
+    alert_threshold: int
+
+
+class BudgetAlert(BaseModel):
+    id: int
+    budget_id: int
+    category_name: str
+    period_start: date
+    threshold: int
+    spent: Decimal
+    amount: Decimal
+    created_at: datetime
+
+
+class CategoryRuleCreate(BaseModel):
+    category_id: int
+    pattern: Optional[str] = None  # подстрока или регулярное выражение в описании
+    match_type: Literal['contains', 'regex'] = 'contains'
+    amount_min: Optional[Decimal] = None
+    amount_max: Optional[Decimal] = None
+    weekdays: Optional[List[Annotated[int, Field(ge=0, le=6)]]] = None  # 0 - понедельник
+    priority: int = 100  # меньше - приоритетнее
+
+
+class CategoryRule(CategoryRuleCreate):
+    id: int
+    created_at: datetime
+    category_name: str
+    category_color: str
+
+
+class RulesApplyRequest(BaseModel):
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+
+
+class CategoryMergeRequest(BaseModel):
+    target_id: int  # категория того же типа, в которую переносится история
+
+
+class RecategorizeRequest(BaseModel):
+    category_id: int  # новая категория
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    filter: Optional[TransactionFilter] = None
+
+
+class Anomaly(BaseModel):
+    id: int
+    kind: str  # 'category_day', 'new_merchant'
+    category_id: int
+    category_name: str
+    category_color: str
+    date: date
+    amount: Decimal
+    baseline: Optional[Decimal] = None
+    score: Optional[float] = None
+    transaction_id: Optional[int] = None
+    description: Optional[str] = None
+    detected_at: datetime
+
+
+class ReportRequest(BaseModel):
+    kind: Literal['monthly_pivot', 'top_descriptions', 'savings_trajectory']
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    limit: int = Field(20, ge=1, le=500)  # для top_descriptions
+
+
 # Модели для аутентификации
 class AuthToken(BaseModel):
     authenticated: bool
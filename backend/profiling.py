@@ -0,0 +1,163 @@
+"""Профилирование отдельных запросов по требованию.
+
+Если профилирование включено в config.py, запрос с заголовком X-Profile: <токен>
+(или параметром ?profile=<токен>) выполняется под cProfile. Результат пишется в
+PROFILING_DIR: <id>.prof (pstats - для snakeviz, flameprof, gprof2dot) и
+<id>.json с маршрутом, общим временем и замерами секций из crud.py
+(sql, decimal, rows, ...). Хранятся последние PROFILING_KEEP профилей.
+
+cProfile видит только поток цикла событий, поэтому профилируемый запрос
+выполняется один: он ждет завершения уже начатых запросов, а новые ждут его.
+Так в профиль не попадают чужие запросы. Работа в пуле потоков
+(run_in_threadpool) и в потоке писателя (writer.py) в профиле видна только
+как ожидание; её время показывают секции section(), пока они выполняются
+в контексте запроса (в пуле потоков - да, в потоке писателя - нет).
+
+Без заголовка запрос проходит через middleware проверкой заголовков и
+счетчиком выполняющихся запросов, а section() в crud.py сводится к чтению contextvar.
+"""
+import asyncio
+import cProfile
+import hmac
+import json
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from urllib.parse import parse_qs
+
+from starlette.concurrency import run_in_threadpool
+
+import config
+
+_sections = ContextVar("profile_sections", default=None)
+
+# Что не попадает в .prof (записывается в метаданные профиля)
+_COVERAGE = ("cProfile: только поток цикла событий; работа в пуле потоков и в потоке писателя "
+             "видна как ожидание, её время - в sections_ms (кроме операций писателя)")
+
+
+@contextmanager
+def section(name: str):
+    """Замер секции кода, если текущий запрос профилируется"""
+    sections = _sections.get()
+    if sections is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        sections[name] = sections.get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+
+def _requested(scope):
+    """Запрошено ли профилирование (проверка токена)"""
+    token = None
+    for name, value in scope.get("headers", ()):
+        if name == b"x-profile":
+            token = value.decode("latin-1")
+            break
+    if token is None and b"profile=" in scope.get("query_string", b""):
+        token = parse_qs(scope["query_string"].decode("latin-1")).get("profile", [None])[0]
+    return bool(token) and bool(config.PROFILING_TOKEN) and hmac.compare_digest(token, config.PROFILING_TOKEN)
+
+
+def _store(profile_id: str, profiler, meta: dict):
+    os.makedirs(config.PROFILING_DIR, exist_ok=True)
+    profiler.dump_stats(os.path.join(config.PROFILING_DIR, f"{profile_id}.prof"))
+    with open(os.path.join(config.PROFILING_DIR, f"{profile_id}.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    # Кольцевой буфер: удаляем самые старые профили
+    ids = sorted({name.rsplit(".", 1)[0] for name in os.listdir(config.PROFILING_DIR)
+                  if name.endswith((".prof", ".json"))})
+    for old in ids[:-config.PROFILING_KEEP]:
+        for ext in (".prof", ".json"):
+            path = os.path.join(config.PROFILING_DIR, old + ext)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class ProfilingMiddleware:
+    """ASGI middleware: профилирует запросы с привилегированным заголовком"""
+
+    def __init__(self, app):
+        self.app = app
+        self._in_flight = 0
+        self._idle = asyncio.Event()     # нет выполняющихся обычных запросов
+        self._idle.set()
+        self._open = asyncio.Event()     # профилирование не идет - запросы пропускаются
+        self._open.set()
+        self._profile_lock = asyncio.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if not _requested(scope):
+            while not self._open.is_set():
+                await self._open.wait()
+            self._in_flight += 1
+            self._idle.clear()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                self._in_flight -= 1
+                if not self._in_flight:
+                    self._idle.set()
+            return
+
+        # Профилируемые запросы - по одному, и каждый - без соседей в цикле событий
+        async with self._profile_lock:
+            profile = {}
+            try:
+                self._open.clear()
+                try:
+                    await self._idle.wait()
+                    await self._profile(scope, receive, send, profile)
+                finally:
+                    self._open.set()
+            finally:
+                if profile:
+                    await run_in_threadpool(_store, profile['id'], profile.pop('profiler'), profile)
+
+    async def _profile(self, scope, receive, send, profile: dict):
+        """Выполнить запрос под cProfile; profile заполняется и при исключении"""
+        profile_id = f"{time.time_ns()}"
+        status = {}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        sections = {}
+        token = _sections.set(sections)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                profiler.disable()
+        finally:
+            total = (time.perf_counter() - started) * 1000
+            _sections.reset(token)
+            route = getattr(scope.get("route"), "path", scope["path"])
+            profile.update({
+                'profiler': profiler,
+                'id': profile_id,
+                'method': scope["method"],
+                'route': route,
+                'path': scope["path"],
+                'status': status.get("code"),
+                'total_ms': round(total, 3),
+                'sections_ms': {name: round(value, 3) for name, value in sections.items()},
+                # Остальное - фреймворк, валидация pydantic, сериализация
+                'other_ms': round(total - sum(sections.values()), 3),
+                'coverage': _COVERAGE
+            })
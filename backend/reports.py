@@ -0,0 +1,386 @@
+"""Тяжелые отчеты в фоновых процессах.
+
+POST /api/reports ставит задачу в очередь (таблица report_jobs), задачу выполняет
+пул процессов: обработчики запросов и цикл событий не заняты построением отчета.
+Процесс пула читает данные через read-only соединение внутри одной транзакции и
+сам записывает результат, поэтому статус виден из любого воркера uvicorn.
+
+- Готовый результат переиспользуется, пока не изменилось поколение журнала;
+  такой же запрос получает и задачу, которая ждет в очереди или строится
+  по снимку текущего поколения.
+- Отмена: задача в очереди снимается сразу, выполняющаяся прерывается
+  обработчиком прогресса SQLite, который проверяет статус задачи.
+- Одновременно выполняется не больше REPORTS_WORKERS задач, в очереди и в работе
+  не больше REPORTS_MAX_PENDING.
+"""
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import config
+import database
+from database import get_db, get_read_db, get_ledger_generation, ledger_source, try_file_lock
+
+QUEUE_FULL = "Слишком много отчетов в очереди, попробуйте позже"
+
+_OWNERS_DIR = os.path.join(config.DATA_DIR, "reports")
+# Как часто (в шагах виртуальной машины SQLite) выполняющаяся задача проверяет отмену
+_CANCEL_CHECK_STEPS = 100_000
+
+
+def _period(start_date, end_date):
+    where = ""
+    params = []
+    if start_date:
+        where += " AND t.date >= ?"
+        params.append(start_date)
+    if end_date:
+        where += " AND t.date <= ?"
+        params.append(end_date)
+    return where, params
+
+
+def monthly_pivot(conn, start_date=None, end_date=None, **_):
+    """Сводная таблица: категории x месяцы"""
+    source, _ = ledger_source(conn, start_date, end_date, summary=True)
+    where, params = _period(start_date, end_date)
+    rows = conn.execute(f'''
+        SELECT strftime('%Y-%m', t.date) as month, c.id, c.name, c.type, c.color, SUM(t.amount) as total
+        FROM {source} t
+        JOIN categories c ON t.category_id = c.id
+        WHERE 1=1 {where}
+        GROUP BY month, c.id
+    ''', params).fetchall()
+
+    months = sorted({row['month'] for row in rows})
+    month_index = {month: i for i, month in enumerate(months)}
+    categories = {}
+    for row in rows:
+        category = categories.setdefault(row['id'], {
+            'id': row['id'], 'name': row['name'], 'type': row['type'], 'color': row['color'],
+            'values': [0] * len(months), 'total': 0
+        })
+        category['values'][month_index[row['month']]] = round(row['total'], 2)
+        category['total'] += row['total']
+
+    for category in categories.values():
+        category['total'] = round(category['total'], 2)
+    return {
+        'months': months,
+        'categories': sorted(categories.values(), key=lambda c: (c['type'], -c['total']))
+    }
+
+
+def top_descriptions(conn, start_date=None, end_date=None, limit=20, **_):
+    """Описания расходов с наибольшей суммой (без учета регистра)"""
+    source, _ = ledger_source(conn, start_date, end_date)
+    where, params = _period(start_date, end_date)
+    rows = conn.execute(f'''
+        SELECT MIN(t.description) as description, COUNT(*) as count, SUM(t.amount) as total,
+               MIN(t.date) as first_date, MAX(t.date) as last_date
+        FROM {source} t
+        JOIN categories c ON t.category_id = c.id
+        WHERE c.type = 'expense' AND TRIM(COALESCE(t.description, '')) != '' {where}
+        GROUP BY py_casefold(TRIM(t.description))
+        ORDER BY total DESC
+        LIMIT ?
+    ''', params + [limit]).fetchall()
+    return {'descriptions': [dict(row, total=round(row['total'], 2)) for row in rows]}
+
+
+def savings_trajectory(conn, start_date=None, end_date=None, **_):
+    """Пополнения и снятия копилки по месяцам и накопленный баланс"""
+    # Баланс на начало периода учитывает всю историю, включая архив
+    source, _ = ledger_source(conn, None, end_date, summary=True)
+    opening = 0
+    if start_date:
+        opening = conn.execute(f'''
+            SELECT COALESCE(SUM(CASE WHEN c.type = 'savings_expense' THEN t.amount ELSE -t.amount END), 0)
+            FROM {source} t
+            JOIN categories c ON t.category_id = c.id
+            WHERE c.type IN ('savings_income', 'savings_expense') AND t.date < ?
+        ''', (start_date,)).fetchone()[0]
+
+    where, params = _period(start_date, end_date)
+    rows = conn.execute(f'''
+        SELECT strftime('%Y-%m', t.date) as month,
+               SUM(CASE WHEN c.type = 'savings_expense' THEN t.amount ELSE 0 END) as deposits,
+               SUM(CASE WHEN c.type = 'savings_income' THEN t.amount ELSE 0 END) as withdrawals
+        FROM {source} t
+        JOIN categories c ON t.category_id = c.id
+        WHERE c.type IN ('savings_income', 'savings_expense') {where}
+        GROUP BY month
+        ORDER BY month
+    ''', params).fetchall()
+
+    balance = opening
+    months = []
+    for row in rows:
+        balance += row['deposits'] - row['withdrawals']
+        months.append({
+            'month': row['month'],
+            'deposits': round(row['deposits'], 2),
+            'withdrawals': round(row['withdrawals'], 2),
+            'balance': round(balance, 2)
+        })
+    return {'opening_balance': round(opening, 2), 'months': months}
+
+
+REPORTS = {
+    'monthly_pivot': monthly_pivot,
+    'top_descriptions': top_descriptions,
+    'savings_trajectory': savings_trajectory,
+}
+
+
+# --- Выполнение в процессе пула ---
+
+def _run_job(job_id: int):
+    """Построить отчет задачи job_id (выполняется в процессе пула)"""
+    status_conn = database.connect(readonly=True)
+
+    def cancelled():
+        row = status_conn.execute("SELECT status FROM report_jobs WHERE id = ?", (job_id,)).fetchone()
+        return row is None or row[0] == 'cancelled'
+
+    try:
+        with get_read_db() as conn:
+            # Поколение снимка записывается при старте: пока отчет строится, такой же
+            # запрос для этого поколения получает эту задачу, а не ставит новую
+            generation = get_ledger_generation(conn)
+            with get_db() as write_conn:
+                job = write_conn.execute(
+                    "SELECT kind, params, status FROM report_jobs WHERE id = ?", (job_id,)
+                ).fetchone()
+                if job is None or job['status'] != 'queued':
+                    return  # отменена, пока ждала в очереди
+                write_conn.execute(
+                    """UPDATE report_jobs SET status = 'running', generation = ?, started_at = CURRENT_TIMESTAMP
+                       WHERE id = ?""",
+                    (generation, job_id)
+                )
+                write_conn.commit()
+
+            # Ненулевой ответ обработчика прерывает текущий запрос (OperationalError: interrupted)
+            conn.set_progress_handler(lambda: 1 if cancelled() else 0, _CANCEL_CHECK_STEPS)
+            try:
+                result = REPORTS[job['kind']](conn, **json.loads(job['params']))
+            finally:
+                conn.set_progress_handler(None, 0)
+        status, error, result = 'done', None, json.dumps(result, ensure_ascii=False)
+    except Exception as e:
+        if cancelled():
+            return
+        status, error, generation, result = 'failed', str(e), None, None
+    finally:
+        status_conn.close()
+
+    with get_db() as conn:
+        conn.execute(
+            """UPDATE report_jobs
+               SET status = ?, generation = ?, result = ?, error = ?, finished_at = CURRENT_TIMESTAMP
+               WHERE id = ? AND status IN ('queued', 'running')""",
+            (status, generation, result, error, job_id)
+        )
+        conn.commit()
+
+
+# --- Очередь в процессе приложения ---
+
+_pool = None
+_pool_lock = threading.Lock()
+_futures = {}
+_owner_lock = None
+
+
+def _get_pool(broken=None):
+    """Пул процессов; broken - сломанный пул (процесс упал), который нужно заменить"""
+    global _pool
+    with _pool_lock:
+        if broken is not None and _pool is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+        if _pool is None:
+            # spawn: дочерний процесс не наследует потоки и блокировки приложения
+            _pool = ProcessPoolExecutor(max_workers=config.REPORTS_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+@database.on_configure
+def _drop_pool():
+    """Процессы пула открыли прежнюю БД: следующая задача запустит новый пул"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+def _owner_lock_path(pid: int):
+    return os.path.join(_OWNERS_DIR, f"owner_{pid}.lock")
+
+
+def start():
+    """Зарегистрировать процесс владельцем задач и закрыть задачи завершившихся процессов"""
+    global _owner_lock
+    if _owner_lock is None:
+        _owner_lock = try_file_lock(_owner_lock_path(os.getpid()))
+
+    with get_db() as conn:
+        owners = [row['owner'] for row in conn.execute(
+            "SELECT DISTINCT owner FROM report_jobs WHERE status IN ('queued', 'running') AND owner != ?",
+            (os.getpid(),)
+        )]
+        for owner in owners:
+            # Блокировку владельца удалось захватить - процесс-владелец уже не работает
+            lock = try_file_lock(_owner_lock_path(owner))
+            if lock is None:
+                continue
+            conn.execute(
+                '''UPDATE report_jobs SET status = 'failed', error = 'Прервано перезапуском сервера',
+                   finished_at = CURRENT_TIMESTAMP
+                   WHERE owner = ? AND status IN ('queued', 'running')''',
+                (owner,)
+            )
+            lock.release()
+            if os.path.exists(lock.path):
+                os.remove(lock.path)
+        conn.commit()
+
+
+def stop():
+    """Остановить пул: задачи в очереди отменяются, выполняющиеся прерываются"""
+    global _pool, _owner_lock
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        for job_id in list(_futures):
+            cancel_report(job_id)
+        pool.shutdown(wait=False, cancel_futures=True)
+    if _owner_lock is not None:
+        _owner_lock.release()
+        _owner_lock = None
+
+
+def _fail_job(job_id: int, error: str):
+    with get_db() as conn:
+        conn.execute(
+            '''UPDATE report_jobs SET status = 'failed', error = ?, finished_at = CURRENT_TIMESTAMP
+               WHERE id = ? AND status IN ('queued', 'running')''',
+            (error, job_id)
+        )
+        conn.commit()
+
+
+def _job_finished(job_id: int, pool, future):
+    _futures.pop(job_id, None)
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        # Процесс пула упал - задача сама не записала результат
+        _fail_job(job_id, str(error) or type(error).__name__)
+        if isinstance(error, BrokenProcessPool):
+            _get_pool(broken=pool)
+
+
+def submit_report(request):
+    """Поставить отчет в очередь. Возвращает ({'id', 'status', 'cached'}, None)"""
+    params = json.dumps({
+        'start_date': request.start_date.isoformat() if request.start_date else None,
+        'end_date': request.end_date.isoformat() if request.end_date else None,
+        'limit': request.limit
+    }, sort_keys=True)
+
+    try:
+        with get_db() as conn:
+            generation = get_ledger_generation(conn)
+            # Такая же задача в очереди, уже строящаяся или готовая для текущего поколения
+            existing = conn.execute(
+                '''SELECT id, status FROM report_jobs
+                   WHERE kind = ? AND params = ?
+                     AND (status = 'queued' OR (status IN ('running', 'done') AND generation = ?))
+                   ORDER BY id DESC LIMIT 1''',
+                (request.kind, params, generation)
+            ).fetchone()
+            if existing:
+                return {'id': existing['id'], 'status': existing['status'], 'cached': True}, None
+
+            pending = conn.execute(
+                "SELECT COUNT(*) FROM report_jobs WHERE status IN ('queued', 'running')"
+            ).fetchone()[0]
+            if pending >= config.REPORTS_MAX_PENDING:
+                return None, QUEUE_FULL
+
+            cursor = conn.execute(
+                "INSERT INTO report_jobs (kind, params, owner) VALUES (?, ?, ?)",
+                (request.kind, params, os.getpid())
+            )
+            job_id = cursor.lastrowid
+            # Храним последние REPORTS_KEEP задач
+            conn.execute(
+                "DELETE FROM report_jobs WHERE id <= ? AND status NOT IN ('queued', 'running')",
+                (job_id - config.REPORTS_KEEP,)
+            )
+            conn.commit()
+    except sqlite3.Error as e:
+        return None, f"Ошибка базы данных: {str(e)}"
+
+    pool = _get_pool()
+    try:
+        future = pool.submit(_run_job, job_id)
+    except BrokenProcessPool:
+        pool = _get_pool(broken=pool)
+        future = pool.submit(_run_job, job_id)
+    except Exception as e:
+        _fail_job(job_id, str(e))
+        raise
+    _futures[job_id] = future
+    future.add_done_callback(lambda f: _job_finished(job_id, pool, f))
+    return {'id': job_id, 'status': 'queued', 'cached': False}, None
+
+
+def get_report(job_id: int):
+    """Статус задачи и результат, если он готов"""
+    try:
+        with get_read_db() as conn:
+            job = conn.execute(
+                '''SELECT id, kind, params, status, generation, result, error,
+                          created_at, started_at, finished_at
+                   FROM report_jobs WHERE id = ?''',
+                (job_id,)
+            ).fetchone()
+            if job is None:
+                return None, "Отчет не найден"
+            job = dict(job)
+            job['params'] = json.loads(job['params'])
+            job['result'] = json.loads(job['result']) if job['result'] else None
+            return job, None
+    except sqlite3.Error as e:
+        return None, f"Ошибка базы данных: {str(e)}"
+
+
+def cancel_report(job_id: int):
+    """Отменить задачу в очереди или в работе"""
+    try:
+        with get_db() as conn:
+            cursor = conn.execute(
+                '''UPDATE report_jobs SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP
+                   WHERE id = ? AND status IN ('queued', 'running')''',
+                (job_id,)
+            )
+            if not cursor.rowcount:
+                return None, "Отчет не найден или уже завершен"
+            conn.commit()
+    except sqlite3.Error as e:
+        return None, f"Ошибка базы данных: {str(e)}"
+
+    future = _futures.get(job_id)
+    if future is not None:
+        future.cancel()
+    return job_id, None
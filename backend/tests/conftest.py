@@ -0,0 +1,80 @@
+"""Общие фикстуры тестов.
+
+Шаблон БД создается один раз за сессию: схема, начальные категории и данные
+фикстуры db_seed. Каждый тест получает свою копию шаблона (Connection.backup)
+в отдельном файле: database.configure переключает на неё писателя, читателей
+и кэши модулей, поэтому тесты не видят изменений друг друга.
+
+Данные шаблона задаются переопределением db_seed в conftest.py папки с тестами:
+    @pytest.fixture(scope="session")
+    def db_seed():
+        return lambda: crud.create_transaction(...)
+"""
+import os
+import sqlite3
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# БД, создаваемая при импорте database, - временная: рабочая папка data не затрагивается
+os.environ["FINANCE_DATABASE"] = ":memory:"
+os.environ.pop("FINANCE_DATA_DIR", None)
+
+import database  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def db_seed():
+    """Заполнение шаблона БД (None - только схема и начальные категории)"""
+    return None
+
+
+@pytest.fixture(scope="session")
+def db_template(tmp_path_factory, db_seed):
+    """Файл шаблона БД: создается и заполняется один раз за сессию"""
+    path = str(tmp_path_factory.mktemp("template") / "finance.db")
+    database.configure(path)
+    if db_seed is not None:
+        db_seed()
+    # Уходим с шаблона: соединения закрываются (WAL переносится в файл), и тесты его не меняют
+    database.configure(str(tmp_path_factory.mktemp("idle") / "finance.db"))
+    return path
+
+
+@pytest.fixture
+def db(db_template, tmp_path):
+    """Своя БД для теста: копия шаблона, на которую переключен процесс. Возвращает путь"""
+    path = str(tmp_path / "finance.db")
+    source = sqlite3.connect(database.sqlite_uri(db_template, mode="ro"), uri=True)
+    target = sqlite3.connect(path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    database.configure(path)
+    return path
+
+
+@pytest.fixture
+def categories(db):
+    """Идентификаторы начальных категорий по названию"""
+    with database.get_read_db() as conn:
+        return {row['name']: row['id'] for row in conn.execute("SELECT id, name FROM categories")}
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    """Клиент API без аутентификации и без startup (планировщики не запускаются)"""
+    from fastapi.testclient import TestClient
+
+    # main монтирует ../frontend относительно рабочей папки
+    monkeypatch.chdir(BACKEND_DIR)
+    import main
+
+    main.app.dependency_overrides[main.get_current_user] = lambda: {}
+    yield TestClient(main.app)
+    main.app.dependency_overrides.clear()
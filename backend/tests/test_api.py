@@ -0,0 +1,51 @@
+"""ETag списка транзакций и ответ 304"""
+
+
+def _list(client, **headers):
+    return client.get("/api/transactions", params={
+        'period': 'custom', 'start_date': '2024-01-01', 'end_date': '2024-12-31'}, headers=headers)
+
+
+def _create(client, category_id, amount='10'):
+    response = client.post("/api/transactions", json={
+        'amount': amount, 'category_id': category_id, 'date': '2024-07-01'})
+    assert response.status_code == 200
+    return response.json()['id']
+
+
+def test_unchanged_list_answers_304(client, categories):
+    _create(client, categories['Продукты'])
+    response = _list(client)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert len(response.json()) == 1
+
+    response = _list(client, **{'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert response.content == b''
+
+
+def test_etag_changes_with_ledger_and_parameters(client, categories):
+    etag = _list(client).headers['ETag']
+
+    _create(client, categories['Продукты'])
+    response = _list(client, **{'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert len(response.json()) == 1
+
+    # Другие параметры запроса - другой ETag
+    etag = response.headers['ETag']
+    response = client.get("/api/transactions", params={
+        'period': 'custom', 'start_date': '2024-01-01', 'end_date': '2024-12-31', 'format': 'columnar'},
+        headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_etag_changes_with_categories(client, categories):
+    etag = _list(client).headers['ETag']
+    response = client.post("/api/categories", json={'name': 'Книги', 'type': 'expense'})
+    assert response.status_code == 200
+    assert _list(client, **{'If-None-Match': etag}).status_code == 200
@@ -0,0 +1,86 @@
+"""Архивные годы: чтение архива вместе с горячей таблицей и запрет изменений (409)"""
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+import archive
+import config
+import crud
+from models import TransactionCreate, TransactionFilter
+
+ARCHIVED = date(2020, 6, 1)
+HOT = date(2025, 6, 1)
+
+
+@pytest.fixture
+def archived(categories, tmp_path, monkeypatch):
+    """2020 год в архиве, 2025 - в горячей таблице. Возвращает id архивной транзакции"""
+    monkeypatch.setattr(config, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    rows = [(ARCHIVED, '1000', 'Зарплата'), (ARCHIVED, '300', 'Продукты'), (ARCHIVED, '50', 'Связь'),
+            (HOT, '2000', 'Зарплата'), (HOT, '400', 'Продукты')]
+    ids = []
+    for on_date, amount, category in rows:
+        transaction_id, error = crud.create_transaction(TransactionCreate(
+            amount=Decimal(amount), category_id=categories[category], date=on_date, description=category))
+        assert error is None
+        ids.append(transaction_id)
+
+    count, error = archive.archive_year(2020)
+    assert (count, error) == (3, None)
+    return ids[0]
+
+
+def _analytics(**kwargs):
+    analytics, error = crud.get_analytics('custom', date(2020, 1, 1), date(2025, 12, 31), **kwargs)
+    assert error is None
+    return analytics
+
+
+def test_transactions_union_archive_and_hot(archived):
+    transactions, error = crud.get_transactions(date(2020, 1, 1), date(2025, 12, 31))
+    assert error is None
+    assert sorted((t['date'], t['amount']) for t in transactions) == [
+        ('2020-06-01', 50), ('2020-06-01', 300), ('2020-06-01', 1000),
+        ('2025-06-01', 400), ('2025-06-01', 2000),
+    ]
+
+    # Период без архивного года архив не подключает
+    transactions, error = crud.get_transactions(date(2025, 1, 1), date(2025, 12, 31))
+    assert error is None
+    assert len(transactions) == 2
+
+
+def test_analytics_union_archive_and_hot(archived, categories):
+    analytics = _analytics()
+    assert analytics['total_income'] == Decimal('3000')
+    assert analytics['total_expense'] == Decimal('750')
+
+    # С фильтром архив читается по строкам, а не по итогам дней
+    analytics = _analytics(filter=TransactionFilter(category_ids=[categories['Продукты']]))
+    assert analytics['total_income'] == Decimal('0')
+    assert analytics['total_expense'] == Decimal('700')
+
+
+def test_writes_to_archived_year_answer_409(archived, categories, client):
+    response = client.post("/api/transactions", json={
+        'amount': '10', 'category_id': categories['Продукты'], 'date': '2020-02-02'})
+    assert response.status_code == 409
+    assert response.json()['detail'] == crud.ARCHIVED_YEAR_ERROR
+
+    response = client.put(f"/api/transactions/{archived}", json={
+        'amount': '10', 'category_id': categories['Зарплата'], 'date': '2020-06-01'})
+    assert response.status_code == 409
+
+    response = client.delete(f"/api/transactions/{archived}")
+    assert response.status_code == 409
+
+    # Перенос горячей транзакции в архивный год тоже запрещен
+    transactions, _ = crud.get_transactions(HOT, HOT)
+    response = client.put(f"/api/transactions/{transactions[0]['id']}", json={
+        'amount': '10', 'category_id': transactions[0]['category_id'], 'date': '2020-06-02'})
+    assert response.status_code == 409
+
+    # Несуществующая транзакция - по-прежнему 400
+    assert client.delete("/api/transactions/999999").status_code == 400
+    assert len(crud.get_transactions(date(2020, 1, 1), date(2020, 12, 31))[0]) == 3
@@ -0,0 +1,106 @@
+"""Счетчики трат бюджетов и пороги уведомлений при изменении транзакций"""
+from datetime import date
+from decimal import Decimal
+
+import crud
+from models import BudgetCreate, TransactionCreate, TransactionUpdate
+
+MARCH = date(2024, 3, 15)
+APRIL = date(2024, 4, 10)
+
+
+def _spent(budget_id, on_date):
+    status, error = crud.get_budgets_status(on_date)
+    assert error is None
+    return next(item['spent'] for item in status if item['budget_id'] == budget_id)
+
+
+def _alerts():
+    alerts, error = crud.get_budget_alerts()
+    assert error is None
+    return sorted((alert['period_start'], alert['threshold']) for alert in alerts)
+
+
+def _create(category_id, amount, on_date=MARCH):
+    transaction_id, error = crud.create_transaction(
+        TransactionCreate(amount=Decimal(amount), category_id=category_id, date=on_date))
+    assert error is None
+    return transaction_id
+
+
+def _update(transaction_id, category_id, amount, on_date=MARCH):
+    _, error = crud.update_transaction_crud(
+        transaction_id, TransactionUpdate(amount=Decimal(amount), category_id=category_id, date=on_date))
+    assert error is None
+
+
+def test_counters_follow_insert_update_delete(categories):
+    food = categories['Продукты']
+    budget_id, error = crud.create_budget(BudgetCreate(category_id=food, amount=Decimal('100')))
+    assert error is None
+
+    first = _create(food, '50')
+    second = _create(food, '20')
+    _create(categories['Транспорт'], '500')  # другая категория не входит в бюджет
+    assert _spent(budget_id, MARCH) == Decimal('70')
+
+    _update(second, food, '35')
+    assert _spent(budget_id, MARCH) == Decimal('85')
+
+    # Перенос в другой месяц уменьшает прежний период и увеличивает новый
+    _update(second, food, '35', APRIL)
+    assert _spent(budget_id, MARCH) == Decimal('50')
+    assert _spent(budget_id, APRIL) == Decimal('35')
+
+    # Смена категории выводит сумму из бюджета
+    _update(first, categories['Связь'], '50')
+    assert _spent(budget_id, MARCH) == Decimal('0')
+
+    _, error = crud.delete_transaction_crud(second)
+    assert error is None
+    assert _spent(budget_id, APRIL) == Decimal('0')
+
+
+def test_initial_spend_counts_existing_history(categories):
+    food = categories['Продукты']
+    _create(food, '30')
+    _create(food, '15', APRIL)
+
+    budget_id, error = crud.create_budget(BudgetCreate(category_id=food, amount=Decimal('100')))
+    assert error is None
+    assert _spent(budget_id, MARCH) == Decimal('30')
+    assert _spent(budget_id, APRIL) == Decimal('15')
+
+
+def test_alerts_fire_once_per_threshold_crossing(categories):
+    food = categories['Продукты']
+    _, error = crud.create_budget(BudgetCreate(category_id=food, amount=Decimal('100'), alert_threshold=80))
+    assert error is None
+
+    transaction_id = _create(food, '50')
+    assert _alerts() == []
+
+    _update(transaction_id, food, '85')
+    assert _alerts() == [('2024-03-01', 80)]
+
+    # Повторное изменение выше порога - не новое пересечение
+    _update(transaction_id, food, '90')
+    assert _alerts() == [('2024-03-01', 80)]
+
+    _create(food, '15')
+    assert _alerts() == [('2024-03-01', 80), ('2024-03-01', 100)]
+
+    # После удаления трата ниже порога: следующее пересечение снова уведомляет
+    _, error = crud.delete_transaction_crud(transaction_id)
+    assert error is None
+    _create(food, '70')
+    assert _alerts() == [('2024-03-01', 80), ('2024-03-01', 80), ('2024-03-01', 100)]
+
+
+def test_reached_threshold_is_not_alerted_on_create(categories):
+    food = categories['Продукты']
+    _create(food, '90')
+    _, error = crud.create_budget(BudgetCreate(category_id=food, amount=Decimal('100'), alert_threshold=80))
+    assert error is None
+    _create(food, '1')
+    assert _alerts() == []
@@ -0,0 +1,105 @@
+"""Правила категоризации (apply_rules), объединение категорий и перенос транзакций"""
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+import crud
+from database import get_read_db
+from models import BudgetCreate, CategoryRuleCreate, TransactionCreate, TransactionFilter
+
+JUNE = date(2024, 6, 3)  # понедельник
+
+
+@pytest.fixture
+def add(categories):
+    """Создать транзакцию: add(категория, сумма, описание, дата)"""
+    def add(category, amount, description=None, on_date=JUNE):
+        transaction_id, error = crud.create_transaction(TransactionCreate(
+            amount=Decimal(amount), category_id=categories[category], date=on_date, description=description))
+        assert error is None
+        return transaction_id
+    return add
+
+
+def _rule(category_id, **kwargs):
+    rule_id, error = crud.create_rule(CategoryRuleCreate(category_id=category_id, **kwargs))
+    assert error is None
+    return rule_id
+
+
+def _category_of(transaction_id):
+    with get_read_db() as conn:
+        return conn.execute("SELECT category_id FROM transactions WHERE id = ?", (transaction_id,)).fetchone()[0]
+
+
+def test_apply_rules_precedence(categories, add):
+    _rule(categories['Транспорт'], pattern='такси')
+    _rule(categories['Развлечения'], pattern='такси')  # тот же приоритет, но позже - проигрывает
+    _rule(categories['Кафе и рестораны'], pattern='^такси в кафе', match_type='regex', priority=10)
+    _rule(categories['Зарплата'], amount_min=Decimal('1000'), priority=1)
+    _rule(categories['Здоровье'], pattern='аптека', weekdays=[1])
+
+    taxi = add('Продукты', '100', 'такси домой')
+    cafe = add('Продукты', '100', 'такси в кафе')
+    large = add('Продукты', '2000', 'такси в аэропорт')
+    pharmacy = add('Продукты', '100', 'аптека')  # понедельник, правило - только для вторника
+    income = add('Подарок', '5000', 'премия')
+    outside = add('Продукты', '100', 'такси', date(2024, 7, 1))
+
+    assert crud.apply_rules(date(2024, 6, 1), date(2024, 6, 30)) == (3, None)
+    assert _category_of(taxi) == categories['Транспорт']
+    assert _category_of(cafe) == categories['Кафе и рестораны']
+    # Приоритетнее правило доходов: расход не превращается в доход и не уходит к следующему правилу
+    assert _category_of(large) == categories['Продукты']
+    assert _category_of(pharmacy) == categories['Продукты']
+    assert _category_of(income) == categories['Зарплата']
+    assert _category_of(outside) == categories['Продукты']
+
+    # Повторное применение ничего не меняет
+    assert crud.apply_rules(date(2024, 6, 1), date(2024, 6, 30)) == (0, None)
+
+
+def test_apply_rules_moves_budget_spend(categories, add):
+    budget_id, error = crud.create_budget(BudgetCreate(category_id=categories['Транспорт'], amount=Decimal('100')))
+    assert error is None
+    add('Продукты', '40', 'такси')
+    _rule(categories['Транспорт'], pattern='такси')
+
+    assert crud.apply_rules() == (1, None)
+    status, _ = crud.get_budgets_status(JUNE)
+    assert next(item['spent'] for item in status if item['budget_id'] == budget_id) == Decimal('40')
+
+
+def test_merge_category_counts(categories, add):
+    cafe, food = categories['Кафе и рестораны'], categories['Продукты']
+    for _ in range(3):
+        add('Кафе и рестораны', '10')
+    add('Продукты', '10')
+    rule_id = _rule(cafe, pattern='кофе')
+
+    assert crud.merge_category(cafe, food) == (3, None)
+    with get_read_db() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM transactions WHERE category_id = ?", (food,)).fetchone()[0] == 4
+        assert conn.execute("SELECT is_active FROM categories WHERE id = ?", (cafe,)).fetchone()[0] == 0
+        assert conn.execute("SELECT category_id FROM category_rules WHERE id = ?", (rule_id,)).fetchone()[0] == food
+
+    # Объединять можно только активные категории одного типа
+    assert crud.merge_category(cafe, food)[1] == "Категория не найдена или неактивна"
+    assert crud.merge_category(food, categories['Зарплата'])[1] == "Объединять можно только категории одного типа"
+
+
+def test_recategorize_counts(categories, add):
+    transport = categories['Транспорт']
+    add('Продукты', '10', 'такси')
+    add('Связь', '20', 'Такси')
+    add('Продукты', '30', 'такси', date(2024, 8, 1))
+    add('Транспорт', '40', 'такси')
+    add('Подарок', '50', 'такси')  # доход не переносится в расходы
+
+    updated = crud.recategorize_transactions(transport, date(2024, 6, 1), date(2024, 6, 30),
+                                             TransactionFilter(description='такси'))
+    assert updated == (2, None)
+
+    assert crud.recategorize_transactions(transport, filter=TransactionFilter(description='такси')) == (1, None)
+    assert crud.recategorize_transactions(transport)[1] == "Укажите период или фильтр транзакций"
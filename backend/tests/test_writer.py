@@ -0,0 +1,82 @@
+"""Групповой коммит: ошибка операции откатывает только её точку сохранения"""
+from concurrent.futures import Future
+from datetime import date
+from decimal import Decimal
+
+import crud
+import writer
+from database import get_read_db
+from models import BudgetCreate, TransactionCreate
+
+
+def _insert(description, category_id):
+    return TransactionCreate(amount=Decimal('10'), category_id=category_id, date=date(2024, 5, 1),
+                             description=description)
+
+
+def _insert_then_fail(conn, transaction):
+    """Вставляет строку и возвращает ошибку: вставка должна откатиться"""
+    crud.insert_transaction(conn, transaction)
+    return None, "отказ", None
+
+
+def _insert_then_raise_sqlite(conn, transaction):
+    crud.insert_transaction(conn, transaction)
+    conn.execute("INSERT INTO no_such_table VALUES (1)")
+
+
+def _insert_then_raise(conn, transaction):
+    crud.insert_transaction(conn, transaction)
+    raise ValueError("сбой")
+
+
+def _descriptions():
+    with get_read_db() as conn:
+        return sorted(row[0] for row in conn.execute("SELECT description FROM transactions"))
+
+
+def test_failed_operation_rolls_back_only_itself(categories):
+    food = categories['Продукты']
+    batch = [
+        (crud.insert_transaction, (_insert('first', food),), Future()),
+        (_insert_then_fail, (_insert('error', food),), Future()),
+        (_insert_then_raise_sqlite, (_insert('sqlite', food),), Future()),
+        (_insert_then_raise, (_insert('exception', food),), Future()),
+        (crud.insert_transaction, (_insert('last', food),), Future()),
+    ]
+    writer._apply(batch)
+    first, error, sqlite_error, exception, last = (future for _, _, future in batch)
+
+    assert first.result()[1] is None
+    assert error.result() == (None, "отказ")
+    assert sqlite_error.result()[1].startswith("Ошибка базы данных")
+    assert isinstance(exception.exception(), ValueError)
+    assert last.result()[1] is None
+    assert _descriptions() == ['first', 'last']
+
+
+def test_failed_operation_keeps_budget_counters(categories):
+    food = categories['Продукты']
+    budget_id, error = crud.create_budget(BudgetCreate(category_id=food, amount=Decimal('100')))
+    assert error is None
+
+    batch = [
+        (crud.insert_transaction, (_insert('kept', food),), Future()),
+        (_insert_then_fail, (_insert('dropped', food),), Future()),
+    ]
+    writer._apply(batch)
+
+    with get_read_db() as conn:
+        spent = conn.execute("SELECT spent FROM budget_spend WHERE budget_id = ?", (budget_id,)).fetchone()[0]
+    assert spent == 10
+
+
+def test_queue_runs_operations(categories):
+    transaction_id, error = writer.execute(crud.insert_transaction, _insert('queued', categories['Продукты']))
+    assert error is None and transaction_id
+    assert _descriptions() == ['queued']
+
+
+def test_operation_error_is_not_raised(categories):
+    result, error = writer.execute(crud.insert_transaction, _insert('x', 10 ** 6))
+    assert result is None and error == "Категория не найдена или неактивна"
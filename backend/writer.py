@@ -0,0 +1,145 @@
+"""Групповой коммит изменений транзакций.
+
+Создание, изменение и удаление транзакций выполняет один поток-писатель. Он
+забирает из очереди всё, что накопилось (и ждет еще до WRITE_BATCH_WINDOW_MS,
+пока в пачке меньше WRITE_BATCH_MAX операций), и применяет пачку в одной
+транзакции SQLite с одним коммитом вместо коммита на каждую операцию.
+
+Каждая операция выполняется в своей точке сохранения (SAVEPOINT): ошибка одной
+операции откатывает только её изменения. Действия после коммита (патчи
+аналитического движка) выполняются в порядке операций, затем каждый вызывающий
+получает свой результат.
+"""
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+import config
+from database import get_db
+
+_queue = queue.Queue()
+_thread = None
+_thread_lock = threading.Lock()
+_STOP = object()
+
+
+def submit(operation, *args):
+    """Поставить операцию в очередь писателя. Возвращает Future с (результат, ошибка).
+
+    operation(conn, *args) выполняется внутри общей транзакции и возвращает
+    (результат, ошибка, действие после коммита или None).
+    """
+    if threading.current_thread() is _thread:
+        raise RuntimeError("Операция писателя не может ждать другую операцию писателя")
+    future = Future()
+    _queue.put((operation, args, future))
+    _ensure_started()
+    return future
+
+
+def execute(operation, *args):
+    """Выполнить операцию через очередь писателя и дождаться результата"""
+    return submit(operation, *args).result()
+
+
+async def execute_async(operation, *args):
+    """То же для обработчиков запросов: цикл событий не блокируется, пока операция ждет коммита"""
+    return await asyncio.wrap_future(submit(operation, *args))
+
+
+def _ensure_started():
+    global _thread
+    if _thread is not None:
+        return
+    with _thread_lock:
+        if _thread is None:
+            thread = threading.Thread(target=_run, name="group-commit-writer", daemon=True)
+            thread.start()
+            _thread = thread
+
+
+def stop():
+    """Дописать операции из очереди и остановить писателя"""
+    global _thread
+    with _thread_lock:
+        thread, _thread = _thread, None
+    if thread is not None:
+        _queue.put(_STOP)
+        thread.join()
+
+
+def _next_batch():
+    """Пачка операций из очереди (None - писатель остановлен)"""
+    item = _queue.get()
+    if item is _STOP:
+        return None
+    batch = [item]
+    deadline = time.monotonic() + config.WRITE_BATCH_WINDOW_MS / 1000
+    while len(batch) < config.WRITE_BATCH_MAX:
+        timeout = deadline - time.monotonic()
+        try:
+            item = _queue.get(timeout=timeout) if timeout > 0 else _queue.get_nowait()
+        except queue.Empty:
+            break
+        if item is _STOP:
+            _queue.put(_STOP)  # остановимся после этой пачки
+            break
+        batch.append(item)
+    return batch
+
+
+def _run():
+    while True:
+        batch = _next_batch()
+        if batch is None:
+            return
+        _apply(batch)
+
+
+def _apply(batch):
+    outcomes = []      # (future, (результат, ошибка) или исключение)
+    after_commit = []
+    try:
+        with get_db() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for operation, args, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT operation")
+                try:
+                    result, error, action = operation(conn, *args)
+                except sqlite3.Error as e:
+                    if not conn.in_transaction:
+                        raise  # SQLite откатил всю транзакцию - пачка не записана
+                    result, error, action = None, f"Ошибка базы данных: {str(e)}", None
+                except Exception as e:
+                    conn.execute("ROLLBACK TO operation")
+                    conn.execute("RELEASE operation")
+                    outcomes.append((future, e))
+                    continue
+                if error:
+                    conn.execute("ROLLBACK TO operation")
+                elif action is not None:
+                    after_commit.append(action)
+                conn.execute("RELEASE operation")
+                outcomes.append((future, (result, error)))
+            conn.commit()
+    except Exception as e:
+        failure = (None, f"Ошибка базы данных: {str(e)}") if isinstance(e, sqlite3.Error) else e
+        outcomes = [(future, failure) for _, _, future in batch if not future.done()]
+        after_commit = []
+
+    for action in after_commit:
+        try:
+            action()
+        except Exception as e:
+            # Изменения уже записаны: сбой производных структур не должен терять результат
+            print(f"❌ [WRITER] Действие после коммита: {e}")
+    for future, outcome in outcomes:
+        if isinstance(outcome, Exception):
+            future.set_exception(outcome)
+        else:
+            future.set_result(outcome)
@@ -17,6 +17,13 @@ class FinanceTracker {
         this.authToken = localStorage.getItem('authToken');
         this.isAuthenticated = false;
         this.passwordSet = false;
+        this.store = new LedgerStore();
+        this.serverTransactions = [];
+        this.etag = null;
+        this.outbox = [];
+        this.offline = false;
+        this.flushing = null;
+        this.reconnectTimer = null;
         this.init();
     }
 
@@ -26,6 +33,13 @@ class FinanceTracker {
             await this.checkAuthStatus();
         } catch (error) {
             console.error('Auth check failed:', error);
+            // Сервер недоступен: с сохраненным токеном открываем локальную копию данных
+            if (error.offline && this.authToken) {
+                this.isAuthenticated = true;
+                this.offline = true;
+                await this.initializeApp();
+                return;
+            }
             this.showAuthForm();
             return;
         }
@@ -124,6 +138,9 @@ class FinanceTracker {
                         localStorage.removeItem('authToken');
                     }
                 } catch (e) {
+                    if (e.offline) {
+                        throw e;
+                    }
                     this.authToken = null;
                     localStorage.removeItem('authToken');
                 }
@@ -156,16 +173,71 @@ class FinanceTracker {
         document.getElementById('periodSelect').value = this.currentPeriod;
         this.toggleCustomDateRange();
         this.setupEventListeners();
-        await this.loadCategories();
-        await this.loadTransactions();
-        await this.loadAnalytics();
-        await this.loadSavingsAnalytics();
+        // Сначала локальная копия: дашборд виден сразу, сервер проверяется после
+        await this.store.open();
+        this.outbox = await this.store.getOutbox().catch(() => []);
+        const categories = await this.store.getMeta('categories').catch(() => undefined);
+        if (categories) {
+            this.categories = categories;
+            this.updateCategorySelects();
+        }
+        await this.showCachedTransactions();
         this.updateView();
         this.renderCategoriesSettings();
         this.hideAuthForms();
+        window.addEventListener('online', () => this.goOnline());
+        window.addEventListener('offline', () => this.goOffline());
+        if (this.offline) {
+            this.goOffline();
+            this.showSnackbar('Нет связи с сервером: показаны сохраненные данные', 'error');
+            return;
+        }
+        await this.syncWithServer();
+    }
+
+    // Отправить изменения, сделанные без связи, и сверить локальную копию с сервером
+    async syncWithServer() {
+        await this.flushOutbox();
+        await this.loadCategories();
+        await this.refreshPeriod();
+        this.renderCategoriesSettings();
+        if (this.currentView === 'edit') {
+            this.loadTransactionsForEdit();
+        }
+    }
+
+    // Сервер недоступен: изменения копятся в очереди, связь периодически проверяется
+    goOffline() {
+        this.offline = true;
+        if (this.reconnectTimer) return;
+        this.reconnectTimer = setInterval(async () => {
+            try {
+                await fetch(`${this.apiUrl}/auth/status`, {cache: 'no-store'});
+            } catch (e) {
+                return;
+            }
+            this.goOnline();
+        }, 15000);
+    }
+
+    async goOnline() {
+        clearInterval(this.reconnectTimer);
+        this.reconnectTimer = null;
+        if (!this.offline || !this.isAuthenticated) {
+            this.offline = false;
+            return;
+        }
+        this.offline = false;
+        await this.syncWithServer();
     }
 
     async apiCall(endpoint, options = {}, requireAuth = true) {
+        const {data} = await this.apiRequest(endpoint, options, requireAuth);
+        return data;
+    }
+
+    // Запрос с доступом к самому ответу (статус, заголовки). 304 возвращается без тела
+    async apiRequest(endpoint, options = {}, requireAuth = true) {
         const headers = {
             'Content-Type': 'application/json',
             ...options.headers
@@ -173,35 +245,39 @@ class FinanceTracker {
         if (this.authToken && requireAuth) {
             headers['Authorization'] = `Bearer ${this.authToken}`;
         }
+        let response;
         try {
-            const response = await fetch(`${this.apiUrl}${endpoint}`, {
-                headers,
-                ...options
+            response = await fetch(`${this.apiUrl}${endpoint}`, {
+                ...options,
+                headers
             });
-            if (response.status === 401 && requireAuth) {
-                this.handleAuthError();
-                throw new Error('Требуется аутентификация');
-            }
-            let data;
-            try {
-                data = await response.json();
-            } catch (e) {
-                data = {detail: `Ошибка парсинга ответа: ${e.message}`};
-            }
-            if (!response.ok) {
-                const errorMessage = data.detail || data.message || data.error || `Ошибка ${response.status}`;
-                this.showSnackbar(errorMessage, 'error');
-                throw new Error(errorMessage);
-            }
-            return data;
         } catch (error) {
-            if (error.message === 'Failed to fetch') {
-                const errorMessage = 'Не удалось подключиться к серверу';
-                this.showSnackbar(errorMessage, 'error');
-                throw new Error(errorMessage);
-            }
-            throw error;
+            // Ответа нет совсем: сервер недоступен или нет сети
+            const errorMessage = 'Не удалось подключиться к серверу';
+            this.showSnackbar(errorMessage, 'error');
+            const offlineError = new Error(errorMessage);
+            offlineError.offline = true;
+            throw offlineError;
+        }
+        if (response.status === 401 && requireAuth) {
+            this.handleAuthError();
+            throw new Error('Требуется аутентификация');
         }
+        if (response.status === 304) {
+            return {response, data: null};
+        }
+        let data;
+        try {
+            data = await response.json();
+        } catch (e) {
+            data = {detail: `Ошибка парсинга ответа: ${e.message}`};
+        }
+        if (!response.ok) {
+            const errorMessage = data.detail || data.message || data.error || `Ошибка ${response.status}`;
+            this.showSnackbar(errorMessage, 'error');
+            throw new Error(errorMessage);
+        }
+        return {response, data};
     }
 
     handleAuthError() {
@@ -243,9 +319,7 @@ class FinanceTracker {
             this.currentPeriod = e.target.value;
             localStorage.setItem('selectedPeriod', this.currentPeriod);
             this.toggleCustomDateRange();
-            this.loadTransactions();
-            this.loadAnalytics();
-            this.loadSavingsAnalytics();
+            this.loadPeriod();
         });
     }
 
@@ -390,25 +464,350 @@ class FinanceTracker {
         try {
             this.categories = await this.apiCall('/categories');
             this.updateCategorySelects();
+            this.store.putMeta('categories', this.categories).catch(error => {
+                console.warn('Failed to cache categories:', error);
+            });
         } catch (error) {
             console.error('Failed to load categories:', error);
         }
     }
 
-    async loadTransactions() {
-        try {
-            let url = `/transactions?period=${this.currentPeriod}&include_savings=true`;
-            if (this.currentPeriod === 'custom') {
+    // Компактный формат: столбцы + словарь категорий -> привычный массив объектов
+    decodeColumnarTransactions(data) {
+        if (Array.isArray(data)) {
+            return data;
+        }
+        const {id, amount, category_id, date, description, created_at} = data.columns;
+        const transactions = new Array(data.count);
+        for (let i = 0; i < data.count; i++) {
+            const category = data.categories[category_id[i]];
+            transactions[i] = {
+                id: id[i],
+                amount: amount[i],
+                category_id: category_id[i],
+                date: date[i],
+                description: description[i],
+                created_at: created_at[i],
+                category_name: category.name,
+                category_type: category.type,
+                category_color: category.color
+            };
+        }
+        return transactions;
+    }
+
+    // Запрос с уже вычисленными границами периода: URL служит и ключом локальной копии,
+    // поэтому после смены месяца (недели, года) копия прошлого периода не выдается за текущую
+    transactionsUrl() {
+        const {start_date, end_date} = this.periodRange();
+        let url = '/transactions?include_savings=true&format=columnar';
+        if (start_date && end_date) {
+            url += `&period=custom&start_date=${start_date}&end_date=${end_date}`;
+        } else {
+            url += '&period=all';
+        }
+        return url;
+    }
+
+    // Границы текущего периода - как calculate_period_dates на сервере (null - без границы)
+    periodRange() {
+        const today = new Date();
+        const year = today.getFullYear();
+        const month = today.getMonth();
+        let start = null;
+        let end = null;
+        switch (this.currentPeriod) {
+            case 'today':
+                start = end = today;
+                break;
+            case 'week':
+                start = new Date(year, month, today.getDate() - (today.getDay() + 6) % 7);
+                end = new Date(start.getFullYear(), start.getMonth(), start.getDate() + 6);
+                break;
+            case 'quarter':
+                start = new Date(year, month - month % 3, 1);
+                end = new Date(year, month - month % 3 + 3, 0);
+                break;
+            case 'year':
+                start = new Date(year, 0, 1);
+                end = new Date(year, 11, 31);
+                break;
+            case 'all':
+                break;
+            case 'custom': {
                 const startDate = document.getElementById('startDate').value;
                 const endDate = document.getElementById('endDate').value;
                 if (startDate && endDate) {
-                    url += `&start_date=${startDate}&end_date=${endDate}`;
+                    return {start_date: startDate, end_date: endDate};
                 }
+                return {start_date: null, end_date: null};
             }
-            this.transactions = await this.apiCall(url);
+            default:
+                start = new Date(year, month, 1);
+                end = new Date(year, month + 1, 0);
+        }
+        const isoDate = value => value && [
+            value.getFullYear(),
+            String(value.getMonth() + 1).padStart(2, '0'),
+            String(value.getDate()).padStart(2, '0')
+        ].join('-');
+        return {start_date: isoDate(start), end_date: isoDate(end)};
+    }
+
+    // Период: сразу локальная копия, затем проверка на сервере
+    async loadPeriod() {
+        await this.showCachedTransactions();
+        if (!this.offline) {
+            await this.refreshPeriod();
+        }
+        if (this.currentView === 'edit') {
+            this.loadTransactionsForEdit();
+        }
+    }
+
+    // Сохраненный список периода с неотправленными изменениями и итоги, посчитанные на клиенте
+    async showCachedTransactions() {
+        const cached = await this.store.getPeriod(this.transactionsUrl()).catch(() => undefined);
+        this.etag = cached ? cached.etag : null;
+        this.serverTransactions = cached ? this.decodeColumnarTransactions(cached.data) : [];
+        this.transactions = this.applyPendingEdits(this.serverTransactions);
+        this.renderTransactions();
+        this.showLocalAnalytics();
+    }
+
+    // Аналитика запрашивается у сервера, только если список периода изменился.
+    // Пока в очереди есть неотправленные изменения, итоги считаются на клиенте
+    async refreshPeriod() {
+        const changed = await this.loadTransactions();
+        if (!changed) {
+            return;
+        }
+        if (this.outbox.length) {
+            this.showLocalAnalytics();
+            return;
+        }
+        await this.loadAnalytics();
+        await this.loadSavingsAnalytics();
+    }
+
+    // Условный запрос с ETag сохраненной копии. false - список не изменился (304) или не загружен
+    async loadTransactions() {
+        try {
+            const url = this.transactionsUrl();
+            const headers = this.etag ? {'If-None-Match': this.etag} : {};
+            const started = performance.now();
+            const {response, data} = await this.apiRequest(url, {headers});
+            if (url !== this.transactionsUrl()) {
+                return false;  // Период сменился, пока шел запрос
+            }
+            if (response.status === 304) {
+                console.debug(`Transactions: not modified, ${(performance.now() - started).toFixed(1)}ms`);
+                return false;
+            }
+            const received = performance.now();
+            this.serverTransactions = this.decodeColumnarTransactions(data);
+            this.etag = response.headers.get('ETag');
+            this.transactions = this.applyPendingEdits(this.serverTransactions);
+            console.debug(`Transactions: ${this.transactions.length} rows, ` +
+                `fetch+parse ${(received - started).toFixed(1)}ms, decode ${(performance.now() - received).toFixed(1)}ms`);
             this.renderTransactions();
+            if (this.etag) {
+                this.store.putPeriod(url, this.etag, data).catch(error => {
+                    console.warn('Failed to cache transactions:', error);
+                });
+            }
+            return true;
         } catch (error) {
             console.error('Failed to load transactions:', error);
+            return false;
+        }
+    }
+
+    // Неотправленные изменения поверх последней копии с сервера
+    applyPendingEdits(transactions) {
+        if (this.outbox.length === 0) {
+            return transactions;
+        }
+        const {start_date, end_date} = this.periodRange();
+        const inPeriod = date => (!start_date || date >= start_date) && (!end_date || date <= end_date);
+        let result = transactions;
+        for (const edit of this.outbox) {
+            result = result.filter(transaction => transaction.id !== edit.transactionId);
+            if (edit.method !== 'DELETE' && inPeriod(edit.body.date)) {
+                const category = this.categories.find(cat => cat.id === edit.body.category_id) || {};
+                result.push({
+                    ...edit.body,
+                    id: edit.transactionId,
+                    created_at: null,
+                    category_name: category.name,
+                    category_type: category.type,
+                    category_color: category.color,
+                    pending: true
+                });
+            }
+        }
+        // Как на сервере: новые даты сверху (сортировка устойчивая)
+        return result.sort((a, b) => (a.date < b.date) - (a.date > b.date));
+    }
+
+    showLocalAnalytics() {
+        this.analytics = this.aggregateAnalytics(this.transactions, false);
+        this.savingsAnalytics = this.aggregateAnalytics(this.transactions, true);
+        this.updateStats();
+        this.renderCategoryAnalytics();
+        this.updateSavingsStats();
+        this.renderSavingsCategoryAnalytics();
+        if (this.currentView === 'main') {
+            this.renderCharts();
+        } else if (this.currentView === 'savings') {
+            this.renderSavingsCharts();
+        }
+    }
+
+    // Итоги по списку транзакций - в том же виде, что и ответ /analytics сервера
+    aggregateAnalytics(transactions, includeSavings) {
+        const round = value => Math.round(value * 100) / 100;
+        const isSavings = type => type === 'savings_income' || type === 'savings_expense';
+        const totals = {income: 0, expense: 0, savings_income: 0, savings_expense: 0};
+        const savings = {savings_income: 0, savings_expense: 0};
+        const categories = new Map();
+        const daily = new Map();
+        const savingsDaily = new Map();
+        for (const transaction of transactions) {
+            const type = transaction.category_type;
+            const amount = Number(transaction.amount);
+            if (isSavings(type)) {
+                savings[type] += amount;
+                if (!savingsDaily.has(transaction.date)) {
+                    savingsDaily.set(transaction.date, {date: transaction.date, savings_income: 0, savings_expense: 0});
+                }
+                savingsDaily.get(transaction.date)[type] += amount;
+                if (!includeSavings) continue;
+            }
+            totals[type] += amount;
+            if (!categories.has(transaction.category_id)) {
+                categories.set(transaction.category_id, {
+                    category_name: transaction.category_name,
+                    category_type: type,
+                    category_color: transaction.category_color,
+                    total: 0
+                });
+            }
+            categories.get(transaction.category_id).total += amount;
+            if (!daily.has(transaction.date)) {
+                daily.set(transaction.date, {date: transaction.date, income: 0, expense: 0});
+            }
+            if (type === 'income' || type === 'expense') {
+                daily.get(transaction.date)[type] += amount;
+            }
+        }
+        const byDate = (a, b) => (a.date > b.date) - (a.date < b.date);
+        const roundFields = (item, fields) => {
+            fields.forEach(field => item[field] = round(item[field]));
+            return item;
+        };
+        return {
+            total_income: round(totals.income),
+            total_expense: round(totals.expense),
+            balance: round(totals.income - totals.expense),
+            savings_income: round(savings.savings_income),
+            savings_expense: round(savings.savings_expense),
+            savings_balance: round(savings.savings_expense - savings.savings_income),
+            by_category: [...categories.values()]
+                .map(item => roundFields(item, ['total']))
+                .sort((a, b) => b.total - a.total || (a.category_type > b.category_type) - (a.category_type < b.category_type)),
+            daily_totals: [...daily.values()].sort(byDate).map(item => roundFields(item, ['income', 'expense'])),
+            savings_daily_totals: [...savingsDaily.values()].sort(byDate)
+                .map(item => roundFields(item, ['savings_income', 'savings_expense'])),
+            period: {...this.periodRange(), type: this.currentPeriod}
+        };
+    }
+
+    // Изменение транзакции: сразу на сервер, а без связи - в локальную очередь.
+    // Пока очередь не пуста, новые изменения встают за ней: сервер получает их в исходном порядке.
+    // true - изменение отправлено, false - осталось в очереди
+    async submitEdit(edit) {
+        if (!this.offline && this.outbox.length === 0) {
+            try {
+                await this.apiCall(this.editEndpoint(edit), {
+                    method: edit.method,
+                    body: edit.body ? JSON.stringify(edit.body) : undefined
+                });
+                return true;
+            } catch (error) {
+                if (!error.offline) {
+                    throw error;
+                }
+                this.goOffline();
+            }
+        }
+        await this.queueEdit(edit);
+        if (this.offline) {
+            return false;
+        }
+        await this.flushOutbox();
+        return !this.offline;
+    }
+
+    editEndpoint(edit) {
+        return edit.method === 'POST' ? '/transactions' : `/transactions/${edit.transactionId}`;
+    }
+
+    // Транзакция, созданная без связи, еще не отправлена (отрицательный id):
+    // её изменение или удаление меняет саму запись очереди
+    async queueEdit(edit) {
+        const created = this.outbox.find(item => item.method === 'POST' && item.transactionId === edit.transactionId);
+        if (created && edit.method === 'DELETE') {
+            await this.store.removeEdit(created.id);
+            this.outbox = this.outbox.filter(item => item !== created);
+        } else if (created) {
+            created.body = edit.body;
+            await this.store.putEdit(created);
+        } else {
+            const id = await this.store.addEdit(edit);
+            this.outbox.push(id === undefined ? edit : {...edit, id});
+        }
+        this.transactions = this.applyPendingEdits(this.serverTransactions);
+        this.renderTransactions();
+        this.showLocalAnalytics();
+    }
+
+    // Отправить очередь по порядку. Изменение, отклоненное сервером, удаляется из очереди
+    // (сервер уже показал причину), при потере связи отправка останавливается
+    flushOutbox() {
+        if (!this.flushing) {
+            this.flushing = this.sendOutbox().finally(() => {
+                this.flushing = null;
+            });
+        }
+        return this.flushing;
+    }
+
+    async sendOutbox() {
+        let sent = 0;
+        while (this.outbox.length && !this.offline && this.isAuthenticated) {
+            const edit = this.outbox[0];
+            try {
+                await this.apiCall(this.editEndpoint(edit), {
+                    method: edit.method,
+                    body: edit.body ? JSON.stringify(edit.body) : undefined
+                });
+                sent++;
+            } catch (error) {
+                if (error.offline) {
+                    this.goOffline();
+                    break;
+                }
+                if (!this.isAuthenticated) {
+                    break;
+                }
+                console.error('Queued edit rejected:', error);
+            }
+            await this.store.removeEdit(edit.id);
+            this.outbox = this.outbox.filter(item => item !== edit);
+        }
+        if (sent) {
+            this.showSnackbar(`Отправлено изменений, сделанных без связи: ${sent}`);
         }
     }
 
@@ -540,20 +939,18 @@ class FinanceTracker {
             description: document.getElementById('description').value || ''
         };
         try {
-            await this.apiCall('/transactions', {
-                method: 'POST',
-                body: JSON.stringify(formData)
-            });
+            const sent = await this.submitEdit({method: 'POST', transactionId: -Date.now(), body: formData});
             document.getElementById('amount').value = '';
             document.getElementById('description').value = '';
             document.getElementById('categorySelect').selectedIndex = 0;
-            await this.loadTransactions();
-            await this.loadAnalytics();
-            await this.loadSavingsAnalytics();
+            if (sent) {
+                await this.refreshPeriod();
+            }
             if (this.currentView === 'edit') {
                 this.loadTransactionsForEdit();
             }
-            this.showSnackbar('Транзакция успешно добавлена!');
+            this.showSnackbar(sent ? 'Транзакция успешно добавлена!' :
+                'Нет связи с сервером: транзакция сохранена и будет отправлена позже');
         } catch (error) {
             console.error('Failed to add transaction:', error);
         }
@@ -591,7 +988,7 @@ class FinanceTracker {
         }
         this.transactions.forEach(transaction => {
             const div = document.createElement('div');
-            div.className = `transaction-item ${transaction.category_type}`;
+            div.className = `transaction-item ${transaction.category_type}${transaction.pending ? ' pending' : ''}`;
             div.innerHTML = `
                 <div class="transaction-info">
                     <span class="category" style="color: ${transaction.category_color}">
@@ -837,15 +1234,13 @@ class FinanceTracker {
             return;
         }
         try {
-            await this.apiCall(`/transactions/${transactionId}`, {
-                method: 'PUT',
-                body: JSON.stringify(updateData)
-            });
-            await this.loadTransactions();
-            await this.loadAnalytics();
-            await this.loadSavingsAnalytics();
+            const sent = await this.submitEdit({method: 'PUT', transactionId, body: updateData});
+            if (sent) {
+                await this.refreshPeriod();
+            }
             this.loadTransactionsForEdit();
-            this.showSnackbar('Транзакция успешно обновлена!');
+            this.showSnackbar(sent ? 'Транзакция успешно обновлена!' :
+                'Нет связи с сервером: изменение сохранено и будет отправлено позже');
         } catch (error) {
             console.error('Failed to update transaction:', error);
         }
@@ -856,14 +1251,13 @@ class FinanceTracker {
             return;
         }
         try {
-            await this.apiCall(`/transactions/${transactionId}`, {
-                method: 'DELETE'
-            });
-            await this.loadTransactions();
-            await this.loadAnalytics();
-            await this.loadSavingsAnalytics();
+            const sent = await this.submitEdit({method: 'DELETE', transactionId});
+            if (sent) {
+                await this.refreshPeriod();
+            }
             this.loadTransactionsForEdit();
-            this.showSnackbar('Транзакция успешно удалена!');
+            this.showSnackbar(sent ? 'Транзакция успешно удалена!' :
+                'Нет связи с сервером: удаление будет отправлено позже');
         } catch (error) {
             console.error('Failed to delete transaction:', error);
         }
@@ -1299,8 +1693,7 @@ function updateCategories() {
 }
 
 function applyCustomDates() {
-    app.loadTransactions();
-    app.loadAnalytics();
+    app.loadPeriod();
 }
 
 let app;
@@ -1308,6 +1701,15 @@ document.addEventListener('DOMContentLoaded', () => {
     app = new FinanceTracker();
 });
 
+// Оболочка приложения кэшируется service worker'ом (sw.js)
+if ('serviceWorker' in navigator) {
+    window.addEventListener('load', () => {
+        navigator.serviceWorker.register('/sw.js').catch(error => {
+            console.warn('Service worker registration failed:', error);
+        });
+    });
+}
+
 // Тестовая функция
 window.testPasswordSetup = async function () {
     const testData = {
@@ -0,0 +1,99 @@
+// Локальная копия журнала в IndexedDB:
+// - periods: последние ответы /transactions по периодам вместе с ETag;
+// - meta: справочник категорий;
+// - outbox: изменения транзакций, сделанные без связи с сервером (по порядку).
+// Без IndexedDB (приватный режим, старый браузер) методы ничего не хранят,
+// и приложение работает только с сервером.
+class LedgerStore {
+    constructor(name = 'finance-tracker') {
+        this.name = name;
+        this.db = null;
+        // Сколько периодов хранить: самые старые по времени сохранения удаляются
+        this.maxPeriods = 12;
+    }
+
+    async open() {
+        if (this.db || !window.indexedDB) {
+            return;
+        }
+        try {
+            this.db = await new Promise((resolve, reject) => {
+                const request = indexedDB.open(this.name, 1);
+                request.onupgradeneeded = () => {
+                    const db = request.result;
+                    const periods = db.createObjectStore('periods', {keyPath: 'key'});
+                    periods.createIndex('savedAt', 'savedAt');
+                    db.createObjectStore('meta', {keyPath: 'key'});
+                    db.createObjectStore('outbox', {keyPath: 'id', autoIncrement: true});
+                };
+                request.onsuccess = () => resolve(request.result);
+                request.onerror = () => reject(request.error);
+            });
+        } catch (error) {
+            console.warn('IndexedDB unavailable:', error);
+        }
+    }
+
+    // Одна операция над хранилищем в своей транзакции; результат - после её завершения
+    run(storeName, mode, action) {
+        if (!this.db) {
+            return Promise.resolve(undefined);
+        }
+        return new Promise((resolve, reject) => {
+            const transaction = this.db.transaction(storeName, mode);
+            const request = action(transaction.objectStore(storeName));
+            transaction.oncomplete = () => resolve(request ? request.result : undefined);
+            transaction.onerror = () => reject(transaction.error);
+            transaction.onabort = () => reject(transaction.error);
+        });
+    }
+
+    getPeriod(key) {
+        return this.run('periods', 'readonly', store => store.get(key));
+    }
+
+    async putPeriod(key, etag, data) {
+        await this.run('periods', 'readwrite', store => store.put({key, etag, data, savedAt: Date.now()}));
+        await this.run('periods', 'readwrite', store => {
+            let kept = 0;
+            const cursor = store.index('savedAt').openKeyCursor(null, 'prev');
+            cursor.onsuccess = () => {
+                const position = cursor.result;
+                if (!position) return;
+                if (++kept > this.maxPeriods) {
+                    store.delete(position.primaryKey);
+                }
+                position.continue();
+            };
+        });
+    }
+
+    async getMeta(key) {
+        const record = await this.run('meta', 'readonly', store => store.get(key));
+        return record ? record.value : undefined;
+    }
+
+    putMeta(key, value) {
+        return this.run('meta', 'readwrite', store => store.put({key, value}));
+    }
+
+    async getOutbox() {
+        return (await this.run('outbox', 'readonly', store => store.getAll())) || [];
+    }
+
+    // Возвращает id записи в очереди (undefined без IndexedDB)
+    addEdit(edit) {
+        return this.run('outbox', 'readwrite', store => store.add(edit));
+    }
+
+    putEdit(edit) {
+        return this.run('outbox', 'readwrite', store => store.put(edit));
+    }
+
+    removeEdit(id) {
+        if (id === undefined) {
+            return Promise.resolve();
+        }
+        return this.run('outbox', 'readwrite', store => store.delete(id));
+    }
+}
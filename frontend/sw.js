@@ -0,0 +1,68 @@
+// Service worker: кэширует оболочку приложения (HTML, стили, скрипты, Chart.js),
+// чтобы повторное открытие не ждало сети и приложение запускалось без связи.
+// Остальные запросы (в том числе /api) не перехватываются: данные кэширует само
+// приложение (ledger-store.js), а прочие файлы не должны копиться в кэше.
+
+const SHELL_CACHE = 'finance-shell-v2';
+const SHELL_FILES = [
+    '/',
+    '/index.html',
+    '/styles.css',
+    '/app.js',
+    '/ledger-store.js'
+];
+// Внешние файлы: их недоступность не должна мешать установке
+const CDN_FILES = ['https://cdn.jsdelivr.net/npm/chart.js'];
+
+self.addEventListener('install', (event) => {
+    event.waitUntil(
+        caches.open(SHELL_CACHE)
+            .then(cache => cache.addAll(SHELL_FILES).then(() => Promise.all(
+                CDN_FILES.map(file => cache.add(file).catch(() => null))
+            )))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', (event) => {
+    // Удаляем кэши прошлых версий оболочки
+    event.waitUntil(
+        caches.keys()
+            .then(keys => Promise.all(
+                keys.filter(key => key !== SHELL_CACHE).map(key => caches.delete(key))
+            ))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', (event) => {
+    const request = event.request;
+    const url = new URL(request.url);
+    if (request.method !== 'GET') {
+        return;
+    }
+    // Ключ кэша - сам файл оболочки: параметры запроса не плодят копий
+    const key = url.origin === self.location.origin ? url.pathname : request.url;
+    if (!SHELL_FILES.includes(key) && !CDN_FILES.includes(key)) {
+        return;
+    }
+    // Stale-while-revalidate: сразу отдаем копию из кэша, а в фоне обновляем её из сети
+    event.respondWith(
+        caches.open(SHELL_CACHE).then(async cache => {
+            const cached = await cache.match(key);
+            const network = fetch(request)
+                .then(response => {
+                    if (response.ok) {
+                        cache.put(key, response.clone());
+                    }
+                    return response;
+                })
+                .catch(() => cached || Response.error());
+            if (cached) {
+                event.waitUntil(network);
+                return cached;
+            }
+            return network;
+        })
+    );
+});